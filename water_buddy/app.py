@@ -1,7 +1,13 @@
 """
-WaterBuddy - Streamlit app using local JSON file storage instead of Firebase.
-All Firebase REST functions and helpers have been replaced by JSON read/write helpers.
-The application logic remains functionally the same, but data is now stored in 'water_data.json'.
+WaterBuddy - Streamlit app using local storage instead of Firebase.
+All Firebase REST functions and helpers have been replaced by local storage helpers.
+The application logic remains functionally the same, but data is now stored in an
+embedded SQLite database ('water_data.db') by default, with the original
+'water_data.json' file available as a legacy backend (see storage.py).
+
+With WATERBUDDY_METRICS=1, storage, rendering and asset timings are collected
+(metrics.py) and shown on a hidden admin page: '?admin=metrics&token=...'
+(only available when WATERBUDDY_ADMIN_TOKEN is set).
 """
 
 # =======================
@@ -13,21 +19,27 @@ from datetime import date, timedelta
 import random
 import time
 import os
-import matplotlib.pyplot as plt
+import sys
 import uuid # For generating unique user IDs
-
-# Lottie support (optional)
-# FIX: Ensure standard indentation is used.
-try:
-    from streamlit_lottie import st_lottie
-except ImportError:
-    st_lottie = None # graceful fallback if streamlit-lottie not installed
+import functools
+import hmac
+from storage import get_store
+from storage import EVENT_QUICK, EVENT_CUSTOM, EVENT_RESET, UserSnapshot, UnitOfWork, io_counter
+from storage import get_write_behind
+from history import HISTORY_RANGES, ROLLING_WINDOW_DAYS
+from stats import stats_engine
+from fragments import generate_bottle_svg, theme_css
+from assets import get_st_lottie, load_lottie_progress
+from metrics import METRICS_ENV_VAR, registry as metrics, maybe_dump, prometheus_text, snapshot_record
+import shards  # registers the "sharded" storage backend
+import recordfile  # registers the "records" storage backend
 
 # =======================
 # 2. Configuration & Constants
 # =======================
 # --- Local Data Config ---
-DATA_FILE = "water_data.json"
+# Storage lives in storage.py: SQLite ('water_data.db') by default, or the
+# legacy 'water_data.json' file with WATERBUDDY_BACKEND=json.
 # -----------------------------
 DATE_STR = date.today().isoformat()
 
@@ -41,6 +53,9 @@ AGE_GOALS_ML = {
 DEFAULT_QUICK_LOG_ML = 250
 CUPS_TO_ML = 236.588
 
+# Hidden metrics page: ?admin=metrics (and &token=... if this variable is set)
+ADMIN_TOKEN_ENV_VAR = "WATERBUDDY_ADMIN_TOKEN"
+
 TIPS = [
     "Keep a filled water bottle visible on your desk.",
     "Drink a glass (250 ml) after every bathroom break.",
@@ -49,81 +64,24 @@ TIPS = [
     "Set small hourly reminders and sip regularly.",
 ]
 
-# Attempt to load Lottie progress animation (safe loading)
-LOTTIE_PROGRESS = None
-def load_lottie(path: str):
-    """Safely loads a JSON Lottie file."""
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return None
-
-# Load lottie file (adjust path as needed if running locally)
-if st_lottie is not None:
-    # Check common asset locations
-    assets_path = os.path.join(os.path.dirname(__file__), "assets", "progress_bar.json")
-    if os.path.exists(assets_path):
-        LOTTIE_PROGRESS = load_lottie(assets_path)
-    else:
-        # Fallback for simpler Streamlit environments
-        alt = os.path.join(os.getcwd(), "progress.json")
-        if os.path.exists(alt):
-            LOTTIE_PROGRESS = load_lottie(alt)
-
 # =======================
-# 3. Core Utility Functions (Local JSON Data Management)
+# 3. Core Utility Functions (Storage Backend)
 # =======================
+# get_store() returns the configured backend (SQLite unless overridden),
+# counting reads/writes per rerun.
 
-def load_data():
-    """Loads all user data from the local JSON file."""
-    if not os.path.exists(DATA_FILE):
-        # Initialize file with an empty user dictionary
-        initial_data = {"users": {}}
-        try:
-            with open(DATA_FILE, "w") as f:
-                json.dump(initial_data, f, indent=4)
-        except Exception:
-            return initial_data
-        return initial_data
-    try:
-        with open(DATA_FILE, "r") as f:
-            data = json.load(f)
-            # Ensure the top-level structure exists
-            if not isinstance(data, dict) or "users" not in data:
-                 return {"users": {}}
-            return data
-    except (json.JSONDecodeError, FileNotFoundError):
-        # Handle corrupt or missing file
-        return {"users": {}}
-
-def save_data(data):
-    """Saves all user data back to the local JSON file."""
-    try:
-        with open(DATA_FILE, "w") as f:
-            json.dump(data, f, indent=4)
-        return True
-    except Exception:
-        return False
-
-# --- User & Intake helpers (adapted to use local JSON data) ---
+# --- User & Intake helpers (served by the storage backend) ---
 
 def find_user_by_username(username: str):
     """Return (uid, user_obj) if found, else (None, None)."""
-    data = load_data()
-    users = data.get("users", {})
-    for uid, rec in users.items():
-        if isinstance(rec, dict) and rec.get("username") == username:
-            return uid, rec
-    return None, None
+    return get_store().find_user(username)
 
 def create_user(username: str, password: str):
     """Create user - returns uid string on success, None on failure."""
     if not username or not password:
         return None
-    # Ensure uniqueness
-    uid, _ = find_user_by_username(username)
-    if uid:
+    # Ensure uniqueness (case-insensitive, served by the username index)
+    if get_store().find_uid(username):
         return None
     
     new_uid = str(uuid.uuid4()) # Generate unique ID
@@ -138,9 +96,7 @@ def create_user(username: str, password: str):
         "days": {} # Initialize days node
     }
     
-    data = load_data()
-    data["users"][new_uid] = payload
-    if save_data(data):
+    if get_store().create_user(new_uid, payload):
         return new_uid
     return None
 
@@ -155,52 +111,36 @@ def get_today_intake(uid: str):
     """Fetches today's total intake in ml."""
     if not uid:
         return 0
-    data = load_data()
-    user_rec = data.get("users", {}).get(uid, {})
-    
-    # New data structure: days/{DATE_STR}/intake
-    intake = user_rec.get("days", {}).get(DATE_STR, {}).get("intake")
-    
-    if isinstance(intake, (int, float)):
-        return int(intake)
-    
-    return 0
+    return get_store().get_intake(uid, DATE_STR)
 
 def set_today_intake(uid: str, ml_value: int):
     """Updates today's total intake for the user."""
     if not uid:
         return False
     ml = int(max(0, ml_value))
-    
-    data = load_data()
-    if uid not in data["users"]:
+    return get_store().set_intake(uid, DATE_STR, ml)
+
+def add_today_intake(uid: str, ml_value: int, kind: str = EVENT_QUICK):
+    """Logs a drink for today as an event (no read-modify-write of the total)."""
+    if not uid:
         return False
-    
-    user_data = data["users"][uid]
-    if "days" not in user_data:
-        user_data["days"] = {}
-    
-    # Ensure the current date node exists
-    if DATE_STR not in user_data["days"]:
-        user_data["days"][DATE_STR] = {}
-        
-    # Update the intake value
-    user_data["days"][DATE_STR]["intake"] = ml
-    
-    return save_data(data)
+    return get_store().add_intake(uid, DATE_STR, int(max(0, ml_value)), kind)
 
 def reset_today_intake(uid: str):
-    return set_today_intake(uid, 0)
+    """Resets today's total to 0 (recorded as a 'reset' event)."""
+    if not uid:
+        return False
+    return get_store().reset_intake(uid, DATE_STR)
 
 def get_user_profile(uid: str):
-    default_profile = {"age_group": "19-50", "user_goal_ml": AGE_GOALS_ML["19-50"]}
     if not uid:
-        return default_profile
-    
-    data = load_data()
-    user_rec = data.get("users", {}).get(uid, {})
-    profile = user_rec.get("profile")
+        return normalize_profile(None)
+    user_rec = get_store().get_user(uid) or {}
+    return normalize_profile(user_rec.get("profile"))
 
+def normalize_profile(profile):
+    """Returns a profile dict with a valid age group and integer goal."""
+    default_profile = {"age_group": "19-50", "user_goal_ml": AGE_GOALS_ML["19-50"]}
     if isinstance(profile, dict):
         # Safely determine the goal, defaulting if corrupted
         user_goal = profile.get("user_goal_ml")
@@ -219,22 +159,11 @@ def update_user_profile(uid: str, updates: dict):
     """Updates the user's profile settings."""
     if not uid:
         return False
-    
-    data = load_data()
-    if uid not in data["users"]:
-        return False
-    
-    # Initialize profile if it doesn't exist
-    user_profile = data["users"][uid].get("profile", {})
-    user_profile.update(updates)
-    data["users"][uid]["profile"] = user_profile
-    
-    return save_data(data)
+    return get_store().update_profile(uid, updates)
 
 def get_username_by_uid(uid: str):
     """Fetches the username for display."""
-    data = load_data()
-    rec = data.get("users", {}).get(uid)
+    rec = get_store().get_user(uid) if uid else None
     if isinstance(rec, dict):
         return rec.get("username", "user")
     return "user"
@@ -244,139 +173,22 @@ def get_past_intake(uid: str, days_count: int = 7):
     if not uid:
         return {}
     
-    data = load_data()
-    user_rec = data.get("users", {}).get(uid, {})
-    days_data = user_rec.get("days", {})
-    
-    intake_data = {}
     today = date.today()
-    
-    for i in range(days_count):
-        day = (today - timedelta(days=i)).isoformat()
-        # Access data from the local JSON structure: days/{date}/intake
-        intake_value = days_data.get(day, {}).get("intake")
-        
-        try:
-            intake_data[day] = int(intake_value) if intake_value is not None else 0
-        except:
-            intake_data[day] = 0
-    return intake_data
+    start = today - timedelta(days=days_count - 1)
+    return get_store().get_history(uid, start.isoformat(), today.isoformat()).to_dict()
 
 # =======================
-# 4. UI Helpers (SVG, Matplotlib Plotting, Theme CSS)
+# 4. UI Helpers (Theme CSS)
 # =======================
 
-def generate_bottle_svg(percent: float, width:int=140, height:int=360) -> str:
-    """
-    Simple bottle SVG with dynamic fill height.
-    """
-    pct = max(0.0, min(100.0, float(percent)))
-    inner_w = width - 36
-    inner_h = height - 80
-    fill_h = (pct / 100.0) * inner_h
-    empty_h = inner_h - fill_h
-
-    # Coordinates are chosen to keep visual proportions consistent.
-    svg = f"""
-<svg width="{width}" height="{height}" viewBox="0 0 {width} {height}" xmlns="http://www.w3.org/2000/svg">
-    <rect x="12" y="12" rx="20" ry="20" width="{width-24}" height="{height-24}" fill="none" stroke="#5dade2" stroke-width="3"/>
-    <rect x="18" y="18" width="{inner_w}" height="{inner_h}" rx="12" ry="12" fill="#f3fbff"/>
-    <rect x="18" y="{18 + empty_h}" width="{inner_w}" height="{fill_h}" rx="12" ry="12" fill="#67b3df"/>
-    <rect x="{(width/2)-18}" y="0" width="36" height="18" rx="4" ry="4" fill="#3498db"/>
-    <text x="{width/2}" y="{height-8}" font-size="14" text-anchor="middle" fill="#023047" font-family="Arial">{pct:.0f}%</text>
-</svg>
-"""
-    return svg
-
-def plot_water_intake(intake_data, goal):
-    """Generate a Matplotlib line chart showing daily water intake."""
-    
-    # Sort data by date (key) to ensure the chart is in chronological order
-    sorted_days = sorted(intake_data.keys(), reverse=True)
-    # Reverse the list so the chart goes from older dates to today
-    sorted_days.reverse()
-    
-    # Extract values in the sorted order
-    intakes = [intake_data[day] for day in sorted_days]
-    
-    # Format labels to be shorter (e.g., '12-05')
-    labels = [d.split('-')[1] + '-' + d.split('-')[2] for d in sorted_days]
-    
-    # Create the plot
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.plot(labels, intakes, marker='o', color='#3498db', label="Water Intake (ml)", linewidth=2)
-    
-    # Add goal line 
-    ax.axhline(y=goal, color='#2ecc71', linestyle='--', label=f'Goal ({goal} ml)')
-
-    # Customize the plot
-    ax.set_title("Daily Water Intake Over the Last 7 Days", fontsize=16)
-    ax.set_xlabel("Date (MM-DD)", fontsize=12)
-    ax.set_ylabel("Water Intake (ml)", fontsize=12)
-    ax.tick_params(axis='x', rotation=45)
-    ax.grid(True, linestyle=':', alpha=0.7)
-    ax.legend()
-    plt.tight_layout()
-
-    return fig
-
-# Theme CSS
+# Theme CSS (built once per theme in fragments.py)
 def apply_theme(theme_name: str):
-    """Applies custom CSS for themeing the Streamlit UI."""
-    if theme_name == "Light":
-        st.markdown("""
-        <style>
-        .stApp { background-color: #ffffff !important; color: #000000 !important; }
-        h1, h2, h3, h4, h5, h6, p, label, span { color: #000000 !important; }
-        .stButton>button { background-color: #e6e6e6 !important; color: #000000 !important; border-radius: 8px !important; border: 1px solid #cccccc !important; }
-        .stButton>button:hover { background-color: #d9d9d9 !important; }
-        .stTextInput>div>div>input { background-color: #fafafa !important; color: #000000 !important; border-radius: 6px !important; }
-        .stSlider>div>div>div { background-color: #007acc !important; }
-        div[data-testid="metric-container"] { background-color: #f7f7f7 !important; border-radius: 12px !important; padding: 12px !important; border: 1px solid #e1e1e1 !important; }
-        div[data-testid="metric-container"] label { color: #000000 !important; font-weight: 600 !important; }
-        div[data-testid="metric-container"] [data-testid="stMetricValue"] { color: #000000 !important; font-weight: 700 !important; font-size: 1.5rem !important; }
-        div[data-testid="metric-container"] [data-testid="metric-delta"] { color: #006600 !important; font-weight: 600 !important; }
-        div[data-testid="metric-container"] div[data-testid="stMetricValue"] > span,
-        div[data-testid="metric-container"] div[data-testid="stMetricValue"] span { color: inherit !important; }
-        </style>
-        """, unsafe_allow_html=True)
-
-    elif theme_name == "Aqua":
-        st.markdown("""
-        <style>
-        .stApp { background-color: #e8fbff !important; color: #004455 !important; }
-        h1, h2, h3, h4, h5, h6, p, label, span { color: #004455 !important; }
-        .stButton>button { background-color: #c6f3ff !important; color: #004455 !important; border-radius: 8px !important; border: 1px solid #99e6ff !important; }
-        .stButton>button:hover { background-color: #b3edff !important; }
-        .stTextInput>div>div>input { background-color: #ffffff !important; color: #003344 !important; border-radius: 6px !important; }
-        .stSlider>div>div>div { background-color: #00aacc !important; }
-        div[data-testid="metric-container"] { background-color: #d9f7ff !important; border-radius: 12px !important; padding: 12px !important; border: 1px solid #bdefff !important; }
-        div[data-testid="metric-container"] label { color: #005577 !important; font-weight: 600 !important; }
-        div[data-testid="metric-container"] [data-testid="stMetricValue"] { color: #005577 !important; font-weight: 700 !important; font-size: 1.5rem !important; }
-        div[data-testid="metric-container"] [data-testid="metric-delta"] { color: #0077b6 !important; font-weight: 600 !important; }
-        div[data-testid="metric-container"] div[data-testid="stMetricValue"] > span,
-        div[data-testid="metric-container"] div[data-testid="stMetricValue"] span { color: inherit !important; }
-        </style>
-        """, unsafe_allow_html=True)
-
-    else: # Dark Mode
-        st.markdown("""
-        <style>
-        .stApp { background-color: #0f1720 !important; color: #e6eef6 !important; }
-        h1, h2, h3, h4, h5, h6, p, label, span { color: #e6eef6 !important; }
-        .stButton>button { background-color: #1e2933 !important; color: #e6eef6 !important; border-radius: 8px !important; border: 1px solid #324151 !important; }
-        .stButton>button:hover { background-color: #253241 !important; }
-        .stTextInput>div>div>input { background-color: #1e2933 !important; color: #e6eef6 !important; border-radius: 6px !important; }
-        .stSlider>div>div>div { background-color: #3b82f6 !important; }
-        div[data-testid="metric-container"] { background-color: #1a2634 !important; border-radius: 12px !important; padding: 12px !important; border: 1px solid #334155 !important; }
-        div[data-testid="metric-container"] label { color: #e6eef6 !important; font-weight: 600 !important; }
-        div[data-testid="metric-container"] [data-testid="stMetricValue"] { color: #e6eef6 !important; font-weight: 700 !important; font-size: 1.5rem !important; }
-        div[data-testid="metric-container"] [data-testid="metric-delta"] { color: #4caf50 !important; font-weight: 600 !important; }
-        div[data-testid="metric-container"] div[data-testid="stMetricValue"] > span,
-        div[data-testid="metric-container"] div[data-testid="stMetricValue"] span { color: inherit !important; }
-        </style>
-        """, unsafe_allow_html=True)
-
+    """Injects the theme CSS into the page's single theme slot (at most once per theme per rerun)."""
+    global applied_theme
+    if theme_name == applied_theme:
+        return
+    applied_theme = theme_name
+    theme_slot.markdown(theme_css(theme_name), unsafe_allow_html=True)
 
 # =======================
 # 5. Streamlit App Layout Functions
@@ -433,6 +245,315 @@ def signup_ui():
         st.session_state.page = "login"
         st.rerun()
 
+def load_today(uid: str):
+    """One storage read: the user's snapshot plus today's progress figures."""
+    write_behind = get_write_behind()
+    snap = UserSnapshot.load(get_store(), uid, DATE_STR, write_behind=write_behind)
+    profile = normalize_profile(snap.profile)
+    intake = snap.intake(DATE_STR)
+
+    # === Calculate core progress variables ===
+    std_goal = AGE_GOALS_ML.get(profile.get("age_group","19-50"), 2500)
+    user_goal = int(profile.get("user_goal_ml", std_goal))
+    progress = {
+        "intake": intake,
+        "std_goal": std_goal,
+        "user_goal": user_goal,
+        "remaining": max(user_goal - intake, 0),
+        "percent": min((intake / user_goal) * 100 if user_goal > 0 else 0, 100),
+    }
+    return snap, profile, progress
+
+def commit_log(uid: str, action: str):
+    """Button callback for the log actions: one commit, result shown by the panel.
+
+    Callbacks run before the fragment re-executes, so the panel renders the
+    new total in the same (partial) rerun without an extra st.rerun().
+    """
+    work = UnitOfWork(get_store(), uid, write_behind=get_write_behind())
+    if action == EVENT_QUICK:
+        work.add_intake(DATE_STR, DEFAULT_QUICK_LOG_ML, EVENT_QUICK)
+        done, failed = ("success", f"Added {DEFAULT_QUICK_LOG_ML} ml."), "Failed to update."
+    elif action == EVENT_CUSTOM:
+        custom = int(st.session_state.get("custom_input") or 0)
+        if custom <= 0:
+            st.session_state.log_message = ("warning", "Enter amount > 0")
+            return
+        work.add_intake(DATE_STR, custom, EVENT_CUSTOM)
+        done, failed = ("success", f"Added {custom} ml."), "Failed to update."
+    else:
+        work.reset_intake(DATE_STR)
+        done, failed = ("info", "Reset successful."), "Failed to reset."
+    st.session_state.log_message = done if work.commit() else ("error", failed)
+
+def show_log_message():
+    """Show (once) the result of the last log action."""
+    message = st.session_state.pop("log_message", None)
+    if message:
+        kind, text = message
+        getattr(st, kind)(text)
+
+def timed_fragment(name: str):
+    """st.fragment that records its last run (ms, storage reads/writes) in
+    st.session_state.fragment_stats, so partial reruns can be measured."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            t0 = time.perf_counter()
+            io_before = io_counter.as_dict()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                io_after = io_counter.as_dict()
+                elapsed = time.perf_counter() - t0
+                if metrics.enabled:
+                    metrics.observe("fragment." + name, elapsed)
+                st.session_state.setdefault("fragment_stats", {})[name] = {
+                    "ms": round(elapsed * 1000, 2),
+                    "reads": io_after["reads"] - io_before["reads"],
+                    "writes": io_after["writes"] - io_before["writes"],
+                }
+        return st.fragment(run)
+    return decorate
+
+@timed_fragment("home")
+def home_panel(uid: str):
+    """Today's summary. A quick log here only reruns this panel."""
+    snap, profile, p = load_today(uid)
+    intake, percent = p["intake"], p["percent"]
+
+    st.header("Today's Summary")
+    st.write(f"User: **{snap.username}**")
+    st.write(f"Date: {DATE_STR}")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Standard target")
+        st.write(f"**{p['std_goal']} ml**")
+    with col2:
+        st.subheader("Your target")
+        st.write(f"**{p['user_goal']} ml**")
+
+    mc1, mc2 = st.columns([3,1])
+    with mc1:
+        st.metric("Total intake (ml)", f"{intake} ml", delta=f"{p['remaining']} ml to goal" if p["remaining"] > 0 else "Goal reached!")
+    with mc2:
+        st.button(f"+{DEFAULT_QUICK_LOG_ML} ml", key="home_quick_log", on_click=commit_log, args=(uid, EVENT_QUICK))
+    show_log_message()
+    st.progress(percent / 100)
+
+    # Streaks & goal stats (kept up to date incrementally by stats_engine;
+    # a second storage read only when its copy is older than STATS_TTL_S)
+    streaks = stats_engine.summary(get_store(), uid, p["user_goal"], DATE_STR, today_intake=intake)
+    s1, s2, s3, s4 = st.columns(4)
+    s1.metric("🔥 Current streak", f"{streaks['current_streak']} days")
+    s2.metric("🏆 Longest streak", f"{streaks['longest_streak']} days")
+    s3.metric("Goal hit (last 7 days)", f"{streaks['weekly_hit_rate']:.0%}")
+    s4.metric("30-day average", f"{streaks['moving_average']} ml")
+
+    # Display the water bottle SVG 
+    # 
+    svg = generate_bottle_svg(percent, theme=st.session_state.theme)
+    st.components.v1.html(svg, height=360, scrolling=False)
+
+    # Lottie progress bar (optional; streamlit-lottie is imported on first use)
+    st_lottie = get_st_lottie()
+    lottie_progress = load_lottie_progress() if st_lottie is not None else None
+    if lottie_progress is not None:
+        try:
+            total_frames = 150
+            end_frame = int(total_frames * (percent / 100.0))
+            if end_frame < 1:
+                end_frame = 1
+            st_lottie(lottie_progress, loop=False, start_frame=0, end_frame=end_frame, height=120)
+        except Exception:
+            pass
+    else:
+        st.write(f"Progress: {percent:.0f}%")
+
+    # milestone messages
+    if percent >= 100:
+        st.success("🎉 Amazing — you reached your daily goal!")
+    elif percent >= 75:
+        st.info("Great — 75% reached!")
+    elif percent >= 50:
+        st.info("Nice — 50% reached!")
+    elif percent >= 25:
+        st.info("Good start — 25% reached!")
+
+@timed_fragment("log_water")
+def log_water_panel(uid: str):
+    """Log buttons with today's total and progress; logging only reruns this panel."""
+    _, _, p = load_today(uid)
+
+    st.header("Log Water Intake")
+    st.metric("Today's intake", f"{p['intake']} ml", delta=f"{p['remaining']} ml to goal" if p["remaining"] > 0 else "Goal reached!")
+    st.progress(p["percent"] / 100)
+
+    c1, c2, c3 = st.columns([1,1,1])
+    with c1:
+        st.button(f"+{DEFAULT_QUICK_LOG_ML} ml", key="quick_log", on_click=commit_log, args=(uid, EVENT_QUICK))
+
+    with c2:
+        st.number_input("Custom amount (ml)", min_value=0, step=50, key="custom_input")
+        st.button("Add custom", key="add_custom", on_click=commit_log, args=(uid, EVENT_CUSTOM))
+
+    with c3:
+        st.button("Reset today", key="reset_today", on_click=commit_log, args=(uid, EVENT_RESET))
+
+    show_log_message()
+
+    st.markdown("---")
+    st.subheader("Unit converter")
+    cc1, cc2 = st.columns(2)
+    with cc1:
+        cups = st.number_input("Cups", min_value=0.0, step=0.5, key="conv_cups")
+        if st.button("Convert cups → ml", key="conv_to_ml"):
+            ml_conv = round(cups * CUPS_TO_ML, 1)
+            st.success(f"{cups} cups = {ml_conv} ml")
+    with cc2:
+        ml_in = st.number_input("Milliliters", min_value=0.0, step=50.0, key="conv_ml")
+        if st.button("Convert ml → cups", key="conv_to_cups"):
+            cups_conv = round(ml_in / CUPS_TO_ML, 2)
+            st.success(f"{ml_in} ml = {cups_conv} cups")
+
+@timed_fragment("history")
+def history_panel(uid: str):
+    """Totals, range statistics and the chart; changing the range only reruns this panel."""
+    snap, _, p = load_today(uid)
+    user_goal = p["user_goal"]
+
+    st.header("Water Intake History")
+
+    # Weekly / monthly totals are maintained by the event log
+    hc1, hc2 = st.columns(2)
+    with hc1:
+        st.metric("This week (ml)", f"{snap.period_total('week')} ml")
+    with hc2:
+        st.metric("This month (ml)", f"{snap.period_total('month')} ml")
+    st.markdown("---")
+
+    # Range selection: presets or a custom start/end
+    today = date.fromisoformat(DATE_STR)
+    range_label = st.radio("Range", list(HISTORY_RANGES) + ["Custom"], horizontal=True, key="history_range")
+    if range_label == "Custom":
+        picked = st.date_input("From / to", value=(today - timedelta(days=29), today), max_value=today, key="history_custom")
+        if isinstance(picked, (tuple, list)) and len(picked) == 2:
+            start, end = picked
+        else:
+            start, end = today - timedelta(days=29), today
+    else:
+        start, end = today - timedelta(days=HISTORY_RANGES[range_label] - 1), today
+
+    # 1. Fetch data (the view's second storage read; the extra days in front
+    # feed the rolling average)
+    history = get_store().get_history(uid, (start - timedelta(days=ROLLING_WINDOW_DAYS - 1)).isoformat(), end.isoformat())
+    history.set(DATE_STR, p["intake"])  # includes not-yet-saved writes
+    rolling = history.rolling_mean(ROLLING_WINDOW_DAYS)[ROLLING_WINDOW_DAYS - 1:]
+    shown = history.range(start, end)
+    stats = shown.summary(user_goal)
+
+    sc1, sc2, sc3, sc4 = st.columns(4)
+    sc1.metric("Daily average", f"{stats['mean']} ml")
+    sc2.metric("Goal reached", f"{stats['goal_hit_rate']:.0%} of days")
+    sc3.metric("Median day", f"{stats['percentiles'][50]} ml")
+    sc4.metric("90th percentile", f"{stats['percentiles'][90]} ml")
+
+    st.subheader(f"Intake Graph ({start:%d %b %Y} – {end:%d %b %Y})")
+    
+    # 2. Generate and display the plot 
+    #  # REMOVED SYNTAX ERROR
+    try:
+        # Pass the goal to the plotting function for reference line
+        from charts import intake_chart  # Matplotlib is only loaded for this view
+        # Rendered once per (data, goal, theme, range), then served from the chart cache
+        chart_png = intake_chart(shown, user_goal, rolling=rolling, theme=st.session_state.theme)
+        st.image(chart_png)
+    except Exception as e:
+        st.error(f"Could not generate graph. Ensure you have Matplotlib installed (`pip install matplotlib`) and some data logged.")
+
+def settings_panel(uid: str):
+    """Profile settings; saving a new goal changes every view, so it reruns the app."""
+    _, profile, _ = load_today(uid)
+    work = UnitOfWork(get_store(), uid, write_behind=get_write_behind())
+
+    st.header("Settings & Profile")
+    # safe index for selectbox
+    age_keys = list(AGE_GOALS_ML.keys())
+    try:
+        idx = age_keys.index(profile.get("age_group", "19-50"))
+    except Exception:
+        idx = 2 # default to "19-50"
+    age_choice = st.selectbox("Select age group", age_keys, index=idx)
+    suggested = AGE_GOALS_ML[age_choice]
+    st.write(f"Suggested intake for this group: {suggested} ml")
+    user_goal_val = st.number_input("Daily goal (ml)", min_value=500, max_value=10000, value=int(profile.get("user_goal_ml", suggested)), step=50)
+    if st.button("Save profile", key="save_profile"):
+        work.update_profile({"age_group": age_choice, "user_goal_ml": int(user_goal_val)})
+        ok = work.commit()
+        if ok:
+            st.success("Profile saved. Goal updated.")
+            st.rerun()
+        else:
+            st.error("Failed to save profile.")
+
+def is_admin_request() -> bool:
+    """True if the URL asks for the hidden metrics page with the right token.
+
+    Without WATERBUDDY_ADMIN_TOKEN the page is not available at all.
+    """
+    if st.query_params.get("admin") != "metrics":
+        return False
+    token = os.environ.get(ADMIN_TOKEN_ENV_VAR)
+    if not token:
+        return False
+    return hmac.compare_digest(st.query_params.get("token", ""), token)
+
+def metrics_admin_ui():
+    """Hidden page with the process-wide metrics (not linked from the app)."""
+    st.header("Metrics")
+    state = "on" if metrics.enabled else f"off (start the app with {METRICS_ENV_VAR}=1 or turn it on here)"
+    st.caption(f"Collection is {state}. Numbers cover every session of this server process.")
+
+    c1, c2, c3, c4 = st.columns(4)
+    if c1.button("Turn off" if metrics.enabled else "Turn on", key="metrics_toggle"):
+        metrics.enabled = not metrics.enabled
+        st.rerun()
+    if c2.button("Reset", key="metrics_reset"):
+        metrics.reset()
+        st.rerun()
+    snapshot = metrics.snapshot()
+    c3.download_button("Prometheus text", prometheus_text(snapshot),
+                       file_name="waterbuddy_metrics.prom", mime="text/plain")
+    c4.download_button("JSON lines", json.dumps(snapshot_record()) + "\n",
+                       file_name="waterbuddy_metrics.jsonl", mime="application/jsonl")
+
+    if not snapshot:
+        st.info("Nothing recorded yet.")
+    else:
+        # Most total time first: that is where a rerun spends it
+        rows = [
+            {
+                "operation": name,
+                "calls": op["count"],
+                "errors": op["errors"],
+                "avg ms": op["avg_ms"],
+                "p95 ms (≤)": op["p95_ms"],
+                "max ms": op["max_ms"],
+                "total s": op["seconds"],
+                "KB read": round(op["bytes_read"] / 1024, 1),
+                "KB written": round(op["bytes_written"] / 1024, 1),
+            }
+            for name, op in sorted(snapshot.items(), key=lambda item: -item[1]["seconds"])
+        ]
+        st.dataframe(rows, hide_index=True)
+
+    # Cache stats (the chart module is only loaded once History has been shown)
+    charts = sys.modules.get("charts")
+    if charts is not None:
+        st.subheader("Chart cache")
+        st.json(charts.chart_cache.stats())
+
 def dashboard_ui():
     uid = st.session_state.uid
     if not uid:
@@ -444,20 +565,31 @@ def dashboard_ui():
         st.rerun()
         return
 
-    profile = get_user_profile(uid)
-    intake = get_today_intake(uid)
-    
-    # === Calculate core progress variables ===
-    std_goal = AGE_GOALS_ML.get(profile.get("age_group","19-50"), 2500)
-    user_goal = int(profile.get("user_goal_ml", std_goal))
-    remaining = max(user_goal - intake, 0)
-    percent = min((intake / user_goal) * 100 if user_goal > 0 else 0, 100)
-    # =========================================
+    # Each view below is a fragment that reads its own snapshot (one storage
+    # read; History adds its range and Home the streak history when the stats
+    # engine's copy expired) and reruns on its own when its widgets change.
+    # Full reruns are left to navigation, theme, settings and login/logout.
+    # With WATERBUDDY_WRITE_BEHIND=1 commits are queued to a background writer.
+    write_behind = get_write_behind()
 
     left_col, right_col = st.columns([1,3])
 
     with left_col:
         st.subheader("Navigate")
+
+        # Durable / pending / failed indicator for write-behind mode
+        if write_behind is not None:
+            failed = write_behind.failed_count(uid)
+            pending = write_behind.pending_count(uid)
+            if failed:
+                st.error(f"⚠️ {failed} change(s) could not be saved.")
+                if st.button("Retry saving", key="retry_failed_writes"):
+                    write_behind.retry_failed(uid)
+                    st.rerun()
+            if pending:
+                st.caption(f"⏳ Saving… ({pending} change(s) pending)")
+            elif not failed:
+                st.caption("✅ All changes saved")
         
         # Theme selector 
         theme_options = ["Light","Aqua","Dark"]
@@ -497,145 +629,17 @@ def dashboard_ui():
         if st.button("New tip", key="new_tip"):
             st.session_state.tip = random.choice(TIPS)
 
-    # ensure theme for right pane
-    apply_theme(st.session_state.theme)
-
     with right_col:
         nav = st.session_state.nav
 
         if nav == "Home":
-            st.header("Today's Summary")
-            st.write(f"User: **{get_username_by_uid(uid)}**")
-            st.write(f"Date: {DATE_STR}")
-
-            col1, col2 = st.columns(2)
-            with col1:
-                st.subheader("Standard target")
-                st.write(f"**{std_goal} ml**")
-            with col2:
-                st.subheader("Your target")
-                st.write(f"**{user_goal} ml**")
-
-            st.metric("Total intake (ml)", f"{intake} ml", delta=f"{remaining} ml to goal" if remaining > 0 else "Goal reached!")
-            st.progress(percent / 100)
-
-            # Display the water bottle SVG 
-            # 
-            svg = generate_bottle_svg(percent)
-            st.components.v1.html(svg, height=360, scrolling=False)
-
-            # Lottie progress bar (optional)
-            if st_lottie is not None and LOTTIE_PROGRESS is not None:
-                try:
-                    total_frames = 150
-                    end_frame = int(total_frames * (percent / 100.0))
-                    if end_frame < 1:
-                        end_frame = 1
-                    st_lottie(LOTTIE_PROGRESS, loop=False, start_frame=0, end_frame=end_frame, height=120)
-                except Exception:
-                    pass
-            else:
-                st.write(f"Progress: {percent:.0f}%")
-
-            # milestone messages
-            if percent >= 100:
-                st.success("🎉 Amazing — you reached your daily goal!")
-            elif percent >= 75:
-                st.info("Great — 75% reached!")
-            elif percent >= 50:
-                st.info("Nice — 50% reached!")
-            elif percent >= 25:
-                st.info("Good start — 25% reached!")
-
+            home_panel(uid)
         elif nav == "Log Water":
-            st.header("Log Water Intake")
-            st.write(f"Today's intake: **{intake} ml**")
-
-            c1, c2, c3 = st.columns([1,1,1])
-            with c1:
-                if st.button(f"+{DEFAULT_QUICK_LOG_ML} ml", key="quick_log"):
-                    new_val = intake + DEFAULT_QUICK_LOG_ML
-                    ok = set_today_intake(uid, new_val)
-                    if ok:
-                        st.success(f"Added {DEFAULT_QUICK_LOG_ML} ml.")
-                        st.rerun()
-                    else:
-                        st.error("Failed to update.")
-
-            with c2:
-                custom = st.number_input("Custom amount (ml)", min_value=0, step=50, key="custom_input")
-                if st.button("Add custom", key="add_custom"):
-                    if custom <= 0:
-                        st.warning("Enter amount > 0")
-                    else:
-                        new_val = intake + int(custom)
-                        ok = set_today_intake(uid, new_val)
-                        if ok:
-                            st.success(f"Added {int(custom)} ml.")
-                            st.rerun()
-                        else:
-                            st.error("Failed to update.")
-
-            with c3:
-                if st.button("Reset today", key="reset_today"):
-                    ok = reset_today_intake(uid)
-                    if ok:
-                        st.info("Reset successful.")
-                        st.rerun()
-                    else:
-                        st.error("Failed to reset.")
-
-            st.markdown("---")
-            st.subheader("Unit converter")
-            cc1, cc2 = st.columns(2)
-            with cc1:
-                cups = st.number_input("Cups", min_value=0.0, step=0.5, key="conv_cups")
-                if st.button("Convert cups → ml", key="conv_to_ml"):
-                    ml_conv = round(cups * CUPS_TO_ML, 1)
-                    st.success(f"{cups} cups = {ml_conv} ml")
-            with cc2:
-                ml_in = st.number_input("Milliliters", min_value=0.0, step=50.0, key="conv_ml")
-                if st.button("Convert ml → cups", key="conv_to_cups"):
-                    cups_conv = round(ml_in / CUPS_TO_ML, 2)
-                    st.success(f"{ml_in} ml = {cups_conv} cups")
-            
+            log_water_panel(uid)
         elif nav == "History":
-            st.header("Water Intake History")
-            st.markdown("---")
-            st.subheader("Last 7 Days Intake Graph")
-            
-            # 1. Fetch data 
-            past_intake_data = get_past_intake(uid, days_count=7)
-            
-            # 2. Generate and display the plot 
-            #  # REMOVED SYNTAX ERROR
-            try:
-                # Pass the goal to the plotting function for reference line
-                intake_plot_fig = plot_water_intake(past_intake_data, user_goal) 
-                st.pyplot(intake_plot_fig) 
-            except Exception as e:
-                st.error(f"Could not generate graph. Ensure you have Matplotlib installed (`pip install matplotlib`) and some data logged.")
-
-
+            history_panel(uid)
         elif nav == "Settings":
-            st.header("Settings & Profile")
-            # safe index for selectbox
-            age_keys = list(AGE_GOALS_ML.keys())
-            try:
-                idx = age_keys.index(profile.get("age_group", "19-50"))
-            except Exception:
-                idx = 2 # default to "19-50"
-            age_choice = st.selectbox("Select age group", age_keys, index=idx)
-            suggested = AGE_GOALS_ML[age_choice]
-            st.write(f"Suggested intake for this group: {suggested} ml")
-            user_goal_val = st.number_input("Daily goal (ml)", min_value=500, max_value=10000, value=int(profile.get("user_goal_ml", suggested)), step=50)
-            if st.button("Save profile", key="save_profile"):
-                ok = update_user_profile(uid, {"age_group": age_choice, "user_goal_ml": int(user_goal_val)})
-                if ok:
-                    st.success("Profile saved. Goal updated.")
-                    st.rerun()
-                else:
-                    st.error("Failed to save profile.")
+            settings_panel(uid)
 
 
 # =======================
@@ -643,10 +647,17 @@ def dashboard_ui():
 # =======================
 st.set_page_config(page_title="WaterBuddy", layout="wide")
 
+# Count storage reads/writes for this rerun (see st.session_state.io_stats)
+io_counter.reset()
+rerun_started = time.perf_counter()
+
 # ensure theme applied early using session_state default (set below)
 if "theme" not in st.session_state:
     st.session_state.theme = "Light"
-# immediately apply so initial render looks correct
+# immediately apply so initial render looks correct; later calls in the same
+# rerun (theme switch) replace the slot's CSS instead of adding another block
+theme_slot = st.empty()
+applied_theme = None
 apply_theme(st.session_state.theme)
 
 st.title("WaterBuddy — Hydration Tracker")
@@ -664,10 +675,17 @@ if "tip" not in st.session_state:
     st.session_state.tip = random.choice(TIPS)
 
 # App routing
-if not st.session_state.logged_in:
+if is_admin_request():
+    metrics_admin_ui()
+elif not st.session_state.logged_in:
     if st.session_state.page == "signup":
         signup_ui()
     else:
         login_ui()
 else:
     dashboard_ui()
+
+st.session_state.io_stats = io_counter.as_dict()
+if metrics.enabled:
+    metrics.observe("app.rerun", time.perf_counter() - rerun_started)
+    maybe_dump()
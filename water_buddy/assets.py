@@ -0,0 +1,248 @@
+"""
+WaterBuddy - Lazily loaded optional components and cached assets.
+
+Streamlit re-executes app.py on every rerun, so nothing here runs at import
+time: optional packages are imported the first time a view asks for them,
+and asset files are parsed once per process and reused until the file on
+disk changes (keyed by path, mtime and size).
+
+Asset pipeline:
+- Lottie JSON is minified (compact separators, floats rounded to
+  LOTTIE_PRECISION decimals) before it is handed to the player.
+- Images are recompressed to WebP at a few widths (IMAGE_WIDTHS).
+  image_variant() returns the smallest variant that is still sharp on a
+  high-DPI screen at a given display width. No view shows the mascot
+  artwork yet; `build` precomputes its variants.
+- Derived files live in '.asset_cache/', named after the source's mtime and
+  size, so they are built once and rebuilt only when the source changes.
+- The file type is sniffed from the content, not the extension.
+
+Usage:
+    python assets.py build    # precompute all variants and print sizes
+"""
+
+# =======================
+# 1. Imports
+# =======================
+import functools
+import hashlib
+import io
+import json
+import os
+
+from metrics import instrument
+from writer import atomic_write_file
+
+# =======================
+# 2. Configuration & Constants
+# =======================
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSET_DIR = os.path.join(APP_DIR, "assets")
+# Mascot artwork (the folder name is historical)
+MASCOT_DIR = os.path.join(APP_DIR, "assest")
+ASSET_CACHE_DIR = os.path.join(APP_DIR, ".asset_cache")
+
+# Mascot artwork, by progress level
+MASCOT_ASSETS = {
+    "low": os.path.join(MASCOT_DIR, "mascot_low.json"),
+    "mid": os.path.join(MASCOT_DIR, "mascot_mid.png.jpg"),
+}
+
+# Decimals kept in Lottie numbers (sub-pixel precision is invisible)
+LOTTIE_PRECISION = 3
+# Image variant widths (px) and encoder settings
+IMAGE_WIDTHS = (160, 320, 640)
+WEBP_QUALITY = 80
+# Device pixel ratio assumed when picking a variant for a display width
+DEVICE_PIXEL_RATIO = 2
+
+# Progress animation: the bundled asset first, then a 'progress.json' next
+# to where Streamlit was started (simpler hosting setups)
+LOTTIE_PROGRESS_CANDIDATES = (
+    os.path.join(ASSET_DIR, "progress_bar.json"),
+    "progress.json",
+)
+
+# =======================
+# 3. Optional components
+# =======================
+
+@functools.lru_cache(maxsize=None)
+def get_st_lottie():
+    """streamlit_lottie.st_lottie, or None if streamlit-lottie is not installed."""
+    try:
+        from streamlit_lottie import st_lottie
+    except ImportError:
+        return None
+    return st_lottie
+
+# =======================
+# 4. Cached asset loader
+# =======================
+
+def find_asset(candidates):
+    """First existing path among `candidates`, or None."""
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+    return None
+
+@instrument("asset.lottie_progress")
+def load_lottie_progress():
+    """The progress bar Lottie animation (minified), or None if no asset is available."""
+    path = find_asset(LOTTIE_PROGRESS_CANDIDATES)
+    return load_lottie(path) if path else None
+
+# =======================
+# 5. Asset pipeline
+# =======================
+
+def _source_key(path: str):
+    """(abs path, mtime_ns, size) of a source file; raises OSError if missing."""
+    st = os.stat(path)
+    return os.path.abspath(path), st.st_mtime_ns, st.st_size
+
+def _cache_path(source_key, suffix: str) -> str:
+    """Variant file in ASSET_CACHE_DIR, named after the exact source version."""
+    path, mtime_ns, size = source_key
+    stem = os.path.basename(path).split(".")[0]
+    digest = hashlib.blake2b(f"{path}|{mtime_ns}|{size}".encode(), digest_size=6).hexdigest()
+    return os.path.join(ASSET_CACHE_DIR, f"{stem}-{digest}{suffix}")
+
+def _build_cached(target: str, build) -> str:
+    """Return `target`, writing build() -> bytes to it first if it does not exist."""
+    if not os.path.exists(target):
+        data = build()
+        os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+        atomic_write_file(target, lambda f: f.write(data))
+    return target
+
+def sniff_kind(path: str) -> str:
+    """'lottie', 'image' or 'unknown', from the first bytes of the file."""
+    with open(path, "rb") as f:
+        head = f.read(16)
+    if head.lstrip()[:1] == b"{":
+        return "lottie"
+    if head[:3] == b"\xff\xd8\xff" or head[:8] == b"\x89PNG\r\n\x1a\n" or \
+            (head[:4] == b"RIFF" and head[8:12] == b"WEBP") or head[:4] == b"GIF8":
+        return "image"
+    return "unknown"
+
+def _round_floats(value, digits: int):
+    if isinstance(value, float):
+        value = round(value, digits)
+        return int(value) if value.is_integer() else value
+    if isinstance(value, list):
+        return [_round_floats(v, digits) for v in value]
+    if isinstance(value, dict):
+        return {k: _round_floats(v, digits) for k, v in value.items()}
+    return value
+
+def minify_lottie(doc: dict, digits: int = LOTTIE_PRECISION) -> bytes:
+    """Compact JSON with numbers rounded to `digits` decimals."""
+    return json.dumps(_round_floats(doc, digits), separators=(",", ":"),
+                      ensure_ascii=False).encode("utf-8")
+
+@functools.lru_cache(maxsize=32)
+def _load_lottie(source_key):
+    def build():
+        with open(source_key[0], "r", encoding="utf-8") as f:
+            return minify_lottie(json.load(f))
+    target = _build_cached(_cache_path(source_key, ".min.json"), build)
+    with open(target, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def load_lottie(path: str):
+    """Minified Lottie animation, cached on disk and per process; None if unusable.
+
+    The returned object is shared between reruns and must not be modified.
+    """
+    try:
+        return _load_lottie(_source_key(path))
+    except (OSError, ValueError):
+        return None
+
+@instrument("asset.encode_webp", written=len)
+def _encode_webp(source: str, width: int) -> bytes:
+    from PIL import Image  # Pillow ships with Matplotlib
+
+    with Image.open(source) as im:
+        im = im.convert("RGBA" if im.mode in ("RGBA", "LA", "P") else "RGB")
+        if im.width > width:
+            im = im.resize((width, round(im.height * width / im.width)), Image.LANCZOS)
+        buf = io.BytesIO()
+        im.save(buf, format="WEBP", quality=WEBP_QUALITY, method=6)
+        return buf.getvalue()
+
+@functools.lru_cache(maxsize=64)
+def _image_variant(source_key, width: int) -> bytes:
+    target = _cache_path(source_key, f"-{width}w.webp")
+    try:
+        _build_cached(target, lambda: _encode_webp(source_key[0], width))
+    except (ImportError, OSError, ValueError):
+        # No Pillow / WebP support: serve the original file
+        target = source_key[0]
+    with open(target, "rb") as f:
+        return f.read()
+
+def pick_width(display_width: int, widths=IMAGE_WIDTHS, dpr: int = DEVICE_PIXEL_RATIO) -> int:
+    """Smallest variant width that covers `display_width` CSS px at `dpr`."""
+    needed = display_width * dpr
+    return next((w for w in sorted(widths) if w >= needed), max(widths))
+
+def image_variant(path: str, display_width: int):
+    """Image bytes sized for `display_width` CSS px, or None if the file is missing."""
+    try:
+        return _image_variant(_source_key(path), pick_width(display_width))
+    except OSError:
+        return None
+
+def build_all() -> list:
+    """Precompute every variant; returns (source, kind, source bytes, served bytes, variant)."""
+    rows = []
+    sources = [p for p in MASCOT_ASSETS.values() if os.path.exists(p)]
+    progress = find_asset(LOTTIE_PROGRESS_CANDIDATES)
+    if progress:
+        sources.append(progress)
+    for path in sources:
+        size = os.path.getsize(path)
+        kind = sniff_kind(path)
+        if kind == "lottie":
+            doc = load_lottie(path)
+            rows.append((path, kind, size, len(minify_lottie(doc)) if doc else size, "min.json"))
+        elif kind == "image":
+            for width in IMAGE_WIDTHS:
+                data = _image_variant(_source_key(path), width)
+                rows.append((path, kind, size, len(data), f"{width}w.webp"))
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Build the WaterBuddy asset variants.")
+    parser.add_argument("command", choices=["build"])
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    rows = build_all()
+    print(f"Built {len(rows)} variant(s) in {time.perf_counter() - t0:.2f} s ({ASSET_CACHE_DIR})")
+    for path, kind, size, served, variant in rows:
+        print(f"{os.path.relpath(path, APP_DIR):<28} {kind:<7} {variant:<10} "
+              f"{size / 1024:>8.1f} KB -> {served / 1024:>7.1f} KB ({served / size:.1%})")
+
+    # What a Home rerun pays for the progress animation: before (parse the
+    # source) vs now (memoized minified document)
+    path = find_asset(LOTTIE_PROGRESS_CANDIDATES)
+    if path:
+        t0 = time.perf_counter()
+        with open(path, "r", encoding="utf-8") as f:
+            json.load(f)
+        raw_ms = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        for _ in range(1000):
+            load_lottie_progress()
+        cached_us = (time.perf_counter() - t0) * 1000
+        print(f"progress animation: parse source {raw_ms:.2f} ms, cached "
+              f"{cached_us:.1f} us per rerun")
@@ -0,0 +1,195 @@
+"""
+WaterBuddy - Meteostat cache format benchmark.
+
+Compares the cache formats of the vendored meteostat package (pickle,
+Feather, Parquet) on an hourly station spanning decades. The data is
+synthetic but shaped like Meteostat's: one file per station-year with
+nullable float values and a string source flag per value column.
+
+For each format four reads are measured, each in a fresh process:
+
+- all       every column (values and flags), whole period
+- values    value columns only (no flags), whole period
+- one_year  value columns only, a single year out of the range
+- one_month value columns only, one month (Parquet skips the other
+            row groups by their statistics)
+
+and reported as load time, peak RSS growth and size on disk.
+
+Usage:
+    python cachebench.py [--years 30] [--formats pickle feather parquet] [--out bench.json]
+"""
+
+# =======================
+# 1. Imports
+# =======================
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# =======================
+# 2. Configuration & Constants
+# =======================
+DEFAULT_YEARS = 30
+DEFAULT_FORMATS = ("pickle", "feather", "parquet")
+FIRST_YEAR = 1990
+STATION = "10637"
+SUBDIR = "hourly"
+
+# Hourly value columns as cached by meteostat.Hourly (each has a "_flag" column)
+VALUE_COLUMNS = ("temp", "dwpt", "rhum", "prcp", "snow", "wdir", "wspd", "wpgt", "pres", "tsun", "coco")
+# Share of values that are missing
+MISSING_SHARE = 0.1
+
+SCENARIOS = ("all", "values", "one_year", "one_month")
+
+# =======================
+# 3. Synthetic station data
+# =======================
+
+def _station_year(year: int):
+    """One year of hourly data, indexed like meteostat's cached files."""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(year)
+    index = pd.MultiIndex.from_product(
+        [[STATION], pd.date_range(f"{year}-01-01", f"{year}-12-31 23:00", freq="h")],
+        names=["station", "time"],
+    )
+    df = pd.DataFrame(index=index)
+    for col in VALUE_COLUMNS:
+        values = rng.normal(10, 8, len(index)).round(1)
+        values[rng.random(len(index)) < MISSING_SHARE] = np.nan
+        df[col] = pd.array(values, dtype="Float64")
+        df[col + "_flag"] = pd.array(np.where(rng.random(len(index)) < 0.2, "E", "D"), dtype="string")
+    return df
+
+def _cache_path(cache_dir: str, year: int, fmt: str) -> str:
+    from meteostat.core.cache import get_local_file_path
+    from meteostat.enumerations.granularity import Granularity
+    from meteostat.utilities.endpoint import generate_endpoint_path
+
+    return get_local_file_path(cache_dir, SUBDIR, generate_endpoint_path(Granularity.HOURLY, STATION, year), fmt)
+
+# =======================
+# 4. Build / measure (each runs in its own subprocess)
+# =======================
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _build(args) -> dict:
+    fmt, years, cache_dir = args
+    from meteostat.core.cache import save_to_cache
+
+    os.makedirs(os.path.join(cache_dir, SUBDIR), exist_ok=True)
+    t0 = time.perf_counter()
+    size = 0
+    for year in range(FIRST_YEAR, FIRST_YEAR + years):
+        path = _cache_path(cache_dir, year, fmt)
+        save_to_cache(_station_year(year), path, cache_format=fmt)
+        size += os.path.getsize(path)
+    return {"build_s": round(time.perf_counter() - t0, 2), "disk_bytes": size}
+
+def _measure(args) -> dict:
+    fmt, years, cache_dir, scenario = args
+    import pandas as pd
+    import pyarrow  # noqa: F401  (import cost is not part of the read)
+    from meteostat.core.cache import load_from_cache
+    from meteostat.utilities.mutations import filter_time
+
+    years_read = range(FIRST_YEAR, FIRST_YEAR + years)
+    columns = list(VALUE_COLUMNS)
+    start = end = None
+    if scenario == "all":
+        columns = None
+    elif scenario == "one_year":
+        middle = FIRST_YEAR + years // 2
+        years_read = [middle]
+        start, end = datetime(middle, 1, 1), datetime(middle, 12, 31, 23)
+    elif scenario == "one_month":
+        middle = FIRST_YEAR + years // 2
+        years_read = [middle]
+        start, end = datetime(middle, 6, 1), datetime(middle, 6, 30, 23)
+
+    rss_before = _peak_rss_mb()
+    t0 = time.perf_counter()
+    frames = [load_from_cache(_cache_path(cache_dir, year, fmt), fmt, columns, start, end) for year in years_read]
+    df = pd.concat(frames)
+    if fmt == "pickle":
+        # Pickles are read whole; drop what was not asked for, as the caller would
+        if columns is not None:
+            df = df[columns]
+        df = filter_time(df, start, end)
+    elapsed = time.perf_counter() - t0
+    rss_after = _peak_rss_mb()
+    return {
+        "load_ms": round(elapsed * 1000, 1),
+        "rows": len(df),
+        "columns": len(df.columns),
+        "rss_growth_mb": round(rss_after - rss_before, 1) if rss_before is not None else None,
+    }
+
+def _in_subprocess(fn, args) -> dict:
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(fn, (args,))
+
+# =======================
+# 5. Suite
+# =======================
+
+def run_suite(years: int = DEFAULT_YEARS, formats=DEFAULT_FORMATS, log=print) -> dict:
+    results = []
+    for fmt in formats:
+        cache_dir = tempfile.mkdtemp(prefix=f"waterbuddy-cachebench-{fmt}-")
+        try:
+            row = {"format": fmt, "years": years}
+            row.update(_in_subprocess(_build, (fmt, years, cache_dir)))
+            for scenario in SCENARIOS:
+                row[scenario] = _in_subprocess(_measure, (fmt, years, cache_dir, scenario))
+            log(f"{fmt:<8} {row['disk_bytes'] / 1e6:7.1f} MB on disk; " + ", ".join(
+                f"{s} {row[s]['load_ms']:.0f} ms / +{row[s]['rss_growth_mb']} MB" for s in SCENARIOS))
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        results.append(row)
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "years": years,
+        "results": results,
+    }
+
+def print_table(suite: dict) -> None:
+    print(f"\n{'format':<9}{'disk MB':>9}" + "".join(f"{s + ' ms':>14}{'RSS MB':>9}" for s in SCENARIOS))
+    for row in suite["results"]:
+        line = f"{row['format']:<9}{row['disk_bytes'] / 1e6:>9.1f}"
+        for s in SCENARIOS:
+            line += f"{row[s]['load_ms']:>14.1f}{row[s]['rss_growth_mb']:>9}"
+        print(line)
+    print(f"({suite['years']} years of hourly data; RSS MB is the peak growth during the read)")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the meteostat cache formats.")
+    parser.add_argument("--years", type=int, default=DEFAULT_YEARS, help="Years of hourly data for the station")
+    parser.add_argument("--formats", nargs="+", default=list(DEFAULT_FORMATS))
+    parser.add_argument("--out", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    suite = run_suite(args.years, args.formats)
+    print_table(suite)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(suite, f, indent=2)
@@ -0,0 +1,265 @@
+"""
+WaterBuddy - History chart rendering with an in-memory cache.
+
+Drawing the History chart with Matplotlib costs far more than anything else
+on the page, yet most reruns draw exactly the same chart again. Charts are
+rendered once to PNG (or SVG) bytes and kept in a byte-bounded LRU cache
+keyed by a hash of everything that shows up in the image: the intake series
+and its range, the rolling average, the goal, the theme and the format.
+
+Every figure is closed as soon as it has been rasterized, so a long-running
+server never accumulates open figures.
+
+Run `python charts.py` to replay 100k History reruns and check render time,
+cache hit rate, open figures and memory.
+"""
+
+# =======================
+# 1. Imports
+# =======================
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import matplotlib
+matplotlib.use("Agg")  # render off-screen; safe outside the main thread
+import matplotlib.dates as mdates
+import matplotlib.pyplot as plt
+import numpy as np
+
+from history import ROLLING_WINDOW_DAYS
+from metrics import instrument
+
+# =======================
+# 2. Configuration & Constants
+# =======================
+# Upper bound for all cached chart bytes (a 1000x600 PNG is ~40-80 KB)
+CHART_CACHE_MAX_BYTES = 32 * 1024 * 1024
+CHART_CACHE_MAX_ENTRIES = 512
+CHART_DPI = 100
+CHART_FORMATS = ("png", "svg")
+
+# Chart colours per app theme (background, text), matching apply_theme()
+CHART_THEMES = {
+    "Light": ("#ffffff", "#000000"),
+    "Aqua": ("#e8fbff", "#004455"),
+    "Dark": ("#0f1720", "#e6eef6"),
+}
+
+# Matplotlib's pyplot state is global: one figure is drawn at a time
+_render_lock = threading.Lock()
+
+# =======================
+# 3. Plotting
+# =======================
+
+def plot_water_intake(intake_data, goal, rolling=None, theme="Light"):
+    """Generate a Matplotlib line chart showing daily water intake (and an optional rolling average).
+
+    The caller owns the returned figure and must close it (plt.close(fig)).
+    """
+    # Sort data by date (key) so the chart goes from older dates to today
+    sorted_days = sorted(intake_data.keys())
+    intakes = [intake_data[day] for day in sorted_days]
+
+    # Real dates, so ranges over a year don't merge equal 'MM-DD' labels
+    dates = [date.fromisoformat(day) for day in sorted_days]
+
+    background, text = CHART_THEMES.get(theme, CHART_THEMES["Light"])
+    fig, ax = plt.subplots(figsize=(10, 6), facecolor=background)
+    ax.set_facecolor(background)
+    marker = 'o' if len(dates) <= 31 else None
+    ax.plot(dates, intakes, marker=marker, color='#3498db', label="Water Intake (ml)", linewidth=2)
+    if rolling is not None:
+        ax.plot(dates, rolling, color='#f39c12', label=f"{ROLLING_WINDOW_DAYS}-day average", linewidth=2)
+
+    # Add goal line
+    ax.axhline(y=goal, color='#2ecc71', linestyle='--', label=f'Goal ({goal} ml)')
+
+    # Customize the plot
+    # Named by its dates: custom ranges need not end today
+    if dates:
+        span = f"{dates[0]:%d %b %Y}"
+        if len(dates) > 1:
+            span += f" – {dates[-1]:%d %b %Y}"
+        ax.set_title(f"Daily Water Intake ({span})", fontsize=16, color=text)
+    else:
+        ax.set_title("Daily Water Intake", fontsize=16, color=text)
+    ax.set_xlabel("Date", fontsize=12, color=text)
+    ax.set_ylabel("Water Intake (ml)", fontsize=12, color=text)
+    ax.tick_params(axis='x', rotation=45)
+    ax.tick_params(colors=text)
+    for spine in ax.spines.values():
+        spine.set_color(text)
+    # Keep long ranges readable: ticks on whole days/months/years, labelled
+    # with the year where it changes
+    locator = mdates.AutoDateLocator(maxticks=14)
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+    if len(dates) == 1:
+        ax.set_xlim(dates[0] - timedelta(days=1), dates[0] + timedelta(days=1))
+        ax.xaxis.set_major_locator(mdates.DayLocator())
+    ax.grid(True, linestyle=':', alpha=0.7)
+    ax.legend()
+    fig.tight_layout()
+
+    return fig
+
+@instrument("chart.render", written=len)
+def render_chart(intake_data, goal, rolling=None, theme="Light", fmt="png") -> bytes:
+    """Draw the chart and return it as PNG/SVG bytes; the figure is always closed."""
+    with _render_lock:
+        fig = plot_water_intake(intake_data, goal, rolling=rolling, theme=theme)
+        try:
+            buf = io.BytesIO()
+            fig.savefig(buf, format=fmt, dpi=CHART_DPI, facecolor=fig.get_facecolor())
+            return buf.getvalue()
+        finally:
+            plt.close(fig)
+
+# =======================
+# 4. Render cache
+# =======================
+
+class ChartCache:
+    """LRU cache of rendered chart bytes, bounded by total size and entry count."""
+
+    def __init__(self, max_bytes: int = CHART_CACHE_MAX_BYTES,
+                 max_entries: int = CHART_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return  # would evict everything else and still not fit
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def get_or_render(self, key: str, render) -> bytes:
+        data = self.get(key)
+        if data is None:
+            data = render()
+            self.put(key, data)
+        return data
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+chart_cache = ChartCache()
+
+def chart_key(history, goal: int, rolling=None, theme: str = "Light", fmt: str = "png") -> str:
+    """Hash of everything that ends up in the rendered image."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{history.start.isoformat()}|{len(history)}|{int(goal)}|{theme}|{fmt}|".encode())
+    h.update(np.ascontiguousarray(history.values, dtype=np.int32).tobytes())
+    if rolling is not None:
+        h.update(b"|rolling|")
+        h.update(np.ascontiguousarray(rolling, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+@instrument("chart.serve", written=len)
+def intake_chart(history, goal: int, rolling=None, theme: str = "Light", fmt: str = "png",
+                 cache: ChartCache = None) -> bytes:
+    """Rendered History chart for a DayHistory, served from the cache when possible."""
+    if fmt not in CHART_FORMATS:
+        raise ValueError(f"Unsupported chart format {fmt!r} (expected one of {CHART_FORMATS})")
+    cache = cache or chart_cache
+    key = chart_key(history, goal, rolling, theme, fmt)
+    return cache.get_or_render(
+        key, lambda: render_chart(history.to_dict(), goal, rolling=rolling, theme=theme, fmt=fmt))
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import resource
+    import time
+
+    from history import DayHistory, HISTORY_RANGES
+
+    parser = argparse.ArgumentParser(description="Replay History page reruns against the chart cache.")
+    parser.add_argument("--reruns", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=20)
+    args = parser.parse_args()
+
+    def rss_mb() -> float:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    today = date.today()
+    histories = [
+        DayHistory(today - timedelta(days=365 + ROLLING_WINDOW_DAYS - 2),
+                   [random.randrange(0, 3500, 50) for _ in range(365 + ROLLING_WINDOW_DAYS - 1)])
+        for _ in range(args.users)
+    ]
+    ranges = list(HISTORY_RANGES.values())
+
+    render_s = []
+    rss_start = None
+    t0 = time.perf_counter()
+    for i in range(args.reruns):
+        # Mostly the same chart again; now and then another user, range or theme
+        history = histories[random.randrange(args.users)]
+        days = random.choice(ranges)
+        theme = "Dark" if i % 97 == 0 else "Light"
+        start = today - timedelta(days=days - 1)
+        window = history.range(start - timedelta(days=ROLLING_WINDOW_DAYS - 1), today)
+        rolling = window.rolling_mean()[ROLLING_WINDOW_DAYS - 1:]
+        misses = chart_cache.misses
+        r0 = time.perf_counter()
+        intake_chart(window.range(start, today), 2500, rolling=rolling, theme=theme)
+        if chart_cache.misses > misses:
+            render_s.append(time.perf_counter() - r0)
+        if i == 1000:
+            rss_start = rss_mb()
+    elapsed = time.perf_counter() - t0
+
+    stats = chart_cache.stats()
+    hit_s = (elapsed - sum(render_s)) / max(stats["hits"], 1)
+    print(f"{args.reruns:,} reruns in {elapsed:.1f} s: {len(render_s)} renders "
+          f"(avg {sum(render_s) / max(len(render_s), 1) * 1000:.0f} ms), "
+          f"{hit_s * 1e6:.0f} us per cached rerun (slicing, rolling average, key hash)")
+    print(f"cache: {stats}")
+    print(f"open figures: {len(plt.get_fignums())}, peak RSS {rss_start or 0:.0f} MB after 1k reruns, "
+          f"{rss_mb():.0f} MB at the end")
@@ -0,0 +1,298 @@
+"""
+WaterBuddy - Meteostat download benchmark against a local stand-in server.
+
+Serves synthetic, gzipped Meteostat CSV fixtures (one hourly file per
+station-year) from a local HTTP/1.1 server and times downloading and
+parsing all station-years the way meteostat.Hourly does it with caching
+off, with either engine:
+
+- threads     core.loader.processing_handler over load_handler: N threads
+              (Base.threads) sharing one core.transport connection pool
+- async       core.loader.async_processing_handler (Base.fetch_mode =
+              "async"): up to N downloads at a time in an asyncio event
+              loop, parsed in one worker thread as they arrive
+
+(Hourly's post-processing is left out; it is CPU-bound and the same
+either way.)
+
+The real endpoints are HTTPS, where a new connection costs a TCP and a
+TLS handshake. The stand-in server imitates that by waiting --connect-ms
+before serving a new connection, and --latency-ms before each response
+(round trip and server time). Two server modes are compared:
+
+- close       the server closes the connection after every response (what
+              the client got before: urllib sends "Connection: close")
+- keep-alive  the server keeps connections open, so the client's pool
+              reuses them
+
+With --fail-rate some responses are 503s, which the transport retries
+with exponential backoff; the fetched frames must not change.
+
+Usage:
+    python fetchbench.py [--stations 4] [--years 20] [--concurrency 1 8] \\
+        [--engines threads async] [--connect-ms 30] [--latency-ms 0] \\
+        [--fail-rate 0.0] [--out bench.json]
+"""
+
+# =======================
+# 1. Imports
+# =======================
+import gzip
+import io
+import json
+import multiprocessing
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# =======================
+# 2. Configuration & Constants
+# =======================
+DEFAULT_STATIONS = 4
+DEFAULT_YEARS = 20
+DEFAULT_CONCURRENCY = (1, 8)
+ENGINES = ("threads", "async")
+DEFAULT_CONNECT_MS = 30.0
+DEFAULT_LATENCY_MS = 0.0
+FIRST_YEAR = 2000
+SERVER_MODES = ("close", "keep-alive")
+
+# =======================
+# 3. Fixtures
+# =======================
+
+def station_ids(count: int) -> list:
+    return [f"F{i:04d}" for i in range(count)]
+
+def _gzip_csv(df) -> bytes:
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb", mtime=0) as f:
+        f.write(df.to_csv(index=False).encode("utf-8"))
+    return buffer.getvalue()
+
+def build_fixtures(stations: int, years: int) -> dict:
+    """{path: gzipped CSV} for every hourly station-year."""
+    import numpy as np
+    import pandas as pd
+    from meteostat.enumerations.granularity import Granularity
+    from meteostat.interface.hourly import Hourly
+    from meteostat.utilities.endpoint import generate_endpoint_path
+
+    ids = station_ids(stations)
+    files = {}
+    raw = Hourly._raw_columns.fget(Hourly)
+    values = raw[4:]
+    for year in range(FIRST_YEAR, FIRST_YEAR + years):
+        time_index = pd.date_range(f"{year}-01-01", f"{year}-12-31 23:00", freq="h")
+        for n, sid in enumerate(ids):
+            rng = np.random.default_rng(year * 1000 + n)
+            df = pd.DataFrame({
+                "year": time_index.year, "month": time_index.month,
+                "day": time_index.day, "hour": time_index.hour,
+            })
+            for col in values:
+                df[col] = rng.normal(10, 8, len(df)).round(1)
+            for col in values:
+                df[col + "_source"] = "metar"
+            files[generate_endpoint_path(Granularity.HOURLY, sid, year)] = _gzip_csv(df)
+    return files
+
+# =======================
+# 4. Stand-in server
+# =======================
+
+class StandInServer(ThreadingHTTPServer):
+    """Serves the fixtures; counts connections and requests."""
+
+    daemon_threads = True
+
+    def __init__(self, files: dict, keep_alive: bool, connect_ms: float, fail_rate: float,
+                 latency_ms: float = 0.0):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.files = files
+        self.keep_alive = keep_alive
+        self.connect_s = connect_ms / 1000
+        self.latency_s = latency_ms / 1000
+        self.fail_rate = fail_rate
+        self.rng = random.Random(5)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+    def reset_counters(self) -> None:
+        with self.lock:
+            self.connections = self.requests = self.failures = 0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+        # New connection: stand-in for the TCP + TLS handshake round trips
+        time.sleep(self.server.connect_s)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            fail = server.rng.random() < server.fail_rate
+            server.failures += fail
+        time.sleep(server.latency_s)
+        body = server.files.get(self.path.lstrip("/"))
+        status = 503 if fail else 200 if body is not None else 404
+        if status != 200:
+            body = b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/gzip")
+        self.send_header("Content-Length", str(len(body)))
+        if not server.keep_alive:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+# =======================
+# 5. Client (runs in its own subprocess)
+# =======================
+
+def _fetch_threads(datasets: list, concurrency: int):
+    import functools
+    from meteostat.core.loader import load_handler, processing_handler
+    from meteostat.core.transport import get_transport
+
+    transport = get_transport(None, backoff=0.05)
+    load = functools.partial(load_handler, transport=transport)
+    return processing_handler(datasets, load, 1, concurrency), transport.stats()
+
+async def _fetch_async(datasets: list, concurrency: int):
+    import pandas as pd
+    from meteostat.core.loader import async_load_handler, async_processing_handler, parse_handler
+    from meteostat.core.transport import get_async_transport
+
+    transport = get_async_transport(None, backoff=0.05)
+
+    async def download(endpoint, path):
+        return await async_load_handler(endpoint, path, transport)
+
+    def process(content, endpoint, path):
+        return parse_handler(content)
+
+    output = {}
+    async for dataset, df in async_processing_handler(datasets, download, process, concurrency, 1, 1):
+        output[dataset] = df
+    transport.close()
+    return pd.concat([output[dataset] for dataset in datasets]), transport.stats()
+
+def _fetch(args) -> dict:
+    url, stations, years, engine, concurrency = args
+    import asyncio
+    from meteostat.enumerations.granularity import Granularity
+    from meteostat.utilities.endpoint import generate_endpoint_path
+
+    datasets = [(url, generate_endpoint_path(Granularity.HOURLY, sid, year))
+                for year in range(FIRST_YEAR, FIRST_YEAR + years) for sid in station_ids(stations)]
+
+    t0 = time.perf_counter()
+    if engine == "async":
+        df, stats = asyncio.run(_fetch_async(datasets, concurrency))
+    else:
+        df, stats = _fetch_threads(datasets, concurrency)
+    elapsed = time.perf_counter() - t0
+    return {
+        "fetch_s": round(elapsed, 3),
+        "rows": len(df),
+        "checksum": round(float(df["temp"].sum()), 1),
+        "transport": stats,
+    }
+
+def _in_subprocess(fn, args) -> dict:
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(fn, (args,))
+
+# =======================
+# 6. Suite
+# =======================
+
+def run_suite(stations: int = DEFAULT_STATIONS, years: int = DEFAULT_YEARS, concurrency=DEFAULT_CONCURRENCY,
+              engines=ENGINES, connect_ms: float = DEFAULT_CONNECT_MS, latency_ms: float = DEFAULT_LATENCY_MS,
+              fail_rate: float = 0.0, log=print) -> dict:
+    files = build_fixtures(stations, years)
+    results = []
+    for mode in SERVER_MODES:
+        server = StandInServer(files, mode == "keep-alive", connect_ms, fail_rate, latency_ms)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            for engine in engines:
+                for n in concurrency:
+                    server.reset_counters()
+                    row = {"server": mode, "engine": engine, "concurrency": n}
+                    row.update(_in_subprocess(_fetch, (server.url, stations, years, engine, n)))
+                    row.update(server_connections=server.connections, server_requests=server.requests,
+                               server_failures=server.failures)
+                    log(f"{mode:<10} {engine:<7} n={n:<3} {row['fetch_s']:7.2f} s, "
+                        f"{row['server_requests']} requests over {row['server_connections']} connections, "
+                        f"{row['transport']['retries']} retries")
+                    results.append(row)
+        finally:
+            server.shutdown()
+            server.server_close()
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "stations": stations,
+        "years": years,
+        "connect_ms": connect_ms,
+        "latency_ms": latency_ms,
+        "fail_rate": fail_rate,
+        "results": results,
+    }
+
+def print_table(suite: dict) -> None:
+    print(f"\n{'server':<12}{'engine':<9}{'n':>4}{'fetch s':>10}{'requests':>10}{'conns':>8}{'retries':>9}"
+          f"{'rows':>10}")
+    for row in suite["results"]:
+        print(f"{row['server']:<12}{row['engine']:<9}{row['concurrency']:>4}{row['fetch_s']:>10.2f}"
+              f"{row['server_requests']:>10}{row['server_connections']:>8}{row['transport']['retries']:>9}"
+              f"{row['rows']:>10,}")
+    checksums = {(row["rows"], row["checksum"]) for row in suite["results"]}
+    print(f"({suite['stations']} stations x {suite['years']} years; {suite['connect_ms']:.0f} ms per new "
+          f"connection, {suite['latency_ms']:.0f} ms per response; n = threads or concurrent downloads; identical frames: {len(checksums) == 1})")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark meteostat downloads against a local stand-in server.")
+    parser.add_argument("--stations", type=int, default=DEFAULT_STATIONS)
+    parser.add_argument("--years", type=int, default=DEFAULT_YEARS, help="Years of hourly data per station")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=list(DEFAULT_CONCURRENCY),
+                        help="Threads (threads engine) or concurrent downloads (async engine) to run")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=ENGINES)
+    parser.add_argument("--connect-ms", type=float, default=DEFAULT_CONNECT_MS,
+                        help="Simulated handshake cost of a new connection")
+    parser.add_argument("--latency-ms", type=float, default=DEFAULT_LATENCY_MS,
+                        help="Simulated round trip and server time of each response")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of responses that are 503s")
+    parser.add_argument("--out", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    suite = run_suite(args.stations, args.years, args.concurrency, args.engines, args.connect_ms,
+                      args.latency_ms, args.fail_rate)
+    print_table(suite)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(suite, f, indent=2)
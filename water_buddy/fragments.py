@@ -0,0 +1,150 @@
+"""
+WaterBuddy - Memoized render fragments (bottle SVG, theme CSS).
+
+Every Streamlit rerun used to re-format the bottle SVG and inject the theme
+CSS twice. Both are pure functions of a few small inputs, so they are built
+once and memoized:
+
+- generate_bottle_svg() quantizes the fill to whole percent (the label
+  already showed whole percent), so at most 101 variants per size and theme.
+- theme_css() builds each theme's <style> block once; app.py injects it
+  into a single placeholder, so a rerun sends one style block.
+
+Run `python fragments.py` to time the per-rerun fragment cost before and
+after memoization.
+"""
+
+# =======================
+# 1. Imports
+# =======================
+import functools
+
+from metrics import instrument
+
+# =======================
+# 2. Configuration & Constants
+# =======================
+THEMES = ("Light", "Aqua", "Dark")
+DEFAULT_THEME = "Light"
+
+# Theme CSS rules (one per line; wrapped in <style> by theme_css)
+THEME_CSS = {
+    "Light": """
+.stApp { background-color: #ffffff !important; color: #000000 !important; }
+h1, h2, h3, h4, h5, h6, p, label, span { color: #000000 !important; }
+.stButton>button { background-color: #e6e6e6 !important; color: #000000 !important; border-radius: 8px !important; border: 1px solid #cccccc !important; }
+.stButton>button:hover { background-color: #d9d9d9 !important; }
+.stTextInput>div>div>input { background-color: #fafafa !important; color: #000000 !important; border-radius: 6px !important; }
+.stSlider>div>div>div { background-color: #007acc !important; }
+div[data-testid="metric-container"] { background-color: #f7f7f7 !important; border-radius: 12px !important; padding: 12px !important; border: 1px solid #e1e1e1 !important; }
+div[data-testid="metric-container"] label { color: #000000 !important; font-weight: 600 !important; }
+div[data-testid="metric-container"] [data-testid="stMetricValue"] { color: #000000 !important; font-weight: 700 !important; font-size: 1.5rem !important; }
+div[data-testid="metric-container"] [data-testid="metric-delta"] { color: #006600 !important; font-weight: 600 !important; }
+div[data-testid="metric-container"] div[data-testid="stMetricValue"] > span,
+div[data-testid="metric-container"] div[data-testid="stMetricValue"] span { color: inherit !important; }
+""",
+    "Aqua": """
+.stApp { background-color: #e8fbff !important; color: #004455 !important; }
+h1, h2, h3, h4, h5, h6, p, label, span { color: #004455 !important; }
+.stButton>button { background-color: #c6f3ff !important; color: #004455 !important; border-radius: 8px !important; border: 1px solid #99e6ff !important; }
+.stButton>button:hover { background-color: #b3edff !important; }
+.stTextInput>div>div>input { background-color: #ffffff !important; color: #003344 !important; border-radius: 6px !important; }
+.stSlider>div>div>div { background-color: #00aacc !important; }
+div[data-testid="metric-container"] { background-color: #d9f7ff !important; border-radius: 12px !important; padding: 12px !important; border: 1px solid #bdefff !important; }
+div[data-testid="metric-container"] label { color: #005577 !important; font-weight: 600 !important; }
+div[data-testid="metric-container"] [data-testid="stMetricValue"] { color: #005577 !important; font-weight: 700 !important; font-size: 1.5rem !important; }
+div[data-testid="metric-container"] [data-testid="metric-delta"] { color: #0077b6 !important; font-weight: 600 !important; }
+div[data-testid="metric-container"] div[data-testid="stMetricValue"] > span,
+div[data-testid="metric-container"] div[data-testid="stMetricValue"] span { color: inherit !important; }
+""",
+    "Dark": """
+.stApp { background-color: #0f1720 !important; color: #e6eef6 !important; }
+h1, h2, h3, h4, h5, h6, p, label, span { color: #e6eef6 !important; }
+.stButton>button { background-color: #1e2933 !important; color: #e6eef6 !important; border-radius: 8px !important; border: 1px solid #324151 !important; }
+.stButton>button:hover { background-color: #253241 !important; }
+.stTextInput>div>div>input { background-color: #1e2933 !important; color: #e6eef6 !important; border-radius: 6px !important; }
+.stSlider>div>div>div { background-color: #3b82f6 !important; }
+div[data-testid="metric-container"] { background-color: #1a2634 !important; border-radius: 12px !important; padding: 12px !important; border: 1px solid #334155 !important; }
+div[data-testid="metric-container"] label { color: #e6eef6 !important; font-weight: 600 !important; }
+div[data-testid="metric-container"] [data-testid="stMetricValue"] { color: #e6eef6 !important; font-weight: 700 !important; font-size: 1.5rem !important; }
+div[data-testid="metric-container"] [data-testid="metric-delta"] { color: #4caf50 !important; font-weight: 600 !important; }
+div[data-testid="metric-container"] div[data-testid="stMetricValue"] > span,
+div[data-testid="metric-container"] div[data-testid="stMetricValue"] span { color: inherit !important; }
+""",
+}
+
+# Bottle colours per theme: (outline, glass, water, cap, label)
+BOTTLE_THEMES = {
+    "Light": ("#5dade2", "#f3fbff", "#67b3df", "#3498db", "#023047"),
+    "Aqua": ("#5dade2", "#f3fbff", "#67b3df", "#3498db", "#023047"),
+    "Dark": ("#5dade2", "#1e2933", "#3b82f6", "#3498db", "#e6eef6"),
+}
+
+# =======================
+# 3. Fragments
+# =======================
+
+@functools.lru_cache(maxsize=512)
+def _bottle_svg(pct: int, width: int, height: int, theme: str) -> str:
+    outline, glass, water, cap, label = BOTTLE_THEMES.get(theme, BOTTLE_THEMES[DEFAULT_THEME])
+    inner_w = width - 36
+    inner_h = height - 80
+    fill_h = (pct / 100.0) * inner_h
+    empty_h = inner_h - fill_h
+
+    # Coordinates are chosen to keep visual proportions consistent.
+    return f"""
+<svg width="{width}" height="{height}" viewBox="0 0 {width} {height}" xmlns="http://www.w3.org/2000/svg">
+    <rect x="12" y="12" rx="20" ry="20" width="{width-24}" height="{height-24}" fill="none" stroke="{outline}" stroke-width="3"/>
+    <rect x="18" y="18" width="{inner_w}" height="{inner_h}" rx="12" ry="12" fill="{glass}"/>
+    <rect x="18" y="{18 + empty_h:g}" width="{inner_w}" height="{fill_h:g}" rx="12" ry="12" fill="{water}"/>
+    <rect x="{(width/2)-18:g}" y="0" width="36" height="18" rx="4" ry="4" fill="{cap}"/>
+    <text x="{width/2:g}" y="{height-8}" font-size="14" text-anchor="middle" fill="{label}" font-family="Arial">{pct}%</text>
+</svg>
+"""
+
+@instrument("render.bottle_svg", written=len)
+def generate_bottle_svg(percent: float, width: int = 140, height: int = 360, theme: str = DEFAULT_THEME) -> str:
+    """
+    Simple bottle SVG with dynamic fill height, quantized to whole percent.
+    """
+    pct = int(round(max(0.0, min(100.0, float(percent)))))
+    return _bottle_svg(pct, int(width), int(height), theme)
+
+@functools.lru_cache(maxsize=None)
+def _theme_css(theme_name: str) -> str:
+    rules = THEME_CSS.get(theme_name, THEME_CSS["Dark"])
+    return "<style>\n" + rules.strip() + "\n</style>"
+
+@instrument("render.theme_css", written=len)
+def theme_css(theme_name: str) -> str:
+    """The <style> block for a theme (unknown names get the Dark theme, as before)."""
+    return _theme_css(theme_name)
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    reruns = 100_000
+    percents = [random.uniform(0, 120) for _ in range(reruns)]
+
+    def before(percent: float, theme: str) -> int:
+        # Per rerun: format the SVG from scratch, build and inject the CSS twice
+        pct = max(0.0, min(100.0, float(percent)))
+        svg = _bottle_svg.__wrapped__(pct, 140, 360, theme)
+        css = "".join(_theme_css.__wrapped__(theme) for _ in range(2))
+        return len(svg) + len(css)
+
+    def after(percent: float, theme: str) -> int:
+        return len(generate_bottle_svg(percent, theme=theme)) + len(theme_css(theme))
+
+    for label, fn in (("before", before), ("after", after)):
+        t0 = time.perf_counter()
+        sent = 0
+        for i, percent in enumerate(percents):
+            sent += fn(percent, "Dark" if i % 7 == 0 else "Light")
+        per_rerun = (time.perf_counter() - t0) / reruns * 1e6
+        print(f"{label:<7} {per_rerun:6.2f} us per rerun, {sent / reruns / 1024:.1f} KB of SVG + CSS per rerun")
+    info = _bottle_svg.cache_info()
+    print(f"bottle SVG cache: {info.currsize} variants, {info.hits:,} hits, {info.misses} misses")
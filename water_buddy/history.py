@@ -0,0 +1,166 @@
+"""
+WaterBuddy - Intake history as day-indexed arrays.
+
+A user's daily intake is held as a NumPy int32 array indexed by the day
+offset from a start date (by default the user's first logged day). Range
+reads are slices, and the History page statistics (rolling average, goal
+hit rate, percentiles) are vectorized operations over the slice.
+
+Backends return a DayHistory from get_history(uid, start, end).
+
+Run `python history.py` to time a year (and five years) of history.
+"""
+
+# =======================
+# 1. Imports
+# =======================
+from datetime import date, timedelta
+
+import numpy as np
+
+# =======================
+# 2. Configuration & Constants
+# =======================
+# Preset ranges offered on the History page (label -> days)
+HISTORY_RANGES = {
+    "7 days": 7,
+    "30 days": 30,
+    "90 days": 90,
+    "365 days": 365,
+}
+ROLLING_WINDOW_DAYS = 7
+DEFAULT_PERCENTILES = (50, 90)
+
+# =======================
+# 3. DayHistory
+# =======================
+
+def _as_date(day) -> date:
+    return day if isinstance(day, date) else date.fromisoformat(day)
+
+
+class DayHistory:
+    """Daily intake in ml; values[i] is the intake on start + i days."""
+
+    __slots__ = ("start", "values")
+
+    def __init__(self, start, values):
+        self.start = _as_date(start)
+        self.values = np.asarray(values, dtype=np.int32)
+
+    @classmethod
+    def from_days(cls, days: dict, start=None, end=None):
+        """Build from {ISO day: ml}; start/end default to the first/last logged day."""
+        parsed = {}
+        for day, ml in days.items():
+            try:
+                parsed[date.fromisoformat(day)] = int(ml or 0)
+            except (TypeError, ValueError):
+                continue
+        if start is None:
+            start = min(parsed, default=date.today())
+        if end is None:
+            end = max(parsed, default=_as_date(start) - timedelta(days=1))
+        start, end = _as_date(start), _as_date(end)
+        values = np.zeros(max((end - start).days + 1, 0), dtype=np.int32)
+        for day, ml in parsed.items():
+            i = (day - start).days
+            if 0 <= i < len(values):
+                values[i] = ml
+        return cls(start, values)
+
+    @property
+    def end(self) -> date:
+        """Last day covered (the day before start when empty)."""
+        return self.start + timedelta(days=len(self.values) - 1)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def days(self) -> list:
+        return [(self.start + timedelta(days=i)).isoformat() for i in range(len(self.values))]
+
+    def to_dict(self) -> dict:
+        """{ISO day: ml}, oldest first."""
+        return dict(zip(self.days(), self.values.tolist()))
+
+    def range(self, start, end):
+        """The days start..end (inclusive); days outside the data are 0."""
+        start, end = _as_date(start), _as_date(end)
+        out = np.zeros(max((end - start).days + 1, 0), dtype=np.int32)
+        lo = (start - self.start).days
+        src_lo, src_hi = max(lo, 0), min(lo + len(out), len(self.values))
+        if src_lo < src_hi:
+            out[src_lo - lo:src_hi - lo] = self.values[src_lo:src_hi]
+        return DayHistory(start, out)
+
+    def last(self, days: int, today=None):
+        """The `days` days ending today."""
+        end = _as_date(today or date.today())
+        return self.range(end - timedelta(days=days - 1), end)
+
+    def set(self, day, ml: int) -> None:
+        """Overwrite one day inside the covered range (ignored outside it)."""
+        i = (_as_date(day) - self.start).days
+        if 0 <= i < len(self.values):
+            self.values[i] = ml
+
+    # --- Vectorized statistics ---
+
+    def total(self) -> int:
+        return int(self.values.sum(dtype=np.int64))
+
+    def mean(self) -> float:
+        return float(self.values.mean()) if len(self.values) else 0.0
+
+    def rolling_mean(self, window: int = ROLLING_WINDOW_DAYS) -> np.ndarray:
+        """Trailing `window`-day average per day (shorter windows at the start)."""
+        sums = np.cumsum(self.values, dtype=np.int64)
+        sums[window:] = sums[window:] - sums[:-window]
+        counts = np.minimum(np.arange(1, len(self.values) + 1), window)
+        return sums / counts
+
+    def goal_hit_rate(self, goal: int) -> float:
+        """Share of days (0..1) on which the goal was reached."""
+        if not len(self.values):
+            return 0.0
+        return float(np.count_nonzero(self.values >= goal)) / len(self.values)
+
+    def percentiles(self, qs=DEFAULT_PERCENTILES) -> dict:
+        if not len(self.values):
+            return {q: 0 for q in qs}
+        return dict(zip(qs, np.percentile(self.values, qs).round().astype(int).tolist()))
+
+    def summary(self, goal: int, qs=DEFAULT_PERCENTILES) -> dict:
+        return {
+            "days": len(self.values),
+            "total": self.total(),
+            "mean": round(self.mean()),
+            "goal_hit_rate": self.goal_hit_rate(goal),
+            "percentiles": self.percentiles(qs),
+        }
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    # First call pays NumPy's one-off setup cost
+    DayHistory(date.today(), [0]).summary(0)
+    for years in (1, 5):
+        today = date.today()
+        days = {
+            (today - timedelta(days=i)).isoformat(): random.randrange(0, 3500, 50)
+            for i in range(365 * years)
+        }
+        t0 = time.perf_counter()
+        history = DayHistory.from_days(days)
+        t1 = time.perf_counter()
+        shown = history.last(365, today)
+        rolling = history.range(today - timedelta(days=365 + ROLLING_WINDOW_DAYS - 2), today).rolling_mean()
+        stats = shown.summary(2500)
+        t2 = time.perf_counter()
+        print(f"{years} year(s): build {(t1 - t0) * 1000:.2f} ms, "
+              f"365-day slice + rolling average + stats {(t2 - t1) * 1000:.3f} ms "
+              f"(hit rate {stats['goal_hit_rate']:.0%}, p50 {stats['percentiles'][50]} ml, "
+              f"{len(rolling)} rolling points)")
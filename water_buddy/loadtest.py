@@ -0,0 +1,343 @@
+"""
+WaterBuddy - Load test with many simulated sessions.
+
+Drives app.py headless through streamlit.testing (AppTest) the way visitors
+do: sign up, log in, then a random mix of quick logs, custom amounts, Home,
+History (with range changes) and Settings saves.
+
+AppTest patches Streamlit's process-wide runtime, so one process can only
+run one script at a time. Virtual users are therefore spread over worker
+processes; each worker interleaves its users' sessions step by step, and
+all workers share one storage directory, like several server processes
+behind a load balancer.
+
+Reported:
+- p50/p95/p99 latency per action (one AppTest run each)
+- lost updates: intake each user logged vs what the store holds afterwards
+- data-file growth, in total and per logged event
+- optionally the change against a saved baseline
+
+Usage:
+    python loadtest.py --users 200 --workers 8 --iterations 10 \\
+        [--backend sqlite] [--seed-users 1000 --seed-days 365] \\
+        [--out result.json] [--baseline baseline.json]
+"""
+
+# =======================
+# 1. Imports
+# =======================
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+# =======================
+# 2. Configuration & Constants
+# =======================
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# Relative weights of the actions a logged-in user takes
+ACTION_MIX = {
+    "quick_log": 40,
+    "custom_add": 20,
+    "home": 15,
+    "history": 15,
+    "settings": 10,
+}
+CUSTOM_AMOUNTS = (100, 150, 200, 330, 500)
+HISTORY_RANGE_LABELS = ("7 days", "30 days", "90 days", "365 days")
+PERCENTILES = (50, 95, 99)
+SEED_BATCH = 500
+
+# =======================
+# 3. Virtual users
+# =======================
+
+class VirtualUser:
+    """One scripted session; run() yields after every app run, so a worker
+    can interleave many sessions."""
+
+    def __init__(self, username: str, iterations: int, rng: random.Random):
+        self.username = username
+        self.iterations = iterations
+        self.rng = rng
+        self.samples = []   # (action, ms, ok)
+        self.expected_ml = 0
+        self.at = None
+
+    def _step(self, action: str, run):
+        t0 = time.perf_counter()
+        try:
+            self.at = run()
+            ok = not self.at.exception
+        except Exception:
+            ok = False
+        self.samples.append((action, (time.perf_counter() - t0) * 1000, ok))
+        return ok
+
+    def _nav(self, key: str, action: str):
+        return self._step(action, self.at.button(key=key).click().run)
+
+    def run(self):
+        from streamlit.testing.v1 import AppTest
+        from storage import get_store
+
+        self.at = AppTest.from_file(APP_FILE, default_timeout=120)
+        self._step("login_page", self.at.run)
+        yield
+        self.at.button[1].click().run()  # "Create new account"
+        self.at.text_input("signup_username").input(self.username)
+        self.at.text_input("signup_password").input("load-test")
+        self._step("signup", self.at.button[0].click().run)
+        yield
+        self.at.text_input("login_username").input(self.username)
+        self.at.text_input("login_password").input("load-test")
+        self._step("login", self.at.button[0].click().run)
+        yield
+
+        # Continue in a fresh session, as the browser does after the login
+        # rerun (AppTest keeps stale login widgets from that rerun around)
+        uid, _ = get_store().find_user(self.username)
+        if uid is None:
+            self.samples.append(("login", 0.0, False))
+            return
+        self.at = AppTest.from_file(APP_FILE, default_timeout=120)
+        self.at.session_state.logged_in = True
+        self.at.session_state.uid = uid
+        self.at.session_state.page = "dashboard"
+        self._step("home", self.at.run)
+        yield
+
+        actions, weights = zip(*ACTION_MIX.items())
+        view = "home"
+        for _ in range(self.iterations):
+            action = self.rng.choices(actions, weights)[0]
+            if action in ("quick_log", "custom_add"):
+                if view != "log":
+                    self._nav("nav_log", "nav_log")
+                    view = "log"
+                    yield
+                if action == "quick_log":
+                    if self._step(action, self.at.button(key="quick_log").click().run):
+                        self.expected_ml += 250
+                else:
+                    amount = self.rng.choice(CUSTOM_AMOUNTS)
+                    self.at.number_input(key="custom_input").set_value(amount)
+                    if self._step(action, self.at.button(key="add_custom").click().run):
+                        self.expected_ml += amount
+            elif action == "home":
+                self._nav("nav_home", action)
+                view = "home"
+            elif action == "history":
+                if view != "history":
+                    self._nav("nav_history", "history")
+                    view = "history"
+                    yield
+                label = self.rng.choice(HISTORY_RANGE_LABELS)
+                self._step("history_range", self.at.radio(key="history_range").set_value(label).run)
+            else:
+                if view != "settings":
+                    self._nav("nav_settings", "nav_settings")
+                    view = "settings"
+                    yield
+                self.at.number_input[0].set_value(self.rng.randrange(1500, 4000, 50))
+                self._step("settings_save", self.at.button(key="save_profile").click().run)
+            yield
+
+# =======================
+# 4. Worker processes
+# =======================
+
+def _worker(args) -> dict:
+    workdir, usernames, iterations, seed = args
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(APP_FILE))
+    rng = random.Random(seed)
+    users = [VirtualUser(name, iterations, random.Random(rng.random())) for name in usernames]
+    sessions = [user.run() for user in users]
+    # Round-robin one step per session until all are done
+    while sessions:
+        for session in list(sessions):
+            try:
+                next(session)
+            except StopIteration:
+                sessions.remove(session)
+
+    from storage import get_write_behind
+    write_behind = get_write_behind()
+    if write_behind is not None:
+        write_behind.flush()
+    return {
+        "samples": [s for user in users for s in user.samples],
+        "expected": {user.username: user.expected_ml for user in users},
+    }
+
+# =======================
+# 5. Setup, verification, report
+# =======================
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def seed_store(backend, users: int, days: int, seed: int = 0) -> None:
+    """Fill the store with synthetic users and `days` of history each."""
+    rng = random.Random(seed)
+    today = date.today()
+    batch = []
+    for i in range(users):
+        history = {
+            (today - timedelta(days=d)).isoformat(): {"intake": rng.randrange(0, 3500, 50)}
+            for d in range(1, days + 1)
+        }
+        batch.append((f"seed-{i:07d}", {
+            "username": f"seed_{i:07d}",
+            "password": "seed",
+            "created_at": (today - timedelta(days=days)).isoformat(),
+            "profile": {"age_group": "19-50", "user_goal_ml": 2500},
+            "days": history,
+        }))
+        if len(batch) >= SEED_BATCH:
+            backend.create_users(batch)
+            batch = []
+    if batch:
+        backend.create_users(batch)
+
+def percentiles(values) -> dict:
+    if not values:
+        return {f"p{q}": None for q in PERCENTILES}
+    return {f"p{q}": round(float(v), 1) for q, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+def run(users: int = 20, workers: int = 4, iterations: int = 10, backend_name: str = None,
+        seed_users: int = 0, seed_days: int = 0, seed: int = 0, keep: bool = False, log=print) -> dict:
+    if backend_name:
+        os.environ["WATERBUDDY_BACKEND"] = backend_name
+    from storage import get_backend
+    import shards  # registers the "sharded" backend
+    import recordfile  # registers the "records" backend
+
+    workdir = tempfile.mkdtemp(prefix="waterbuddy-load-")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        backend = get_backend()
+        if seed_users:
+            t0 = time.perf_counter()
+            seed_store(backend, seed_users, seed_days, seed)
+            log(f"Seeded {seed_users:,} users x {seed_days} days in {time.perf_counter() - t0:.1f} s")
+        size_before = dir_size(workdir)
+
+        names = [f"load_{i:05d}" for i in range(users)]
+        chunks = [(workdir, names[w::workers], iterations, seed + w) for w in range(workers) if names[w::workers]]
+        log(f"Running {users} virtual users on {len(chunks)} worker process(es), "
+            f"{iterations} actions each ({backend.name} backend)")
+        t0 = time.perf_counter()
+        with multiprocessing.get_context("spawn").Pool(len(chunks)) as pool:
+            results = pool.map(_worker, chunks)
+        elapsed = time.perf_counter() - t0
+
+        samples = [s for r in results for s in r["samples"]]
+        expected = {name: ml for r in results for name, ml in r["expected"].items()}
+
+        # Lost updates: every successful log must be in the store
+        store = get_backend(backend.name)
+        today = date.today().isoformat()
+        lost_users, lost_ml = 0, 0
+        for name, ml in expected.items():
+            uid, _ = store.find_user(name)
+            actual = store.get_intake(uid, today) if uid else 0
+            if actual != ml:
+                lost_users += 1
+                lost_ml += abs(ml - actual)
+        logs = sum(1 for action, _, ok in samples if ok and action in ("quick_log", "custom_add"))
+        growth = dir_size(workdir) - size_before
+    finally:
+        os.chdir(cwd)
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    actions = {}
+    for action in sorted({s[0] for s in samples}):
+        times = [ms for a, ms, _ in samples if a == action]
+        actions[action] = dict(count=len(times), errors=sum(1 for a, _, ok in samples if a == action and not ok),
+                               **percentiles(times))
+    return {
+        "backend": backend.name,
+        "users": users,
+        "workers": len(chunks),
+        "iterations": iterations,
+        "seed_users": seed_users,
+        "seed_days": seed_days,
+        "elapsed_s": round(elapsed, 2),
+        "runs_per_s": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "actions": actions,
+        "logged_events": logs,
+        "lost_update_users": lost_users,
+        "lost_update_ml": lost_ml,
+        "data_growth_bytes": growth,
+        "bytes_per_event": round(growth / logs, 1) if logs else None,
+    }
+
+def print_report(result: dict, baseline: dict = None) -> None:
+    print(f"\n{result['users']} users, {result['workers']} workers, {result['backend']} backend: "
+          f"{result['elapsed_s']} s, {result['runs_per_s']} app runs/s")
+    header = f"{'action':<16}{'count':>7}{'errors':>8}" + "".join(f"{'p' + str(q):>10}" for q in PERCENTILES)
+    if baseline:
+        header += f"{'p95 vs base':>14}"
+    print(header)
+    for action, row in result["actions"].items():
+        line = f"{action:<16}{row['count']:>7}{row['errors']:>8}" + \
+            "".join(f"{row['p' + str(q)]:>10.1f}" for q in PERCENTILES)
+        base = (baseline or {}).get("actions", {}).get(action)
+        if base and base.get("p95"):
+            line += f"{(row['p95'] - base['p95']) / base['p95']:>+14.0%}"
+        print(line)
+    print(f"lost updates: {result['lost_update_users']} user(s), {result['lost_update_ml']} ml "
+          f"({result['logged_events']} logged events)")
+    print(f"data growth: {result['data_growth_bytes'] / 1024:.1f} KB"
+          + (f", {result['bytes_per_event']} bytes per event" if result["bytes_per_event"] else ""))
+    if baseline:
+        print(f"baseline: lost {baseline.get('lost_update_users')} user(s), "
+              f"growth {baseline.get('data_growth_bytes', 0) / 1024:.1f} KB")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load test WaterBuddy with simulated sessions.")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--iterations", type=int, default=10, help="Actions per user after login")
+    parser.add_argument("--backend", default=None, help="Storage backend (default: WATERBUDDY_BACKEND or sqlite)")
+    parser.add_argument("--seed-users", type=int, default=0, help="Synthetic users created before the run")
+    parser.add_argument("--seed-days", type=int, default=90, help="Days of history per synthetic user")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary data directory")
+    parser.add_argument("--out", default=None, help="Write the result as JSON (e.g. a new baseline)")
+    parser.add_argument("--baseline", default=None, help="Compare with a previous --out result")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    result = run(args.users, args.workers, args.iterations, args.backend,
+                 args.seed_users, args.seed_days, args.seed, args.keep)
+    print_report(result, baseline)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    sys.exit(1 if result["lost_update_users"] else 0)
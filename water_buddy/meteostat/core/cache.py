@@ -11,17 +11,311 @@ The code is licensed under the MIT license.
 import os
 import time
 import hashlib
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional
+import pandas as pd
 
+# Name of the manifest database inside the cache directory
+MANIFEST_FILE = "manifest.sqlite"
 
-def get_local_file_path(cache_dir: str, cache_subdir: str, path: str) -> str:
+# Maximum number of files removed by one automatic clean-up pass
+AUTOCLEAN_BATCH = 256
+
+# Minimum number of seconds between two last-access updates of a file
+ATIME_RESOLUTION = 60
+
+# Supported cache formats and their file name suffixes
+CACHE_FORMATS = {"pickle": "", "feather": ".feather", "parquet": ".parquet"}
+
+# Rows per Parquet row group (a month of hourly data), so reads of a time
+# range can skip row groups by their min/max statistics
+PARQUET_ROW_GROUP_SIZE = 24 * 31
+
+# Manifest schema: one row per cached file, running totals kept by triggers
+MANIFEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    subdir TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    atime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_subdir_mtime ON entries (subdir, mtime);
+CREATE INDEX IF NOT EXISTS entries_atime ON entries (atime);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    files INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals VALUES (0, 0, 0);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    UPDATE totals SET files = files + 1, bytes = bytes + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    UPDATE totals SET files = files - 1, bytes = bytes - OLD.size;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries BEGIN
+    UPDATE totals SET bytes = bytes - OLD.size + NEW.size;
+END;
+"""
+
+
+class CacheManifest:
+    """
+    Index of the files in a cache directory
+
+    Records size, modification time and last access of every cached
+    file in an SQLite database, so cache lookups are a single indexed
+    query and clean-ups only touch the files which actually expire.
+    """
+
+    def __init__(self, cache_dir: str) -> None:
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, MANIFEST_FILE)
+        self.lock = threading.Lock()
+
+        # Counters (current process)
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+        # Sub-directories known to exist
+        self._dirs = set()
+
+        # Open (or create) the manifest
+        os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(
+            self.path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self.lock:
+            new = not self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'entries'"
+            ).fetchone()
+            self._conn.executescript(MANIFEST_SCHEMA)
+
+            # Index files cached before the manifest existed
+            if new:
+                self._import_files()
+
+    def _import_files(self) -> None:
+        """
+        Add all files of the cache sub-directories to the manifest
+        """
+
+        rows = []
+        for subdir in os.scandir(self.cache_dir):
+            if not subdir.is_dir():
+                continue
+            for file in os.scandir(subdir.path):
+                if file.is_file():
+                    stat = file.stat()
+                    rows.append(
+                        (
+                            f"{subdir.name}/{file.name}",
+                            subdir.name,
+                            stat.st_size,
+                            stat.st_mtime,
+                            stat.st_mtime,
+                        )
+                    )
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?, ?)", rows
+        )
+        self._conn.execute("COMMIT")
+
+    def ensure_dir(self, subdir: str) -> None:
+        """
+        Make sure a cache sub-directory exists (checked once per process)
+        """
+
+        if subdir not in self._dirs:
+            os.makedirs(os.path.join(self.cache_dir, subdir), exist_ok=True)
+            self._dirs.add(subdir)
+
+    def lookup(self, key: str, max_age: int) -> bool:
+        """
+        Check if a cached file exists and is not older than max_age
+        """
+
+        now = time.time()
+        with self.lock:
+            row = self._conn.execute(
+                "SELECT mtime, atime FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+
+            # Unknown or expired file
+            if row is None or now - row[0] > max_age:
+                self.misses += 1
+                return False
+
+            # File deleted outside of the manifest
+            if not os.path.isfile(os.path.join(self.cache_dir, key)):
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.misses += 1
+                return False
+
+            # Record the access (coarse, to keep hits read-only most of the time)
+            if now - row[1] > ATIME_RESOLUTION:
+                self._conn.execute(
+                    "UPDATE entries SET atime = ? WHERE key = ?", (now, key)
+                )
+            self.hits += 1
+            return True
+
+    def add(self, key: str, max_size: Optional[int] = None) -> None:
+        """
+        Record a file which has just been written to the cache
+        """
+
+        stat = os.stat(os.path.join(self.cache_dir, key))
+        with self.lock:
+            self._conn.execute(
+                """
+                INSERT INTO entries VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    size = excluded.size, mtime = excluded.mtime, atime = excluded.atime
+                """,
+                (key, key.split("/")[0], stat.st_size, stat.st_mtime, time.time()),
+            )
+
+        # Keep the cache below its size limit
+        if max_size is not None:
+            self.evict_lru(max_size)
+
+    def _remove(self, keys: list) -> None:
+        """
+        Delete files and their manifest entries (lock must be held)
+        """
+
+        for key in keys:
+            try:
+                os.remove(os.path.join(self.cache_dir, key))
+            except FileNotFoundError:
+                pass
+        self._conn.executemany(
+            "DELETE FROM entries WHERE key = ?", [(key,) for key in keys]
+        )
+
+    def evict_expired(
+        self, subdir: str, max_age: int, limit: Optional[int] = None
+    ) -> int:
+        """
+        Remove files of a sub-directory which are older than max_age
+        """
+
+        with self.lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                keys = [
+                    row[0]
+                    for row in self._conn.execute(
+                        "SELECT key FROM entries WHERE subdir = ? AND mtime < ? "
+                        "ORDER BY mtime LIMIT ?",
+                        (subdir, time.time() - max_age, -1 if limit is None else limit),
+                    )
+                ]
+                self._remove(keys)
+            finally:
+                self._conn.execute("COMMIT")
+            self.expired += len(keys)
+            return len(keys)
+
+    def evict_lru(self, max_size: int) -> int:
+        """
+        Remove the least recently used files until the cache fits max_size bytes
+        """
+
+        with self.lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                excess = self._totals()[1] - max_size
+                keys = []
+                if excess > 0:
+                    for key, size in self._conn.execute(
+                        "SELECT key, size FROM entries ORDER BY atime"
+                    ):
+                        keys.append(key)
+                        excess -= size
+                        if excess <= 0:
+                            break
+                self._remove(keys)
+            finally:
+                self._conn.execute("COMMIT")
+            self.evictions += len(keys)
+            return len(keys)
+
+    def _totals(self) -> tuple:
+        return self._conn.execute("SELECT files, bytes FROM totals").fetchone()
+
+    def stats(self) -> dict:
+        """
+        Counters of this process and the size of the whole cache
+        """
+
+        with self.lock:
+            files, size = self._totals()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "files": files,
+            "bytes": size,
+        }
+
+
+# Open manifests by (cache directory, process)
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+
+def get_manifest(cache_dir: str) -> CacheManifest:
+    """
+    Get the manifest of a cache directory
+    """
+
+    # Connections must not be shared with forked worker processes
+    key = (os.path.abspath(cache_dir), os.getpid())
+
+    with _manifests_lock:
+        if key not in _manifests:
+            _manifests[key] = CacheManifest(cache_dir)
+        return _manifests[key]
+
+
+def _split_path(path: str) -> tuple:
+    """
+    Split a local file path into cache directory and manifest key
+    """
+
+    directory, file = os.path.split(path)
+    cache_dir, subdir = os.path.split(directory)
+    return cache_dir, f"{subdir}/{file}"
+
+
+def get_local_file_path(
+    cache_dir: str, cache_subdir: str, path: str, cache_format: str = "pickle"
+) -> str:
     """
     Get the local file path
     """
 
+    if cache_format not in CACHE_FORMATS:
+        raise ValueError(
+            f"Unknown cache format '{cache_format}'. "
+            f"Choose from: {', '.join(CACHE_FORMATS)}"
+        )
+
     # Get file ID
     file = hashlib.md5(path.encode("utf-8")).hexdigest()
 
-    return f"{cache_dir}/{cache_subdir}/{file}"
+    return f"{cache_dir}/{cache_subdir}/{file}{CACHE_FORMATS[cache_format]}"
 
 
 def file_in_cache(path: str, max_age: int = 0) -> bool:
@@ -29,25 +323,155 @@ def file_in_cache(path: str, max_age: int = 0) -> bool:
     Check if a file exists in the local cache
     """
 
-    # Get directory
-    directory = os.path.dirname(path)
+    cache_dir, key = _split_path(path)
+    manifest = get_manifest(cache_dir)
 
     # Make sure the cache directory exists
-    if not os.path.exists(directory):
+    manifest.ensure_dir(key.split("/")[0])
+
+    return manifest.lookup(key, max_age)
+
+
+def save_to_cache(
+    df: pd.DataFrame,
+    path: str,
+    max_size: Optional[int] = None,
+    cache_format: str = "pickle",
+) -> None:
+    """
+    Write a DataFrame to the local cache and record it in the manifest
+    """
+
+    if cache_format == "pickle":
+        df.to_pickle(path)
+
+    else:
+        # pylint: disable=import-outside-toplevel
+        import pyarrow as pa
+
+        # Index levels are stored as regular columns (plus pandas metadata)
         try:
-            os.makedirs(directory)
-        except FileExistsError:
-            pass
+            table = pa.Table.from_pandas(df, preserve_index=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Data Arrow cannot represent is not cached
+            return
+
+        if cache_format == "feather":
+            from pyarrow import feather
+
+            # Uncompressed, so reads can be memory-mapped without copying
+            feather.write_feather(table, path, compression="uncompressed")
+        else:
+            from pyarrow import parquet
+
+            parquet.write_table(table, path, row_group_size=PARQUET_ROW_GROUP_SIZE)
+
+    cache_dir, key = _split_path(path)
+    get_manifest(cache_dir).add(key, max_size)
+
+
+def _arrow_columns(schema, columns: Optional[List[str]]) -> Optional[List[str]]:
+    """
+    Requested columns which exist in a file, plus its index columns
+    """
+
+    if columns is None:
+        return None
+
+    metadata = schema.pandas_metadata or {}
+    index = [col for col in metadata.get("index_columns", []) if isinstance(col, str)]
+
+    return index + [col for col in columns if col in schema.names and col not in index]
+
 
-    # Return the file path if it exists
-    if os.path.isfile(path) and time.time() - os.path.getmtime(path) <= max_age:
-        return True
+def load_from_cache(
+    path: str,
+    cache_format: str = "pickle",
+    columns: Optional[List[str]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> pd.DataFrame:
+    """
+    Read a cached DataFrame
+
+    Arrow formats are memory-mapped and only the requested columns (and,
+    if the data has a time index, only rows between start and end) are
+    loaded. Pickles are always read as a whole.
+    """
+
+    if cache_format == "pickle":
+        return pd.read_pickle(path)
+
+    # pylint: disable=import-outside-toplevel
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if cache_format == "feather":
+        from pyarrow import feather
+
+        # Zero-copy: only the pages of the selected columns are read
+        table = feather.read_table(path, memory_map=True)
+        names = _arrow_columns(table.schema, columns)
+        if names is not None:
+            table = table.select(names)
+
+        # Filter the time range before converting to pandas
+        if start and end and "time" in table.column_names:
+            time_col = table.column("time")
+            if pa.types.is_timestamp(time_col.type):
+                start = _time_bound(start, time_col.type)
+                end = _time_bound(end, time_col.type)
+                table = table.filter(
+                    pc.and_(
+                        pc.greater_equal(time_col, pa.scalar(start, time_col.type)),
+                        pc.less_equal(time_col, pa.scalar(end, time_col.type)),
+                    )
+                )
+
+    else:
+        from pyarrow import parquet
+
+        file = parquet.ParquetFile(path, memory_map=True)
+        schema = file.schema_arrow
+        filters = None
+
+        # Row groups outside the time range are skipped by their statistics
+        if (
+            start
+            and end
+            and "time" in schema.names
+            and pa.types.is_timestamp(schema.field("time").type)
+        ):
+            time_type = schema.field("time").type
+            filters = [
+                ("time", ">=", _time_bound(start, time_type)),
+                ("time", "<=", _time_bound(end, time_type)),
+            ]
+        table = parquet.read_table(
+            path,
+            columns=_arrow_columns(schema, columns),
+            filters=filters,
+            memory_map=True,
+        )
+
+    return table.to_pandas()
 
-    return False
+
+def _time_bound(value: datetime, arrow_type) -> datetime:
+    """
+    Make a time range bound comparable with a timestamp column: time zone
+    aware bounds (e.g. Hourly with a timezone) are converted to naive UTC
+    for naive columns
+    """
+
+    if value.tzinfo is not None and arrow_type.tz is None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return value
 
 
 @classmethod
-def clear_cache(cls, max_age: int = None) -> None:
+def clear_cache(cls, max_age: int = None, limit: Optional[int] = None) -> None:
     """
     Clear the cache
     """
@@ -57,15 +481,20 @@ def clear_cache(cls, max_age: int = None) -> None:
         if max_age is None:
             max_age = cls.max_age
 
-        # Get current time
-        now = time.time()
+        manifest = get_manifest(cls.cache_dir)
 
-        # Go through all files
-        for file in os.listdir(cls.cache_dir + os.sep + cls.cache_subdir):
-            # Get full path
-            path = os.path.join(cls.cache_dir + os.sep + cls.cache_subdir, file)
+        # Remove expired files (at most `limit` per call)
+        manifest.evict_expired(cls.cache_subdir, max_age, limit)
+
+        # Enforce the size limit
+        if cls.max_cache_size is not None:
+            manifest.evict_lru(cls.max_cache_size)
+
+
+@classmethod
+def cache_stats(cls) -> dict:
+    """
+    Get cache counters (hits, misses, expired, evictions) and size
+    """
 
-            # Check if file is older than max_age
-            if now - os.path.getmtime(path) > max_age and os.path.isfile(path):
-                # Delete file
-                os.remove(path)
+    return get_manifest(cls.cache_dir).stats()
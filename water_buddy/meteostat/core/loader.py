@@ -8,14 +8,29 @@ under the terms of the Creative Commons Attribution-NonCommercial
 The code is licensed under the MIT license.
 """
 
+import asyncio
 from io import BytesIO
 from gzip import GzipFile
-from urllib.request import Request, ProxyHandler, build_opener
 from urllib.error import HTTPError
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from multiprocessing import Pool
 from multiprocessing.pool import ThreadPool
-from typing import Callable, List, Optional
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Coroutine,
+    List,
+    Optional,
+    Tuple,
+)
 import pandas as pd
+from meteostat.core.transport import (
+    AsyncTransport,
+    Transport,
+    close_async_transports,
+    get_transport,
+)
 from meteostat.core.warn import warn
 
 
@@ -62,6 +77,74 @@ def processing_handler(
     return pd.concat(filtered) if len(filtered) > 0 else output[0]
 
 
+async def async_processing_handler(
+    datasets: List,
+    download: Callable[..., Awaitable],
+    process: Callable[..., pd.DataFrame],
+    concurrency: int,
+    cores: int,
+    threads: int,
+) -> AsyncIterator[Tuple[tuple, pd.DataFrame]]:
+    """
+    Load multiple datasets asynchronously, yielding (dataset, DataFrame)
+    as they complete
+
+    Up to `concurrency` downloads run at a time in the event loop; their
+    content is processed (decompressed, parsed) in a process or thread pool.
+    """
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    # Worker pool for decompressing and parsing
+    if cores > 1:
+        executor = ProcessPoolExecutor(cores)
+    else:
+        executor = ThreadPoolExecutor(max(threads, 1))
+
+    async def load(dataset: tuple) -> Tuple[tuple, pd.DataFrame]:
+        async with semaphore:
+            content = await download(*dataset)
+        return dataset, await loop.run_in_executor(
+            executor, process, content, *dataset
+        )
+
+    tasks = [asyncio.ensure_future(load(dataset)) for dataset in datasets]
+
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+
+    finally:
+        # Stop early (the consumer stopped iterating or an error occurred)
+        for task in tasks:
+            task.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run_sync(coroutine: Coroutine):
+    """
+    Run a coroutine to completion from synchronous code
+    """
+
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            # The event loop ends here
+            close_async_transports()
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(main())
+
+    # An event loop is running in this thread and asyncio.run() cannot
+    # be nested: run the coroutine in its own loop in another thread
+    with ThreadPoolExecutor(1) as executor:
+        return executor.submit(asyncio.run, main()).result()
+
+
 def load_handler(
     endpoint: str,
     path: str,
@@ -70,34 +153,65 @@ def load_handler(
     dtype: Optional[dict] = None,
     parse_dates: Optional[List] = None,
     default_df: Optional[pd.DataFrame] = None,
+    transport: Optional[Transport] = None,
 ) -> pd.DataFrame:
     """
     Load a single CSV file into a DataFrame
     """
 
-    try:
-        handlers = []
-
-        # Set a proxy
-        if proxy:
-            handlers.append(ProxyHandler({"http": proxy, "https": proxy}))
+    # Shared keep-alive connections (through the proxy, if any)
+    if transport is None:
+        transport = get_transport(proxy)
 
+    try:
         # Read CSV file from Meteostat endpoint
-        with build_opener(*handlers).open(Request(endpoint + path)) as response:
-            # Decompress the content
-            with GzipFile(fileobj=BytesIO(response.read()), mode="rb") as file:
-                df = pd.read_csv(
-                    file,
-                    names=names,
-                    dtype=dtype,
-                    parse_dates=parse_dates,
-                )
+        content = transport.get(endpoint + path)
 
     except (FileNotFoundError, HTTPError):
-        df = default_df if default_df is not None else pd.DataFrame(columns=names)
+        content = b""
+
+        # Display warning
+        warn(f"Cannot load {path} from {endpoint}")
+
+    return parse_handler(content, names, dtype, parse_dates, default_df)
+
+
+async def async_load_handler(
+    endpoint: str, path: str, transport: AsyncTransport
+) -> bytes:
+    """
+    Download a single (compressed) file, empty if it cannot be loaded
+    """
+
+    try:
+        return await transport.get(endpoint + path)
 
+    except (FileNotFoundError, HTTPError):
         # Display warning
         warn(f"Cannot load {path} from {endpoint}")
 
-    # Return DataFrame
-    return df
+        return b""
+
+
+def parse_handler(
+    content: bytes,
+    names: Optional[List] = None,
+    dtype: Optional[dict] = None,
+    parse_dates: Optional[List] = None,
+    default_df: Optional[pd.DataFrame] = None,
+) -> pd.DataFrame:
+    """
+    Read a downloaded CSV file into a DataFrame (default_df if it's empty)
+    """
+
+    if not content:
+        return default_df if default_df is not None else pd.DataFrame(columns=names)
+
+    # Decompress the content
+    with GzipFile(fileobj=BytesIO(content), mode="rb") as file:
+        return pd.read_csv(
+            file,
+            names=names,
+            dtype=dtype,
+            parse_dates=parse_dates,
+        )
@@ -0,0 +1,693 @@
+"""
+Core Class - HTTP Transport
+
+Meteorological data provided by Meteostat (https://dev.meteostat.net)
+under the terms of the Creative Commons Attribution-NonCommercial
+4.0 International Public License.
+
+The code is licensed under the MIT license.
+"""
+
+import os
+import sys
+import ssl
+import time
+import base64
+import random
+import asyncio
+import threading
+import weakref
+from email.parser import Parser
+from http import client
+from queue import Empty, LifoQueue
+from typing import Optional, Tuple
+from urllib.error import HTTPError, URLError
+from urllib.parse import SplitResult, unquote, urljoin, urlsplit
+from urllib.request import getproxies, proxy_bypass, url2pathname
+
+# Default settings (see Base.http_*)
+DEFAULTS = {
+    # Maximum number of connections per host (idle or in use)
+    "pool_size": 10,
+    # Socket timeout in seconds (connect and each read)
+    "timeout": 30.0,
+    # Retries after a transient error
+    "retries": 3,
+    # Delay before the first retry in seconds (doubled for each retry)
+    "backoff": 0.5,
+    # Upper bound for a single delay in seconds
+    "max_backoff": 10.0,
+}
+
+# Responses which are worth retrying
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Responses which point elsewhere
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+
+# Same User-Agent as urllib, which was used before
+USER_AGENT = f"Python-urllib/{sys.version_info[0]}.{sys.version_info[1]}"
+
+# Errors of a single attempt which are worth retrying
+TRANSIENT_ERRORS = (client.HTTPException, OSError, EOFError, asyncio.TimeoutError)
+
+
+def _proxy_headers(proxy: Optional[SplitResult]) -> dict:
+    """
+    Proxy-Authorization header for proxies with credentials
+    """
+
+    if not proxy or not proxy.username:
+        return {}
+
+    username = unquote(proxy.username)
+    password = unquote(proxy.password or "")
+    credentials = f"{username}:{password}"
+    token = base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+
+    return {"Proxy-Authorization": f"Basic {token}"}
+
+
+def _request_headers(
+    scheme: str, host: str, port: Optional[int], target: str, proxy
+) -> Tuple[str, dict]:
+    """
+    Request target and headers of a GET (absolute URL for plain HTTP proxies)
+    """
+
+    headers = {"User-Agent": USER_AGENT, "Connection": "keep-alive"}
+    if proxy is not None and scheme == "http":
+        netloc = host if port is None else f"{host}:{port}"
+        target = f"http://{netloc}{target}"
+        headers.update(_proxy_headers(proxy))
+
+    return target, headers
+
+
+class ConnectionPool:
+    """
+    Keep-alive connections to a single host, shared by all threads
+    """
+
+    def __init__(
+        self,
+        scheme: str,
+        host: str,
+        port: Optional[int],
+        proxy: Optional[str],
+        size: int,
+        timeout: float,
+    ) -> None:
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.size = size
+        self.timeout = timeout
+        self.proxy = urlsplit(proxy) if proxy else None
+        self._idle = LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+        # Counters
+        self.opened = 0
+        self.reused = 0
+
+    def _connect(self) -> client.HTTPConnection:
+        """
+        Open a new connection (through the proxy, if any)
+        """
+
+        with self._lock:
+            self.opened += 1
+
+        if self.proxy is None:
+            if self.scheme == "https":
+                return client.HTTPSConnection(
+                    self.host, self.port, timeout=self.timeout, context=_ssl_context()
+                )
+            return client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+        if self.scheme == "https":
+            # Tunnel TLS through the proxy (CONNECT)
+            conn = client.HTTPSConnection(
+                self.proxy.hostname,
+                self.proxy.port,
+                timeout=self.timeout,
+                context=_ssl_context(),
+            )
+            conn.set_tunnel(self.host, self.port, headers=_proxy_headers(self.proxy))
+            return conn
+
+        # Plain HTTP: requests are sent to the proxy with absolute URLs
+        return client.HTTPConnection(
+            self.proxy.hostname, self.proxy.port, timeout=self.timeout
+        )
+
+    def request(self, target: str) -> Tuple[int, str, client.HTTPMessage, bytes]:
+        """
+        GET a path on this host and return status, reason, headers and body
+        """
+
+        target, headers = _request_headers(
+            self.scheme, self.host, self.port, target, self.proxy
+        )
+
+        with self._slots:
+            while True:
+                try:
+                    conn, reused = self._idle.get_nowait(), True
+                except Empty:
+                    conn, reused = self._connect(), False
+
+                try:
+                    conn.request("GET", target, headers=headers)
+                    response = conn.getresponse()
+                    body = response.read()
+                except (client.HTTPException, OSError):
+                    conn.close()
+
+                    # The server closed an idle connection: try a fresh one
+                    if reused:
+                        continue
+                    raise
+
+                if reused:
+                    with self._lock:
+                        self.reused += 1
+
+                if response.will_close:
+                    conn.close()
+                else:
+                    self._idle.put(conn)
+
+                return response.status, response.reason, response.headers, body
+
+    def close(self) -> None:
+        """
+        Close all idle connections
+        """
+
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                return
+
+
+class AsyncConnectionPool(ConnectionPool):
+    """
+    Keep-alive connections to a single host, shared by all tasks of an
+    event loop (asyncio streams)
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._idle = []
+        self._slots = asyncio.Semaphore(self.size)
+
+    @property
+    def _default_port(self) -> int:
+        return 443 if self.scheme == "https" else 80
+
+    async def _read_head(
+        self, reader: asyncio.StreamReader
+    ) -> Tuple[str, int, str, client.HTTPMessage]:
+        """
+        Read the status line and headers of a response
+        """
+
+        line = await reader.readline()
+        if not line:
+            raise client.RemoteDisconnected("Remote end closed connection")
+
+        parts = line.decode("iso-8859-1").rstrip("\r\n").split(" ", 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+            raise client.BadStatusLine(line)
+
+        lines = []
+        while True:
+            header = await reader.readline()
+            if header in (b"\r\n", b"\n", b""):
+                break
+            lines.append(header.decode("iso-8859-1"))
+
+        headers = Parser(_class=client.HTTPMessage).parsestr("".join(lines))
+
+        return parts[0], int(parts[1]), parts[2] if len(parts) > 2 else "", headers
+
+    async def _connect(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """
+        Open a new connection (through the proxy, if any)
+        """
+
+        with self._lock:
+            self.opened += 1
+
+        port = self.port or self._default_port
+        tls = _ssl_context() if self.scheme == "https" else None
+
+        if self.proxy is None:
+            return await asyncio.open_connection(
+                self.host, port, ssl=tls, server_hostname=self.host if tls else None
+            )
+
+        reader, writer = await asyncio.open_connection(
+            self.proxy.hostname, self.proxy.port or 80
+        )
+
+        if self.scheme == "https":
+            # Tunnel TLS through the proxy (CONNECT)
+            headers = {"Host": f"{self.host}:{port}", **_proxy_headers(self.proxy)}
+            writer.write(
+                (
+                    f"CONNECT {self.host}:{port} HTTP/1.1\r\n"
+                    + "".join(f"{key}: {value}\r\n" for key, value in headers.items())
+                    + "\r\n"
+                ).encode("iso-8859-1")
+            )
+            await writer.drain()
+            _, status, reason, _ = await self._read_head(reader)
+            if status != 200:
+                writer.close()
+                raise OSError(f"Tunnel connection failed: {status} {reason}")
+            if not hasattr(writer, "start_tls"):
+                writer.close()
+                raise OSError("HTTPS through a proxy requires Python 3.11+ in async")
+            await writer.start_tls(tls, server_hostname=self.host)
+
+        return reader, writer
+
+    async def _exchange(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        target: str,
+        headers: dict,
+    ) -> Tuple[int, str, client.HTTPMessage, bytes, bool]:
+        """
+        Send a GET and read the response (and whether to keep the connection)
+        """
+
+        port = self.port or self._default_port
+        host = self.host if port == self._default_port else f"{self.host}:{port}"
+        writer.write(
+            (
+                f"GET {target} HTTP/1.1\r\nHost: {host}\r\n"
+                + "".join(f"{key}: {value}\r\n" for key, value in headers.items())
+                + "\r\n"
+            ).encode("iso-8859-1")
+        )
+        await writer.drain()
+
+        # Skip interim (1xx) responses
+        status = 100
+        while 100 <= status < 200:
+            version, status, reason, response_headers = await self._read_head(reader)
+
+        # Read the body
+        keep_alive = version == "HTTP/1.1"
+        connection = response_headers.get("Connection", "").lower()
+        if connection == "close":
+            keep_alive = False
+        elif connection == "keep-alive":
+            keep_alive = True
+
+        if response_headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    # Trailers
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b"".join(chunks)
+        elif response_headers.get("Content-Length"):
+            body = await reader.readexactly(int(response_headers["Content-Length"]))
+        else:
+            body = await reader.read()
+            keep_alive = False
+
+        return status, reason, response_headers, body, keep_alive
+
+    async def request(self, target: str) -> Tuple[int, str, client.HTTPMessage, bytes]:
+        """
+        GET a path on this host and return status, reason, headers and body
+        """
+
+        target, headers = _request_headers(
+            self.scheme, self.host, self.port, target, self.proxy
+        )
+
+        async with self._slots:
+            while True:
+                if self._idle:
+                    (reader, writer), reused = self._idle.pop(), True
+                else:
+                    reader, writer = await asyncio.wait_for(
+                        self._connect(), self.timeout
+                    )
+                    reused = False
+
+                try:
+                    status, reason, headers_, body, keep_alive = await asyncio.wait_for(
+                        self._exchange(reader, writer, target, headers), self.timeout
+                    )
+                except TRANSIENT_ERRORS:
+                    writer.close()
+
+                    # The server closed an idle connection: try a fresh one
+                    if reused:
+                        continue
+                    raise
+
+                if reused:
+                    with self._lock:
+                        self.reused += 1
+
+                if keep_alive:
+                    self._idle.append((reader, writer))
+                else:
+                    writer.close()
+
+                return status, reason, headers_, body
+
+    def close(self) -> None:
+        """
+        Close all idle connections
+        """
+
+        while self._idle:
+            self._idle.pop()[1].close()
+
+
+def _check_response(
+    url: str, status: int, reason: str, headers: client.HTTPMessage, redirects: int
+) -> Tuple[Optional[str], Optional[HTTPError]]:
+    """
+    Handle an unsuccessful response: return the URL of a redirect or the
+    error of a transient failure, raise the error otherwise
+    """
+
+    if status in REDIRECT_STATUSES and headers.get("Location"):
+        if redirects >= MAX_REDIRECTS:
+            raise HTTPError(url, status, "Too many redirects", headers, None)
+        return urljoin(url, headers["Location"]), None
+
+    failure = HTTPError(url, status, reason, headers, None)
+    if status not in RETRY_STATUSES:
+        raise failure
+
+    return None, failure
+
+
+def _split_url(url: str) -> Tuple[SplitResult, str]:
+    """
+    Split a HTTP(S) URL into its parts and the request target
+    """
+
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https"):
+        raise URLError(f"unsupported URL scheme '{parts.scheme}'")
+
+    target = parts.path or "/"
+    if parts.query:
+        target += "?" + parts.query
+
+    return parts, target
+
+
+class Transport:
+    """
+    HTTP GET with per-host connection pools, retries and exponential backoff
+    """
+
+    # Connection pool class (one pool per host)
+    pool_class = ConnectionPool
+
+    def __init__(self, proxy: Optional[str] = None, **settings) -> None:
+        self.proxy = proxy
+        self.settings = {**DEFAULTS, **settings}
+        self._pools = {}
+        self._lock = threading.Lock()
+
+        # Counters
+        self.requests = 0
+        self.retries = 0
+
+    def _proxy_for(self, parts: SplitResult) -> Optional[str]:
+        """
+        Proxy for a host: the configured one or, like urllib, the one from the
+        environment (HTTP_PROXY, HTTPS_PROXY), unless NO_PROXY excludes the host
+        """
+
+        proxy = self.proxy or getproxies().get(parts.scheme)
+        host = parts.hostname
+        if parts.port is not None:
+            host = f"{host}:{parts.port}"
+        if not proxy or proxy_bypass(host):
+            return None
+
+        # Proxies without a scheme (e.g. "proxy:3128") are HTTP proxies
+        return proxy if "://" in proxy else f"http://{proxy}"
+
+    def _pool(self, parts: SplitResult) -> ConnectionPool:
+        """
+        Get the connection pool of a host
+        """
+
+        key = (parts.scheme, parts.hostname, parts.port)
+        with self._lock:
+            if key not in self._pools:
+                self._pools[key] = self.pool_class(
+                    *key,
+                    self._proxy_for(parts),
+                    self.settings["pool_size"],
+                    self.settings["timeout"],
+                )
+            return self._pools[key]
+
+    def _delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """
+        Seconds to wait before a retry (exponential with jitter),
+        None if there are no retries left
+        """
+
+        if attempt >= self.settings["retries"]:
+            return None
+
+        with self._lock:
+            self.retries += 1
+
+        delay = self.settings["backoff"] * 2**attempt
+        delay *= random.uniform(0.5, 1.0)
+
+        # Respect Retry-After (in seconds) if the server sent one
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, int(retry_after))
+
+        return min(delay, self.settings["max_backoff"])
+
+    def get(self, url: str) -> bytes:
+        """
+        Download a URL and return the response body
+
+        Raises HTTPError for unsuccessful responses (after retrying
+        transient ones), URLError if the server cannot be reached and
+        FileNotFoundError for missing files under file:// URLs.
+        """
+
+        redirects = 0
+        attempt = 0
+
+        while True:
+            # Local mirror of an endpoint
+            if url.startswith("file:"):
+                with open(url2pathname(urlsplit(url).path), "rb") as file:
+                    return file.read()
+
+            parts, target = _split_url(url)
+
+            with self._lock:
+                self.requests += 1
+            retry_after = None
+            try:
+                status, reason, headers, body = self._pool(parts).request(target)
+            except TRANSIENT_ERRORS as error:
+                # Connection refused or reset, timeout, malformed response
+                failure = URLError(error)
+            else:
+                if status == 200:
+                    return body
+
+                location, failure = _check_response(
+                    url, status, reason, headers, redirects
+                )
+                if location:
+                    url = location
+                    redirects += 1
+                    continue
+                retry_after = headers.get("Retry-After")
+
+            # Transient error: back off and try again
+            delay = self._delay(attempt, retry_after)
+            if delay is None:
+                raise failure
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self) -> None:
+        """
+        Close all idle connections
+        """
+
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+
+    def stats(self) -> dict:
+        """
+        Requests, retries and connections opened/reused so far
+        """
+
+        with self._lock:
+            pools = list(self._pools.values())
+
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "connections_opened": sum(pool.opened for pool in pools),
+            "connections_reused": sum(pool.reused for pool in pools),
+        }
+
+
+class AsyncTransport(Transport):
+    """
+    Transport for asyncio: same pools, retries and backoff, without threads
+
+    Connections belong to the event loop the transport is used in.
+    """
+
+    pool_class = AsyncConnectionPool
+
+    async def get(self, url: str) -> bytes:
+        """
+        Download a URL and return the response body (see Transport.get)
+        """
+
+        redirects = 0
+        attempt = 0
+
+        while True:
+            # Local mirror of an endpoint
+            if url.startswith("file:"):
+                with open(url2pathname(urlsplit(url).path), "rb") as file:
+                    return file.read()
+
+            parts, target = _split_url(url)
+
+            with self._lock:
+                self.requests += 1
+            retry_after = None
+            try:
+                status, reason, headers, body = await self._pool(parts).request(
+                    target
+                )
+            except TRANSIENT_ERRORS as error:
+                # Connection refused or reset, timeout, malformed response
+                failure = URLError(error)
+            else:
+                if status == 200:
+                    return body
+
+                location, failure = _check_response(
+                    url, status, reason, headers, redirects
+                )
+                if location:
+                    url = location
+                    redirects += 1
+                    continue
+                retry_after = headers.get("Retry-After")
+
+            # Transient error: back off and try again
+            delay = self._delay(attempt, retry_after)
+            if delay is None:
+                raise failure
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+_ssl_contexts = {}
+
+
+def _ssl_context() -> ssl.SSLContext:
+    """
+    Shared default TLS context (loading the CA store is expensive)
+    """
+
+    pid = os.getpid()
+    if pid not in _ssl_contexts:
+        _ssl_contexts[pid] = ssl.create_default_context()
+    return _ssl_contexts[pid]
+
+
+def _transport_key(proxy: Optional[str], settings: dict) -> tuple:
+    """
+    Key of a shared transport
+    """
+
+    unknown = set(settings) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown transport setting(s): {', '.join(sorted(unknown))}")
+
+    return (proxy, tuple(sorted(settings.items())))
+
+
+# Transports by process, proxy and settings
+_transports = {}
+_transports_lock = threading.Lock()
+
+# Async transports by event loop, proxy and settings
+_async_transports = weakref.WeakKeyDictionary()
+
+
+def get_transport(proxy: Optional[str] = None, **settings) -> Transport:
+    """
+    Get the shared transport for a proxy (or direct connections)
+
+    Settings: pool_size, timeout, retries, backoff and max_backoff
+    """
+
+    # Sockets must not be shared with forked worker processes
+    key = (os.getpid(), *_transport_key(proxy, settings))
+
+    with _transports_lock:
+        if key not in _transports:
+            _transports[key] = Transport(proxy, **settings)
+        return _transports[key]
+
+
+def get_async_transport(proxy: Optional[str] = None, **settings) -> AsyncTransport:
+    """
+    Get the shared transport of the running event loop for a proxy
+    (or direct connections)
+    """
+
+    key = _transport_key(proxy, settings)
+    transports = _async_transports.setdefault(asyncio.get_running_loop(), {})
+
+    if key not in transports:
+        transports[key] = AsyncTransport(proxy, **settings)
+    return transports[key]
+
+
+def close_async_transports() -> None:
+    """
+    Close the idle connections of the running event loop
+    """
+
+    for transport in _async_transports.pop(asyncio.get_running_loop(), {}).values():
+        transport.close()
@@ -10,6 +10,12 @@ The code is licensed under the MIT license.
 
 import os
 from typing import Optional
+from meteostat.core.transport import (
+    AsyncTransport,
+    Transport,
+    get_async_transport,
+    get_transport,
+)
 
 
 class Base:
@@ -21,6 +27,7 @@ class Base:
     endpoint = "https://bulk.meteostat.net/v2/"
 
     # Proxy URL for the Meteostat (bulk) data interface
+    # (None = HTTP_PROXY/HTTPS_PROXY and NO_PROXY from the environment)
     proxy: Optional[str] = None
 
     # Location of the cache directory
@@ -32,8 +39,55 @@ class Base:
     # Maximum age of a cached file in seconds
     max_age = 24 * 60 * 60
 
+    # Maximum total size of the cache directory in bytes (None = no limit)
+    max_cache_size: Optional[int] = None
+
+    # Format of cached files: "pickle", "feather" or "parquet"
+    # (Arrow formats require pyarrow and are read column by column)
+    cache_format = "pickle"
+
     # Number of processes used for processing files
     processes = 1
 
     # Number of threads used for processing files
     threads = 1
+
+    # Connections per host kept open for reuse (shared by all threads)
+    http_pool_size = 10
+
+    # Timeout of HTTP requests in seconds
+    http_timeout = 30
+
+    # Retries after a transient HTTP error (connection problems, 429, 5xx)
+    http_retries = 3
+
+    # Delay before the first retry in seconds (doubled for each retry)
+    http_backoff = 0.5
+
+    # How time series are downloaded: "sync" (when they are created) or
+    # "async" (on afetch(), by an asyncio event loop with up to
+    # http_pool_size downloads at a time)
+    fetch_mode = "sync"
+
+    @property
+    def _transport_settings(self) -> dict:
+        return {
+            "pool_size": self.http_pool_size,
+            "timeout": self.http_timeout,
+            "retries": self.http_retries,
+            "backoff": self.http_backoff,
+        }
+
+    def _get_transport(self) -> Transport:
+        """
+        Get the shared HTTP transport for the current settings
+        """
+
+        return get_transport(self.proxy, **self._transport_settings)
+
+    def _get_async_transport(self) -> AsyncTransport:
+        """
+        Get the HTTP transport of the running event loop for the current settings
+        """
+
+        return get_async_transport(self.proxy, **self._transport_settings)
@@ -12,7 +12,7 @@ The code is licensed under the MIT license.
 """
 
 from collections.abc import Callable
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Union
 import pandas as pd
 from meteostat.enumerations.granularity import Granularity
 from meteostat.core.loader import processing_handler
@@ -33,6 +33,10 @@ class MeteoData(Base):
     # The data frame
     _data: pd.DataFrame = pd.DataFrame()
 
+    # Ranges of years (first, last) which can contain data, per weather station
+    # (stations which are missing are not pruned)
+    _inventory: Optional[Dict[str, List[tuple]]] = None
+
     @property
     def _raw_columns(self) -> List[str]:
         """
@@ -87,6 +91,26 @@ class MeteoData(Base):
             if isinstance(v, Callable)
         }
 
+    def _station_years(self, station: str) -> List[int]:
+        """
+        Get the requested years which can contain data for a weather station
+        """
+
+        # Unknown station: load every year
+        if self._inventory is None or station not in self._inventory:
+            return self._annual_steps
+
+        ranges = self._inventory[station]
+
+        return [
+            year
+            for year in self._annual_steps
+            if any(
+                (first is None or year >= first) and (last is None or year <= last)
+                for first, last in ranges
+            )
+        ]
+
     def _get_datasets(self) -> list:
         """
         Get list of datasets
@@ -96,7 +120,7 @@ class MeteoData(Base):
             datasets = [
                 (str(station), year)
                 for station in self._stations
-                for year in self._annual_steps
+                for year in self._station_years(str(station))
             ]
         else:
             datasets = [(str(station),) for station in self._stations]
@@ -113,9 +137,10 @@ class MeteoData(Base):
             datasets = self._get_datasets()
 
             # Data Processings
-            return processing_handler(
-                datasets, self._load_data, self.processes, self.threads
-            )
+            if len(datasets) > 0:
+                return processing_handler(
+                    datasets, self._load_data, self.processes, self.threads
+                )
 
         # Empty DataFrame
         return pd.DataFrame(columns=self._processed_columns)
@@ -13,7 +13,13 @@ from typing import Optional, Union
 from datetime import datetime
 import numpy as np
 import pandas as pd
-from meteostat.core.cache import file_in_cache, get_local_file_path
+from meteostat.core.cache import (
+    AUTOCLEAN_BATCH,
+    file_in_cache,
+    get_local_file_path,
+    load_from_cache,
+    save_to_cache,
+)
 from meteostat.core.loader import load_handler
 from meteostat.utilities.endpoint import generate_endpoint_path
 from meteostat.enumerations.granularity import Granularity
@@ -74,12 +80,14 @@ class Normals(MeteoData):
         file = generate_endpoint_path(self.granularity, station, year)
 
         # Get local file path
-        path = get_local_file_path(self.cache_dir, self.cache_subdir, file)
+        path = get_local_file_path(
+            self.cache_dir, self.cache_subdir, file, self.cache_format
+        )
 
         # Check if file in cache
         if self.max_age > 0 and file_in_cache(path, self.max_age):
             # Read cached data
-            df = pd.read_pickle(path)
+            df = load_from_cache(path, self.cache_format)
 
         else:
             # Get data from Meteostat
@@ -88,6 +96,7 @@ class Normals(MeteoData):
                 file,
                 self.proxy,
                 self._columns,
+                transport=self._get_transport(),
             )
 
             # Validate and prepare data for further processing
@@ -100,7 +109,7 @@ class Normals(MeteoData):
 
             # Save as Pickle
             if self.max_age > 0:
-                df.to_pickle(path)
+                save_to_cache(df, path, self.max_cache_size, self.cache_format)
 
         # Filter time period and append to DataFrame
         if self.granularity == Granularity.NORMALS and not df.empty and self._end:
@@ -157,7 +166,7 @@ class Normals(MeteoData):
 
         # Clear cache
         if self.max_age > 0 and self.autoclean:
-            self.clear_cache()
+            self.clear_cache(limit=AUTOCLEAN_BATCH)
 
     def normalize(self):
         """
@@ -242,4 +251,4 @@ class Normals(MeteoData):
     # Import methods
     from meteostat.series.convert import convert
     from meteostat.series.count import count
-    from meteostat.core.cache import clear_cache
+    from meteostat.core.cache import clear_cache, cache_stats
@@ -12,7 +12,12 @@ from copy import copy
 from datetime import datetime, timedelta
 from typing import Union
 import pandas as pd
-from meteostat.core.cache import get_local_file_path, file_in_cache
+from meteostat.core.cache import (
+    get_local_file_path,
+    file_in_cache,
+    load_from_cache,
+    save_to_cache,
+)
 from meteostat.core.loader import load_handler
 from meteostat.interface.base import Base
 from meteostat.utilities.helpers import get_distance
@@ -75,12 +80,14 @@ class Stations(Base):
         file = "stations/slim.csv.gz"
 
         # Get local file path
-        path = get_local_file_path(self.cache_dir, self.cache_subdir, file)
+        path = get_local_file_path(
+            self.cache_dir, self.cache_subdir, file, self.cache_format
+        )
 
         # Check if file in cache
         if self.max_age > 0 and file_in_cache(path, self.max_age):
             # Read cached data
-            df = pd.read_pickle(path)
+            df = load_from_cache(path, self.cache_format)
 
         else:
             # Get data from Meteostat
@@ -91,6 +98,7 @@ class Stations(Base):
                 self._columns,
                 self._types,
                 self._parse_dates,
+                transport=self._get_transport(),
             )
 
             # Add index
@@ -98,7 +106,7 @@ class Stations(Base):
 
             # Save as Pickle
             if self.max_age > 0:
-                df.to_pickle(path)
+                save_to_cache(df, path, self.max_cache_size, self.cache_format)
 
         # Set data
         self._data = df
@@ -249,4 +257,4 @@ class Stations(Base):
         return temp
 
     # Import additional methods
-    from meteostat.core.cache import clear_cache
+    from meteostat.core.cache import clear_cache, cache_stats
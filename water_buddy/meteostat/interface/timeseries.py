@@ -8,17 +8,32 @@ under the terms of the Creative Commons Attribution-NonCommercial
 The code is licensed under the MIT license.
 """
 
-from datetime import datetime
-from typing import Optional, Union
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Union
 import pandas as pd
-from meteostat.core.cache import file_in_cache, get_local_file_path
-from meteostat.core.loader import load_handler
+from meteostat.core.cache import (
+    AUTOCLEAN_BATCH,
+    file_in_cache,
+    get_local_file_path,
+    load_from_cache,
+    save_to_cache,
+)
+from meteostat.core.loader import (
+    async_load_handler,
+    async_processing_handler,
+    load_handler,
+    parse_handler,
+    run_sync,
+)
+from meteostat.core.transport import TRANSIENT_ERRORS
+from meteostat.core.warn import warn
 from meteostat.enumerations.granularity import Granularity
 from meteostat.utilities.endpoint import generate_endpoint_path
 from meteostat.utilities.mutations import filter_time, localize
 from meteostat.utilities.validations import validate_series
 from meteostat.utilities.helpers import get_flag_from_source_factory, with_suffix
 from meteostat.interface.point import Point
+from meteostat.interface.stations import Stations
 from meteostat.interface.meteodata import MeteoData
 
 
@@ -46,20 +61,69 @@ class TimeSeries(MeteoData):
     # Fetch source flags?
     _flags = False
 
-    def _load_data(self, station: str, year: Optional[int] = None) -> None:
+    # Skip station-years outside the weather stations' inventory?
+    prune_by_inventory = True
+
+    # Model data is available for this many recent days, regardless of inventory
+    _model_data_days = 180
+
+    # Geo point and its weather stations, until the data is loaded
+    # asynchronously (fetch_mode = "async")
+    _pending: Optional[tuple] = None
+
+    # The time series
+    _frame: pd.DataFrame = pd.DataFrame()
+
+    @property
+    def _data(self) -> pd.DataFrame:
         """
-        Load file for a single station from Meteostat
+        The time series (fetch_mode = "async": loaded on first use unless
+        afetch() loaded it already)
+        """
+        if self._pending is not None:
+            run_sync(self._aload())
+        return self._frame
+
+    @_data.setter
+    def _data(self, value: pd.DataFrame) -> None:
+        self._frame = value
+
+    def _get_file_paths(self, station: str, year: Optional[int] = None) -> tuple:
+        """
+        Get the endpoint path and the local path of a file
         """
         # File name
         file = generate_endpoint_path(self.granularity, station, year)
 
         # Get local file path
-        path = get_local_file_path(self.cache_dir, self.cache_subdir, file)
+        path = get_local_file_path(
+            self.cache_dir, self.cache_subdir, file, self.cache_format
+        )
+
+        return file, path
+
+    @property
+    def _default_df(self) -> pd.DataFrame:
+        """
+        Raw DataFrame of a file which can't be loaded
+        """
+        return pd.DataFrame(
+            columns=self._raw_columns + with_suffix(self._raw_columns, "_source")
+        )
+
+    def _load_data(self, station: str, year: Optional[int] = None) -> None:
+        """
+        Load file for a single station from Meteostat
+        """
+        # File name and local file path
+        file, path = self._get_file_paths(station, year)
 
         # Check if file in cache
         if self.max_age > 0 and file_in_cache(path, self.max_age):
-            # Read cached data
-            df = pd.read_pickle(path)
+            # Read cached data (only the columns and period needed)
+            df = load_from_cache(
+                path, self.cache_format, self._cached_columns, self._start, self._end
+            )
 
         else:
             # Get data from Meteostat
@@ -67,64 +131,105 @@ class TimeSeries(MeteoData):
                 self.endpoint,
                 file,
                 self.proxy,
-                default_df=pd.DataFrame(
-                    columns=self._raw_columns
-                    + with_suffix(self._raw_columns, "_source")
-                ),
+                default_df=self._default_df,
+                transport=self._get_transport(),
             )
+            df = self._prepare_data(df, station, path)
 
-            # Add time column and drop original columns
-            if len(self._parse_dates) < 3:
-                df["day"] = 1
+        return self._select_period(df)
 
-            df["time"] = pd.to_datetime(
-                df[
-                    (
-                        self._parse_dates
-                        if len(self._parse_dates) > 2
-                        else self._parse_dates + ["day"]
-                    )
-                ]
-            )
-            df = df.drop(self._parse_dates, axis=1)
-
-            # Validate and prepare data for further processing
-            df = validate_series(df, station)
-
-            # Rename columns
-            df = df.rename(columns=self._renamed_columns, errors="ignore")
-
-            # Convert sources to flags
-            for col in df.columns:
-                basecol = col[:-7] if col.endswith("_source") else col
-
-                if basecol not in self._processed_columns:
-                    df.drop(col, axis=1, inplace=True)
-                    continue
-
-                if basecol == col:
-                    df[col] = df[col].astype("Float64")
-
-                if col.endswith("_source"):
-                    flagcol = f"{basecol}_flag"
-                    df[flagcol] = pd.NA
-                    df[flagcol] = df[flagcol].astype("string")
-                    mask = df[col].notna()
-                    df.loc[mask, flagcol] = df.loc[mask, col].apply(
-                        get_flag_from_source_factory(
-                            self._source_mappings, self._model_flag
-                        )
+    async def _adownload_data(
+        self, station: str, year: Optional[int] = None
+    ) -> Optional[bytes]:
+        """
+        Download file for a single station from Meteostat (None if it's cached)
+        """
+        file, path = self._get_file_paths(station, year)
+
+        if self.max_age > 0 and file_in_cache(path, self.max_age):
+            return None
+
+        return await async_load_handler(
+            self.endpoint, file, self._get_async_transport()
+        )
+
+    def _process_data(
+        self, content: Optional[bytes], station: str, year: Optional[int] = None
+    ) -> pd.DataFrame:
+        """
+        Process a downloaded file for a single station
+        """
+        # Cached file
+        if content is None:
+            return self._load_data(station, year)
+
+        _, path = self._get_file_paths(station, year)
+        df = parse_handler(content, default_df=self._default_df)
+
+        return self._select_period(self._prepare_data(df, station, path))
+
+    def _prepare_data(self, df: pd.DataFrame, station: str, path: str) -> pd.DataFrame:
+        """
+        Prepare raw data of a single station and save it to the cache
+        """
+        # Add time column and drop original columns
+        if len(self._parse_dates) < 3:
+            df["day"] = 1
+
+        df["time"] = pd.to_datetime(
+            df[
+                (
+                    self._parse_dates
+                    if len(self._parse_dates) > 2
+                    else self._parse_dates + ["day"]
+                )
+            ]
+        )
+        df = df.drop(self._parse_dates, axis=1)
+
+        # Validate and prepare data for further processing
+        df = validate_series(df, station)
+
+        # Rename columns
+        df = df.rename(columns=self._renamed_columns, errors="ignore")
+
+        # Convert sources to flags
+        for col in df.columns:
+            basecol = col[:-7] if col.endswith("_source") else col
+
+            if basecol not in self._processed_columns:
+                df.drop(col, axis=1, inplace=True)
+                continue
+
+            if basecol == col:
+                df[col] = df[col].astype("Float64")
+
+            if col.endswith("_source"):
+                flagcol = f"{basecol}_flag"
+                df[flagcol] = pd.NA
+                df[flagcol] = df[flagcol].astype("string")
+                mask = df[col].notna()
+                df.loc[mask, flagcol] = df.loc[mask, col].apply(
+                    get_flag_from_source_factory(
+                        self._source_mappings, self._model_flag
                     )
-                    df.drop(col, axis=1, inplace=True)
+                )
+                df.drop(col, axis=1, inplace=True)
 
-            # Process virtual columns
-            for key, value in self._virtual_columns.items():
-                df = value(df, key)
+        # Process virtual columns
+        for key, value in self._virtual_columns.items():
+            df = value(df, key)
 
-            # Save as Pickle
-            if self.max_age > 0:
-                df.to_pickle(path)
+        # Save as Pickle
+        if self.max_age > 0:
+            save_to_cache(df, path, self.max_cache_size, self.cache_format)
 
+        return df
+
+    def _select_period(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Localize and filter the data of a single station
+        """
         # Localize time column
         if (
             self.granularity == Granularity.HOURLY
@@ -139,6 +244,71 @@ class TimeSeries(MeteoData):
         # Return
         return df
 
+    @property
+    def _cached_columns(self) -> List[str]:
+        """
+        Get the list of columns to read from cached files
+        """
+        # Flags are needed if requested or to remove model data
+        if self._flags or not self._model:
+            return self._processed_columns + with_suffix(
+                self._processed_columns, "_flag"
+            )
+        return self._processed_columns
+
+    def _get_inventory(
+        self, stations: Optional[pd.DataFrame] = None
+    ) -> Optional[Dict[str, List[tuple]]]:
+        """
+        Get the ranges of years which can contain data for each weather station
+        """
+
+        if not self.prune_by_inventory or self.granularity not in (
+            Granularity.HOURLY,
+            Granularity.DAILY,
+        ):
+            return None
+
+        columns = [f"{self.granularity.value}_start", f"{self.granularity.value}_end"]
+
+        # Look up stations which were passed by ID (without an inventory,
+        # downloads are not pruned)
+        if stations is None or not set(columns).issubset(stations.columns):
+            try:
+                stations = Stations().fetch()
+            except TRANSIENT_ERRORS as error:
+                warn(f"Cannot load the weather station inventory: {error}")
+                return None
+            if not set(columns).issubset(stations.columns):
+                return None
+
+        # Only the requested weather stations
+        stations = stations.loc[stations.index.intersection(self._stations)]
+
+        # Recent model data and forecasts (not part of the inventory)
+        model_years = []
+        if self._model:
+            since = datetime.now() - timedelta(days=self._model_data_days)
+            model_years.append((since.year, None))
+
+        # Observations, allowing for the inventory's update delay
+        first = pd.to_datetime(stations[columns[0]], errors="coerce").dt.year
+        last = (
+            pd.to_datetime(stations[columns[1]], errors="coerce")
+            + timedelta(seconds=self.max_age)
+        ).dt.year
+
+        inventory = {}
+        for station, start, end in zip(
+            stations.index.astype(str), first.tolist(), last.tolist()
+        ):
+            ranges = list(model_years)
+            if not pd.isna(start):
+                ranges.append((int(start), None if pd.isna(end) else int(end)))
+            inventory[station] = ranges
+
+        return inventory
+
     def _filter_model(self) -> None:
         """
         Remove model data from time series
@@ -172,13 +342,16 @@ class TimeSeries(MeteoData):
         # if location is a geographical point
         if isinstance(loc, pd.DataFrame):
             self._stations = loc.index
+            inventory = loc
         elif isinstance(loc, Point):
             stations = loc.get_stations("daily", start, end, model)
             self._stations = stations.index
+            inventory = stations
         else:
             if not isinstance(loc, list):
                 loc = [loc]
             self._stations = pd.Index(loc)
+            inventory = None
 
         # Preserve settings
         self._start = start if self._start is None else self._start
@@ -186,8 +359,31 @@ class TimeSeries(MeteoData):
         self._model = model
         self._flags = flags
 
+        # Only plan downloads of years which can contain data
+        self._inventory = self._get_inventory(inventory)
+
+        point = loc if isinstance(loc, Point) else None
+        stations = inventory if point else None
+
+        # Download later (afetch) if data is fetched asynchronously
+        if self.fetch_mode == "async":
+            self._pending = (point, stations)
+            return
+
         # Get data for all weather stations
-        self._data = self._get_data()
+        self._set_data(self._get_data(), point, stations)
+
+    def _set_data(
+        self,
+        data: pd.DataFrame,
+        point: Optional[Point] = None,
+        stations: Optional[pd.DataFrame] = None,
+    ) -> None:
+        """
+        Prepare the loaded data of all weather stations
+        """
+
+        self._data = data
 
         # Fill columns if they don't exist
         for col in self._processed_columns:
@@ -199,12 +395,13 @@ class TimeSeries(MeteoData):
                 self._data[flagcol] = self._data[flagcol].astype("string")
 
         # Reorder the DataFrame
-        self._data = self._data[
-            self._processed_columns + with_suffix(self._processed_columns, "_flag")
-        ]
+        self._data = self._data.reindex(
+            columns=self._processed_columns
+            + with_suffix(self._processed_columns, "_flag")
+        )
 
         # Remove model data from DataFrame
-        if not model:
+        if not self._model:
             self._filter_model()
 
         # Conditionally, remove flags from DataFrame
@@ -218,12 +415,66 @@ class TimeSeries(MeteoData):
 
         # Interpolate data spatially if requested
         # location is a geographical point
-        if isinstance(loc, Point):
-            self._resolve_point(loc.method, stations, loc.alt, loc.adapt_temp)
+        if point is not None:
+            self._resolve_point(point.method, stations, point.alt, point.adapt_temp)
 
         # Clear cache if auto cleaning is enabled
         if self.max_age > 0 and self.autoclean:
-            self.clear_cache()
+            self.clear_cache(limit=AUTOCLEAN_BATCH)
+
+    async def astream(self) -> AsyncIterator[pd.DataFrame]:
+        """
+        Download the data asynchronously (fetch_mode = "async"), yielding
+        the DataFrame of each weather station (and year) as it arrives
+        """
+
+        if self._pending is None:
+            return
+
+        point, stations = self._pending
+        datasets = self._get_datasets() if len(self._stations) > 0 else []
+        output = {}
+
+        async for dataset, df in async_processing_handler(
+            datasets,
+            self._adownload_data,
+            self._process_data,
+            self.http_pool_size,
+            self.processes,
+            self.threads,
+        ):
+            output[dataset] = df
+            yield df
+
+        # Concatenate in the same order as processing_handler
+        filtered = [
+            output[dataset] for dataset in datasets if not output[dataset].empty
+        ]
+        if len(filtered) > 0:
+            data = pd.concat(filtered)
+        elif len(datasets) > 0:
+            data = output[datasets[0]]
+        else:
+            data = pd.DataFrame(columns=self._processed_columns)
+
+        self._pending = None
+        self._set_data(data, point, stations)
+
+    async def _aload(self) -> None:
+        """
+        Download the data asynchronously
+        """
+        async for _ in self.astream():
+            pass
+
+    async def afetch(self) -> pd.DataFrame:
+        """
+        Fetch DataFrame, downloading the data asynchronously first
+        (fetch_mode = "async")
+        """
+        await self._aload()
+
+        return self.fetch()
 
     # Import methods
     from meteostat.series.normalize import normalize
@@ -234,4 +485,4 @@ class TimeSeries(MeteoData):
     from meteostat.series.count import count
     from meteostat.series.fetch import fetch
     from meteostat.series.stations import stations
-    from meteostat.core.cache import clear_cache
+    from meteostat.core.cache import clear_cache, cache_stats
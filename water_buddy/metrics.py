@@ -0,0 +1,295 @@
+"""
+WaterBuddy - In-process metrics registry.
+
+Records where the time of a rerun goes: storage calls, chart rendering,
+bottle SVG / theme CSS generation and asset loading. Each instrumented
+operation keeps a call count, an error count, a latency histogram and the
+bytes it read or wrote (files, rendered images, generated markup).
+
+Metrics are off unless WATERBUDDY_METRICS=1 (they can also be switched on
+and off at runtime from the admin page). While off, an instrumented call
+costs one attribute check on top of the function call.
+
+The registry is per server process and shared by all sessions. Snapshots
+can be exported as Prometheus text (prometheus_text) or appended to a
+JSON lines file (dump_jsonl); with WATERBUDDY_METRICS_FILE set, app.py
+appends a snapshot at most every METRICS_DUMP_INTERVAL_S seconds.
+
+Usage:
+    from metrics import instrument, registry
+
+    @instrument("chart.render", written=len)
+    def render_chart(...): ...
+
+    python metrics.py    # overhead of an instrumented call, on and off
+"""
+
+# =======================
+# 1. Imports
+# =======================
+import bisect
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+# =======================
+# 2. Configuration & Constants
+# =======================
+METRICS_ENV_VAR = "WATERBUDDY_METRICS"
+# JSON lines file that app.py appends snapshots to (off when unset)
+METRICS_FILE_ENV_VAR = "WATERBUDDY_METRICS_FILE"
+METRICS_DUMP_INTERVAL_S = 60
+
+# Latency histogram bucket bounds in seconds (Prometheus "le" labels)
+LATENCY_BUCKETS_S = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                     0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+PROMETHEUS_PREFIX = "waterbuddy"
+
+# =======================
+# 3. Registry
+# =======================
+
+class OpStats:
+    """Counters and latency histogram of one operation."""
+
+    __slots__ = ("count", "errors", "seconds", "max_seconds", "buckets",
+                 "bytes_read", "bytes_written")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        # One slot per bound plus +Inf (not cumulative; see as_dict)
+        self.buckets = [0] * (len(LATENCY_BUCKETS_S) + 1)
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def quantile(self, q: float) -> float:
+        """Upper bucket bound below which `q` of the calls finished (None if empty)."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(LATENCY_BUCKETS_S, self.buckets):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "seconds": round(self.seconds, 6),
+            "avg_ms": round(self.seconds * 1000 / self.count, 4) if self.count else 0.0,
+            "max_ms": round(self.max_seconds * 1000, 4),
+            "p50_ms": _ms(self.quantile(0.5)),
+            "p95_ms": _ms(self.quantile(0.95)),
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "buckets": list(self.buckets),
+        }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 4)
+
+
+class MetricsRegistry:
+    """Thread-safe map of operation name -> OpStats."""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._ops = {}
+
+    def _op(self, name: str) -> OpStats:
+        op = self._ops.get(name)
+        if op is None:
+            op = self._ops[name] = OpStats()
+        return op
+
+    def observe(self, name: str, seconds: float, read: int = 0, written: int = 0,
+                error: bool = False) -> None:
+        """Record one call of `name`."""
+        slot = bisect.bisect_left(LATENCY_BUCKETS_S, seconds)
+        with self._lock:
+            op = self._op(name)
+            op.count += 1
+            op.errors += error
+            op.seconds += seconds
+            if seconds > op.max_seconds:
+                op.max_seconds = seconds
+            op.buckets[slot] += 1
+            op.bytes_read += read
+            op.bytes_written += written
+
+    def add_bytes(self, name: str, read: int = 0, written: int = 0) -> None:
+        """Count bytes for `name` without recording a call (no-op while disabled)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            op = self._op(name)
+            op.bytes_read += read
+            op.bytes_written += written
+
+    @contextlib.contextmanager
+    def timer(self, name: str):
+        """Time the enclosed block as one call of `name` (no-op while disabled)."""
+        if not self.enabled:
+            yield
+            return
+        t0 = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - t0, error=error)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._ops.clear()
+            self.started = time.time()
+
+    def snapshot(self) -> dict:
+        """{name: stats dict} of every operation seen so far."""
+        with self._lock:
+            return {name: op.as_dict() for name, op in sorted(self._ops.items())}
+
+
+registry = MetricsRegistry(
+    enabled=os.environ.get(METRICS_ENV_VAR, "").lower() in ("1", "true", "yes"))
+
+# =======================
+# 4. Instrumentation hooks
+# =======================
+
+def instrument(name: str, read=None, written=None, registry: MetricsRegistry = registry):
+    """Decorator recording each call of the function as `name`.
+
+    `read` / `written` are optional callables mapping the return value to a
+    byte count (e.g. len for rendered bytes or markup).
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not registry.enabled:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                registry.observe(name, time.perf_counter() - t0, error=True)
+                raise
+            registry.observe(name, time.perf_counter() - t0,
+                             read=read(result) if read and result is not None else 0,
+                             written=written(result) if written and result is not None else 0)
+            return result
+        return wrapper
+    return decorate
+
+# =======================
+# 5. Export
+# =======================
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def prometheus_text(snapshot: dict = None) -> str:
+    """Snapshot in the Prometheus text exposition format."""
+    snapshot = registry.snapshot() if snapshot is None else snapshot
+    p = PROMETHEUS_PREFIX
+    lines = [
+        f"# HELP {p}_op_seconds Latency of instrumented operations.",
+        f"# TYPE {p}_op_seconds histogram",
+    ]
+    for name, op in snapshot.items():
+        if not op["count"]:
+            continue
+        op_label = f'op="{_label(name)}"'
+        cumulative = 0
+        for bound, n in zip(LATENCY_BUCKETS_S, op["buckets"]):
+            cumulative += n
+            lines.append(f'{p}_op_seconds_bucket{{{op_label},le="{bound}"}} {cumulative}')
+        lines.append(f'{p}_op_seconds_bucket{{{op_label},le="+Inf"}} {op["count"]}')
+        lines.append(f"{p}_op_seconds_sum{{{op_label}}} {op['seconds']}")
+        lines.append(f"{p}_op_seconds_count{{{op_label}}} {op['count']}")
+    for metric, key, help_text in (
+        ("op_errors_total", "errors", "Instrumented calls that raised."),
+        ("bytes_read_total", "bytes_read", "Bytes read by instrumented operations."),
+        ("bytes_written_total", "bytes_written", "Bytes written or generated by instrumented operations."),
+    ):
+        lines.append(f"# HELP {p}_{metric} {help_text}")
+        lines.append(f"# TYPE {p}_{metric} counter")
+        for name, op in snapshot.items():
+            lines.append(f'{p}_{metric}{{op="{_label(name)}"}} {op[key]}')
+    return "\n".join(lines) + "\n"
+
+def snapshot_record() -> dict:
+    """One JSON lines record: timestamp, uptime and the snapshot."""
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "pid": os.getpid(),
+        "uptime_s": round(time.time() - registry.started, 1),
+        "metrics": registry.snapshot(),
+    }
+
+def dump_jsonl(path: str) -> None:
+    """Append one snapshot record to a JSON lines file."""
+    with open(path, "a") as f:
+        f.write(json.dumps(snapshot_record()) + "\n")
+
+_last_dump = 0.0
+_dump_lock = threading.Lock()
+
+def maybe_dump(interval: float = METRICS_DUMP_INTERVAL_S) -> bool:
+    """Append a snapshot to WATERBUDDY_METRICS_FILE if the interval has passed."""
+    global _last_dump
+    path = os.environ.get(METRICS_FILE_ENV_VAR)
+    if not path or not registry.enabled:
+        return False
+    with _dump_lock:
+        now = time.monotonic()
+        if now - _last_dump < interval:
+            return False
+        _last_dump = now
+    try:
+        dump_jsonl(path)
+    except OSError:
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    # Overhead of an instrumented call while metrics are off and on
+    def plain(x):
+        return x
+
+    probe = MetricsRegistry()
+    wrapped = instrument("bench", written=len, registry=probe)(plain)
+    calls = 200_000
+    arg = "x" * 64
+
+    def bench(fn) -> float:
+        t0 = time.perf_counter()
+        for _ in range(calls):
+            fn(arg)
+        return (time.perf_counter() - t0) / calls * 1e9
+
+    base = bench(plain)
+    probe.enabled = False
+    off = bench(wrapped)
+    probe.enabled = True
+    on = bench(wrapped)
+    print(f"plain call {base:.0f} ns, instrumented off {off:.0f} ns (+{off - base:.0f}), "
+          f"on {on:.0f} ns (+{on - base:.0f})")
+    print(json.dumps(probe.snapshot()["bench"]))
@@ -0,0 +1,354 @@
+"""
+WaterBuddy - Legacy users_data.json migrator.
+
+Older exports ('users_data.json') are keyed by email and use a flat schema:
+
+    {"someone@example.com": {"password": ..., "name": ..., "age": 16,
+                             "goal": 2000, "intake": 1250, "theme": "Dark",
+                             "mascot": ..., "tasks_state": {...}}, ...}
+
+This command streams that file one record at a time (memory stays bounded
+by the largest single record, not the file), maps every record to the
+current {username, password, created_at, profile, days} schema and inserts
+them in batches through the configured storage backend.
+
+- uids are derived from the email (uuid5), so re-running never duplicates.
+- Progress is checkpointed after every batch ('<source>.migrate.json');
+  an interrupted run resumes from the last committed byte offset. A batch
+  the backend cannot write is retried, and if it keeps failing the run
+  stops without moving the checkpoint past it.
+- A throughput report (users/s, MB/s) is printed while running and at the end.
+
+Usage:
+    python migrate.py users_data.json [--backend sqlite] [--batch-size 500]
+"""
+
+# =======================
+# 1. Imports
+# =======================
+import codecs
+import json
+import os
+import re
+import sys
+import time
+import uuid
+from datetime import date
+
+from storage import get_backend, normalize_username
+from writer import atomic_write_json
+
+# =======================
+# 2. Configuration & Constants
+# =======================
+LEGACY_FILE = "users_data.json"
+CHECKPOINT_SUFFIX = ".migrate.json"
+
+BATCH_SIZE = 500
+# Bytes read from the legacy file at a time
+CHUNK_SIZE = 1 << 16
+# Print a progress line every N batches
+REPORT_EVERY = 20
+# Retries of a batch the backend could not write (storage error)
+COMMIT_RETRIES = 3
+COMMIT_BACKOFF_S = 0.5
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# Mirrors AGE_GOALS_ML in app.py (app.py cannot be imported outside Streamlit)
+AGE_GOALS_ML = {
+    "6-12": 1600,
+    "13-18": 2000,
+    "19-50": 2500,
+    "65+": 2000,
+}
+DEFAULT_AGE_GROUP = "19-50"
+# Bounds of the "Daily goal (ml)" input in Settings
+MIN_GOAL_ML, MAX_GOAL_ML = 500, 10000
+
+# Legacy fields carried over into the profile as-is
+LEGACY_PROFILE_KEYS = ("name", "theme", "mascot", "font_size", "health_issue", "tasks_state")
+
+# =======================
+# 3. Streaming reader
+# =======================
+
+class LegacyReader:
+    """Incrementally parses a top-level JSON object of {email: record}.
+
+    Only the current record is ever held in memory. `offset` is the byte
+    position just after the last record returned, so a reader created with
+    that offset continues where the previous one stopped.
+    """
+
+    def __init__(self, path: str, offset: int = 0, chunk_size: int = CHUNK_SIZE):
+        self.file = open(path, "rb")
+        self.file.seek(offset)
+        self.offset = offset
+        self.chunk_size = chunk_size
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        # Parse position inside buf (consumed text is dropped on the next read)
+        self.pos = 0
+        self.eof = False
+        # At offset 0 the opening brace is next; otherwise a ',' or '}'
+        self.started = offset > 0
+
+    def close(self) -> None:
+        self.file.close()
+
+    def _fill(self, size: int) -> bool:
+        if self.eof:
+            return False
+        chunk = self.file.read(size)
+        self.eof = not chunk
+        self.buf = self.buf[self.pos:] + self.utf8.decode(chunk, final=self.eof)
+        self.pos = 0
+        return not self.eof
+
+    def _consume(self, end: int) -> None:
+        self.offset += len(self.buf[self.pos:end].encode("utf-8"))
+        self.pos = end
+
+    def _next_char(self) -> str:
+        """Skip whitespace and return the next character ('' at end of file)."""
+        while True:
+            self._consume(WHITESPACE.match(self.buf, self.pos).end())
+            if self.pos < len(self.buf) or not self._fill(self.chunk_size):
+                return self.buf[self.pos:self.pos + 1]
+
+    def _expect(self, chars: str) -> str:
+        ch = self._next_char()
+        if not ch or ch not in chars:
+            raise ValueError(f"Expected one of {chars!r} at byte {self.offset}, found {ch!r}")
+        self._consume(self.pos + 1)
+        return ch
+
+    def _value(self):
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A value ending exactly at the buffer end may be cut short
+                if end < len(self.buf) or self.eof:
+                    self._consume(end)
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Record spans beyond the buffer: read more (growing reads keep
+            # very large records linear)
+            self._fill(size)
+            size *= 2
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """Return the next (email, record) pair."""
+        if not self.started:
+            self._expect("{")
+            self.started = True
+            if self._next_char() == "}":
+                self._consume(self.pos + 1)
+                raise StopIteration
+        elif self._expect(",}") == "}":
+            raise StopIteration
+        self._next_char()
+        key = self._value()
+        self._expect(":")
+        self._next_char()
+        return key, self._value()
+
+# =======================
+# 4. Record mapping
+# =======================
+
+def age_group(age) -> str:
+    """Map a legacy age in years to one of the app's age groups."""
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        return DEFAULT_AGE_GROUP
+    if age <= 12:
+        return "6-12"
+    if age <= 18:
+        return "13-18"
+    if age < 65:
+        return "19-50"
+    return "65+"
+
+def legacy_uid(email: str) -> str:
+    """Stable uid for a legacy account, so repeated runs map to the same user."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, "mailto:" + normalize_username(email)))
+
+def map_record(email: str, legacy: dict, day: str):
+    """Convert one legacy record to (uid, record), or None if it cannot be used."""
+    if not isinstance(legacy, dict) or not email or not legacy.get("password"):
+        return None
+    group = age_group(legacy.get("age"))
+    try:
+        goal = int(legacy.get("goal"))
+    except (TypeError, ValueError):
+        goal = 0
+    if not MIN_GOAL_ML <= goal <= MAX_GOAL_ML:
+        goal = AGE_GOALS_ML[group]
+
+    profile = {"age_group": group, "user_goal_ml": goal}
+    for key in LEGACY_PROFILE_KEYS:
+        if key in legacy:
+            profile[key] = legacy[key]
+
+    try:
+        intake = max(0, int(legacy.get("intake") or 0))
+    except (TypeError, ValueError):
+        intake = 0
+    return legacy_uid(email), {
+        # Legacy accounts logged in with their email
+        "username": email.strip(),
+        "password": str(legacy["password"]),
+        "created_at": day,
+        "profile": profile,
+        "days": {day: {"intake": intake}} if intake else {},
+    }
+
+# =======================
+# 5. Migration
+# =======================
+
+def _load_checkpoint(path: str, source_stat) -> dict:
+    try:
+        with open(path, "r") as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # Only resume against the exact same source file
+    if checkpoint.get("source_size") != source_stat.st_size or \
+            checkpoint.get("source_mtime_ns") != source_stat.st_mtime_ns:
+        return None
+    return checkpoint
+
+def migrate(source: str = LEGACY_FILE, backend=None, batch_size: int = BATCH_SIZE,
+            day: str = None, checkpoint_path: str = None, restart: bool = False,
+            log=print) -> dict:
+    """Stream `source` into `backend` in batches; returns the final report."""
+    backend = backend or get_backend()
+    checkpoint_path = checkpoint_path or source + CHECKPOINT_SUFFIX
+    source_stat = os.stat(source)
+    # The legacy 'intake' was "today" when the file was last written
+    day = day or date.fromtimestamp(source_stat.st_mtime).isoformat()
+
+    state = None if restart else _load_checkpoint(checkpoint_path, source_stat)
+    if state is None:
+        state = {
+            "source": os.path.abspath(source),
+            "source_size": source_stat.st_size,
+            "source_mtime_ns": source_stat.st_mtime_ns,
+            "backend": backend.name,
+            "day": day,
+            "offset": 0,
+            "migrated": 0,
+            "skipped": 0,
+            "invalid": 0,
+            "done": False,
+        }
+    elif state["done"]:
+        log(f"{source} was already migrated (delete {checkpoint_path} to run again)")
+        return state
+    else:
+        day = state["day"]
+        log(f"Resuming {source} at byte {state['offset']:,} ({state['migrated']:,} users migrated)")
+
+    start_offset = state["offset"]
+    started = time.perf_counter()
+    processed = 0
+    batches = 0
+
+    def report() -> dict:
+        elapsed = time.perf_counter() - started
+        mb = (state["offset"] - start_offset) / 1e6
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "users_per_s": round(processed / elapsed, 1) if elapsed else 0.0,
+            "mb_per_s": round(mb / elapsed, 2) if elapsed else 0.0,
+        }
+
+    reader = LegacyReader(source, state["offset"])
+    try:
+        batch = []
+        invalid = 0
+        for email, legacy in reader:
+            mapped = map_record(email, legacy, day)
+            if mapped is None:
+                invalid += 1
+            else:
+                batch.append(mapped)
+            if len(batch) + invalid >= batch_size:
+                processed += _commit(backend, batch, invalid, reader.offset, state, checkpoint_path)
+                batch, invalid = [], 0
+                batches += 1
+                if batches % REPORT_EVERY == 0:
+                    r = report()
+                    log(f"{state['migrated']:,} migrated, {state['skipped']:,} skipped "
+                        f"({r['users_per_s']:,.0f} users/s, {r['mb_per_s']} MB/s)")
+        state["done"] = True
+        processed += _commit(backend, batch, invalid, reader.offset, state, checkpoint_path)
+    finally:
+        reader.close()
+
+    result = dict(state, **report())
+    log(json.dumps(result, indent=2))
+    return result
+
+def _commit(backend, batch: list, invalid: int, offset: int, state: dict,
+            checkpoint_path: str) -> int:
+    """Insert one batch, then advance and persist the checkpoint.
+
+    Raises OSError (checkpoint untouched) if some users still cannot be
+    written after COMMIT_RETRIES retries, so a resumed run tries them again.
+    """
+    results = backend.create_users(batch) if batch else []
+    for attempt in range(COMMIT_RETRIES):
+        # None = not written (storage error), as opposed to already present
+        failed = [i for i, ok in enumerate(results) if ok is None]
+        if not failed:
+            break
+        time.sleep(COMMIT_BACKOFF_S * 2 ** attempt)
+        for i, ok in zip(failed, backend.create_users([batch[i] for i in failed])):
+            results[i] = ok
+    failed = sum(1 for ok in results if ok is None)
+    if failed:
+        raise OSError(f"{failed} of {len(batch)} users could not be written; "
+                      f"re-run to resume at byte {state['offset']:,}")
+    created = sum(1 for ok in results if ok)
+    state["migrated"] += created
+    # Already present (e.g. a re-run) or username taken by another account
+    state["skipped"] += len(results) - created
+    state["invalid"] += invalid
+    state["offset"] = offset
+    atomic_write_json(checkpoint_path, state, indent=4)
+    return len(batch) + invalid
+
+
+if __name__ == "__main__":
+    import argparse
+    import storage
+    import shards  # registers the "sharded" backend
+    import recordfile  # registers the "records" backend
+
+    parser = argparse.ArgumentParser(description="Migrate a legacy users_data.json export.")
+    parser.add_argument("source", nargs="?", default=LEGACY_FILE)
+    parser.add_argument("--backend", default=None, choices=sorted(storage.BACKENDS),
+                        help="Target backend (default: WATERBUDDY_BACKEND or sqlite)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--day", default=None,
+                        help="Day to book the legacy 'intake' on (default: file modification date)")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    try:
+        migrate(args.source, get_backend(args.backend), args.batch_size, args.day,
+                restart=args.restart, log=lambda msg: print(msg, file=sys.stderr))
+    except (OSError, ValueError) as e:
+        sys.exit(f"Migration failed: {e}")
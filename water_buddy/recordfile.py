@@ -0,0 +1,516 @@
+"""
+WaterBuddy - Compact record-file storage.
+
+'water_data.json' is pretty-printed (indent=4) and has to be parsed as a
+whole even to read one user's goal. The "records" backend stores the same
+per-user data in a length-prefixed binary file with an offset index:
+
+    header   b"WBRF" + u32 format version
+    records  u32 length | u16 uid length | uid | compact JSON of the user
+    index    compact JSON: uids, offsets, lengths and username keys
+    trailer  u64 index offset | u64 index length | b"WBRI"
+
+Opening the file only reads the trailer and the index. A user's record is
+located through the index and decoded on first access, without touching any
+other record. Writes copy every untouched record byte-for-byte into the new
+file and only encode the users that changed.
+
+Usage:
+    WATERBUDDY_BACKEND=records streamlit run app.py
+    python recordfile.py import water_data.json
+    python recordfile.py bench --sizes 1000 10000 100000
+"""
+
+# =======================
+# 1. Imports
+# =======================
+import copy
+import json
+import os
+import random
+import struct
+import threading
+import time
+from datetime import date, timedelta
+
+from storage import (
+    DATA_FILE, EVENT_RETENTION_DAYS, JSONBackend, StorageBackend,
+    _as_int, load_data, normalize_username, register_backend, save_data,
+)
+from history import DayHistory
+from writer import atomic_write_file, file_lock
+
+# =======================
+# 2. Configuration & Constants
+# =======================
+RECORD_FILE = "water_data.wbr"
+
+MAGIC = b"WBRF"
+INDEX_MAGIC = b"WBRI"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sI")
+RECORD_HEADER = struct.Struct("<IH")
+TRAILER = struct.Struct("<QQ4s")
+
+# Untouched records are copied in slices of at most this many bytes
+COPY_CHUNK = 1 << 20
+
+# =======================
+# 3. File format
+# =======================
+
+class StaleRecordFile(Exception):
+    """The file was replaced after its index was read."""
+
+
+def encode_record(uid: str, user: dict) -> bytes:
+    uid_bytes = uid.encode("utf-8")
+    body = json.dumps(user, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return RECORD_HEADER.pack(len(uid_bytes) + len(body), len(uid_bytes)) + uid_bytes + body
+
+
+class RecordFile:
+    """Index of one record file; records are read and decoded on demand."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offsets = {}
+        self.lengths = {}
+        # uid -> username key, and the uids in file order
+        self.keys = {}
+        self.order = []
+        self._by_key = None
+        try:
+            with open(path, "rb") as f:
+                st = os.fstat(f.fileno())
+                self.stat = (st.st_mtime_ns, st.st_size, st.st_ino)
+                self._read_index(f, st.st_size)
+        except FileNotFoundError:
+            self.stat = None
+
+    def _read_index(self, f, size: int) -> None:
+        if size < HEADER.size + TRAILER.size:
+            raise ValueError(f"{self.path} is not a record file")
+        magic, version = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{self.path} is not a version {FORMAT_VERSION} record file")
+        f.seek(size - TRAILER.size)
+        index_offset, index_length, index_magic = TRAILER.unpack(f.read(TRAILER.size))
+        if index_magic != INDEX_MAGIC:
+            raise ValueError(f"{self.path} has no index (incomplete write?)")
+        f.seek(index_offset)
+        index = json.loads(f.read(index_length))
+        self.order = index["uids"]
+        self.offsets = dict(zip(self.order, index["offsets"]))
+        self.lengths = dict(zip(self.order, index["lengths"]))
+        self.keys = dict(zip(self.order, index["keys"]))
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self.offsets
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def find_uid(self, key: str):
+        if self._by_key is None:
+            self._by_key = {}
+            for uid, k in self.keys.items():
+                self._by_key.setdefault(k, uid)
+        return self._by_key.get(key)
+
+    def read(self, uid: str):
+        """Decode one user's record (None if absent)."""
+        if uid not in self.offsets:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(self.offsets[uid])
+            raw = f.read(self.lengths[uid])
+        length, uid_length = RECORD_HEADER.unpack_from(raw)
+        start = RECORD_HEADER.size
+        if len(raw) != start + length or raw[start:start + uid_length] != uid.encode("utf-8"):
+            raise StaleRecordFile(self.path)
+        return json.loads(raw[start + uid_length:])
+
+    def write(self, path: str, updates: dict) -> None:
+        """Write a new file: `updates` maps uid -> user (new/changed) or None (deleted).
+
+        Runs of untouched records are copied as raw bytes, without decoding.
+        """
+        def write(out):
+            out.write(HEADER.pack(MAGIC, FORMAT_VERSION))
+            pos = HEADER.size
+            index = {"uids": [], "offsets": [], "lengths": [], "keys": []}
+
+            def add(uid, length, key):
+                nonlocal pos
+                index["uids"].append(uid)
+                index["offsets"].append(pos)
+                index["lengths"].append(length)
+                index["keys"].append(key)
+                pos += length
+
+            def copy_run(start, end):
+                src.seek(start)
+                while start < end:
+                    chunk = src.read(min(end - start, COPY_CHUNK))
+                    out.write(chunk)
+                    start += len(chunk)
+
+            src = open(self.path, "rb") if self.order else None
+            try:
+                # [start, end) of adjacent untouched records not yet copied
+                run = None
+                for uid in self.order:
+                    offset, length = self.offsets[uid], self.lengths[uid]
+                    if uid not in updates:
+                        if run and run[1] == offset:
+                            run[1] += length
+                        else:
+                            if run:
+                                copy_run(*run)
+                            run = [offset, offset + length]
+                        add(uid, length, self.keys[uid])
+                        continue
+                    if run:
+                        copy_run(*run)
+                        run = None
+                    if updates[uid] is not None:
+                        raw = encode_record(uid, updates[uid])
+                        add(uid, len(raw), normalize_username(updates[uid].get("username")))
+                        out.write(raw)
+                if run:
+                    copy_run(*run)
+            finally:
+                if src is not None:
+                    src.close()
+
+            for uid, user in updates.items():
+                if uid not in self.offsets and user is not None:
+                    raw = encode_record(uid, user)
+                    add(uid, len(raw), normalize_username(user.get("username")))
+                    out.write(raw)
+
+            index_offset = pos
+            index_bytes = json.dumps(index, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+            out.write(index_bytes)
+            out.write(TRAILER.pack(index_offset, len(index_bytes), INDEX_MAGIC))
+
+        atomic_write_file(path, write)
+
+# =======================
+# 4. Backend
+# =======================
+
+class RecordFileBackend(StorageBackend):
+    """Per-user records in a length-prefixed binary file, decoded lazily.
+
+    User records use the same layout as the JSON backend (profile, days,
+    weeks, months, events), so its event helpers are reused.
+    """
+
+    name = "records"
+
+    def __init__(self, path: str = RECORD_FILE):
+        super().__init__()
+        self.path = path
+        self._lock = threading.RLock()
+        self._file = None
+        # uid -> decoded record for the current file (treat as read-only)
+        self._decoded = {}
+
+    def _current(self) -> RecordFile:
+        """The index of the file on disk, re-read only if the file changed."""
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+                stat = (st.st_mtime_ns, st.st_size, st.st_ino)
+            except OSError:
+                stat = None
+            if self._file is None or stat != self._file.stat:
+                self._file = RecordFile(self.path)
+                self._decoded = {}
+            return self._file
+
+    def _user(self, uid: str):
+        """Shared decoded record of one user (do not mutate)."""
+        with self._lock:
+            for attempt in range(2):
+                records = self._current()
+                if uid in self._decoded:
+                    return self._decoded[uid]
+                try:
+                    user = records.read(uid)
+                except StaleRecordFile:
+                    # Replaced by another process between stat and read
+                    self._file = None
+                    continue
+                if user is not None:
+                    self._decoded[uid] = user
+                return user
+            return None
+
+    def _write(self, mutate) -> bool:
+        """Rewrite the file with mutate(records) -> {uid: user or None} under the file lock."""
+        with self._lock, file_lock(self.path):
+            records = self._current()
+            updates = mutate(records)
+            if not updates:
+                return True
+            try:
+                records.write(self.path, updates)
+            except OSError:
+                return False
+            decoded = self._decoded
+            self._file = None
+            self._current()
+            # Offsets moved, but the untouched records are byte-identical
+            self._decoded = {uid: user for uid, user in decoded.items() if uid not in updates}
+            self._decoded.update({uid: user for uid, user in updates.items() if user is not None})
+            return True
+
+    def _writable(self, uid: str):
+        user = self._user(uid)
+        return copy.deepcopy(user) if user is not None else None
+
+    def get_user(self, uid: str):
+        user = self._user(uid)
+        if user is None:
+            return None
+        return {k: v for k, v in user.items() if k not in JSONBackend.DATA_KEYS}
+
+    def find_uid(self, username: str):
+        return self._current().find_uid(normalize_username(username))
+
+    def create_user(self, uid: str, record: dict) -> bool:
+        return self.create_users([(uid, record)])[0]
+
+    def create_users(self, items: list) -> list:
+        results = []
+
+        def mutate(records):
+            updates = {}
+            keys = set()
+            for uid, record in items:
+                key = normalize_username(record.get("username"))
+                if uid in records or uid in updates or key in keys or records.find_uid(key):
+                    results.append(False)
+                    continue
+                updates[uid] = JSONBackend._ensure_totals(dict(record, days=record.get("days", {})))
+                keys.add(key)
+                results.append(True)
+            return updates
+
+        if not self._write(mutate):
+            return [None] * len(items)
+        return results
+
+    def rename_user(self, uid: str, new_username: str) -> bool:
+        key = normalize_username(new_username)
+        ok = []
+
+        def mutate(records):
+            user = self._writable(uid)
+            if user is None or records.find_uid(key) not in (None, uid):
+                return {}
+            user["username"] = new_username
+            ok.append(True)
+            return {uid: user}
+
+        return self._write(mutate) and bool(ok)
+
+    def delete_user(self, uid: str) -> bool:
+        ok = []
+
+        def mutate(records):
+            if uid not in records:
+                return {}
+            ok.append(True)
+            return {uid: None}
+
+        return self._write(mutate) and bool(ok)
+
+    def read_user(self, uid: str, days: list, keys: dict):
+        user = self._user(uid)
+        if user is None:
+            return None
+        days_data = user.get("days", {})
+        totals = JSONBackend._totals(user)
+        return {
+            "record": {k: v for k, v in user.items() if k not in JSONBackend.DATA_KEYS},
+            "days": {day: _as_int(days_data.get(day, {}).get("intake")) for day in days},
+            "totals": {
+                period: _as_int(totals[period + "s"].get(key))
+                for period, key in keys.items()
+            },
+        }
+
+    def apply_batch(self, items: list) -> list:
+        results = []
+
+        def mutate(records):
+            updates = {}
+            for uid, changes in items:
+                user = updates.get(uid) or self._writable(uid)
+                if user is None:
+                    results.append(False)
+                    continue
+                user = JSONBackend._ensure_totals(user)
+                for change in changes:
+                    if change[0] == "profile":
+                        user["profile"] = dict(user.get("profile", {}), **change[1])
+                    else:
+                        JSONBackend._apply_event(user, *change[1:])
+                updates[uid] = user
+                results.append(True)
+            return updates
+
+        if not self._write(mutate):
+            return [False] * len(items)
+        self._count_appends(items, results)
+        return results
+
+    def get_intake(self, uid: str, day: str) -> int:
+        return self.get_intakes(uid, [day])[day]
+
+    def get_intakes(self, uid: str, days: list) -> dict:
+        days_data = (self._user(uid) or {}).get("days", {})
+        return {day: _as_int(days_data.get(day, {}).get("intake")) for day in days}
+
+    def get_period_totals(self, uid: str, period: str, keys: list) -> dict:
+        user = self._user(uid)
+        if user is None:
+            return {key: 0 for key in keys}
+        totals = JSONBackend._totals(user)[period + "s"]
+        return {key: _as_int(totals.get(key)) for key in keys}
+
+    def get_history(self, uid: str, start: str, end: str):
+        user = self._user(uid) or {}
+        return DayHistory.from_days(JSONBackend._day_intakes(user), start, end)
+
+    def get_events(self, uid: str, day: str) -> list:
+        events = (self._user(uid) or {}).get("events", [])
+        return [e for e in events if e.get("day") == day]
+
+    def compact_events(self, keep_days: int = EVENT_RETENTION_DAYS) -> int:
+        cutoff = (date.today() - timedelta(days=keep_days)).isoformat()
+        removed = []
+
+        def mutate(records):
+            updates = {}
+            for uid in records.order:
+                user = self._user(uid)
+                events = user.get("events", [])
+                kept = [e for e in events if e.get("day", "") >= cutoff]
+                if len(kept) != len(events):
+                    updates[uid] = dict(user, events=kept)
+                    removed.append(len(events) - len(kept))
+            return updates
+
+        return sum(removed) if self._write(mutate) else 0
+
+    def import_document(self, path: str = DATA_FILE) -> int:
+        """Copy the users of a JSON store into the record file; returns users added."""
+        users = load_data(path).get("users", {})
+        return sum(1 for ok in self.create_users([
+            (uid, rec) for uid, rec in users.items() if isinstance(rec, dict)
+        ]) if ok)
+
+
+register_backend(RecordFileBackend.name, RecordFileBackend)
+
+# =======================
+# 5. Benchmark
+# =======================
+
+def synthetic_users(count: int, days: int = 14, seed: int = 7) -> dict:
+    """Users with `days` days of history each, in the JSON backend's layout."""
+    rng = random.Random(seed)
+    today = date.today()
+    users = {}
+    for i in range(count):
+        user = {
+            "username": f"user{i}",
+            "password": "secret",
+            "created_at": (today - timedelta(days=days)).isoformat(),
+            "profile": {"age_group": "19-50", "user_goal_ml": 2500},
+            "days": {
+                (today - timedelta(days=d)).isoformat(): {"intake": rng.randrange(0, 3500, 50)}
+                for d in range(days)
+            },
+        }
+        users[f"uid-{i:07d}"] = JSONBackend._ensure_totals(user)
+    return users
+
+def _timed(fn, repeat: int = 3) -> float:
+    """Best wall time of `repeat` runs, in milliseconds."""
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - t0) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 2)
+
+def run_benchmark(sizes=(1000, 10000, 100000), days: int = 14, directory: str = ".") -> list:
+    """Compare the JSON file and the record file for size, load, lookup and one-user write."""
+    rows = []
+    for count in sizes:
+        users = synthetic_users(count, days)
+        json_path = os.path.join(directory, f"bench-{count}.json")
+        rec_path = os.path.join(directory, f"bench-{count}.wbr")
+        save_data({"users": users}, json_path)
+        for path in (rec_path, rec_path + ".lock"):
+            if os.path.exists(path):
+                os.remove(path)
+        RecordFile(rec_path).write(rec_path, users)
+        target = f"uid-{count // 2:07d}"
+        del users
+
+        def json_write():
+            data = load_data(json_path)
+            data["users"][target]["profile"]["user_goal_ml"] += 1
+            save_data(data, json_path)
+
+        def record_write():
+            records = RecordFile(rec_path)
+            user = records.read(target)
+            user["profile"]["user_goal_ml"] += 1
+            records.write(rec_path, {target: user})
+
+        rows.append({
+            "users": count,
+            "json_bytes": os.path.getsize(json_path),
+            "record_bytes": os.path.getsize(rec_path),
+            # Everything needed before any user can be served
+            "json_load_ms": _timed(lambda: load_data(json_path)),
+            "record_open_ms": _timed(lambda: RecordFile(rec_path)),
+            # Cold lookup of one user's goal
+            "json_lookup_ms": _timed(
+                lambda: load_data(json_path)["users"][target]["profile"]["user_goal_ml"]),
+            "record_lookup_ms": _timed(
+                lambda: RecordFile(rec_path).read(target)["profile"]["user_goal_ml"]),
+            # Change one user and persist
+            "json_write_ms": _timed(json_write),
+            "record_write_ms": _timed(record_write),
+        })
+        for path in (json_path, rec_path):
+            os.remove(path)
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Record-file storage tools.")
+    parser.add_argument("command", choices=["import", "bench"])
+    parser.add_argument("source", nargs="?", default=DATA_FILE, help="JSON store to import")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--days", type=int, default=14, help="History days per benchmark user")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        print(f"Imported {RecordFileBackend().import_document(args.source)} users into {RECORD_FILE}")
+    else:
+        rows = run_benchmark(args.sizes, args.days, tempfile.mkdtemp(prefix="waterbuddy-bench-"))
+        print(json.dumps(rows, indent=2))
@@ -0,0 +1,418 @@
+"""
+WaterBuddy - Sharded JSON storage.
+
+Instead of one 'water_data.json' holding every user, the "sharded" backend
+spreads users over N small JSON files chosen by a hash of the uid:
+
+    water_data.shards/
+        manifest.json        shard count, hash function, file generation
+        usernames.json       username -> uid index for logins/signups
+        g1-000.json ...      one JSONBackend document per shard
+
+Serving a user only loads and rewrites that user's shard, so the cost of a
+click grows with the shard size instead of the whole user base. Admin-wide
+queries scan all shards in parallel (scan_users), and the shard count can be
+changed later by rebalancing into a new file generation.
+
+Usage:
+    WATERBUDDY_BACKEND=sharded streamlit run app.py
+    python shards.py stats
+    python shards.py import --from water_data.json
+    python shards.py rebalance [--shards 64]
+"""
+
+# =======================
+# 1. Imports
+# =======================
+import contextlib
+import glob
+import json
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import (
+    DATA_FILE, JSONBackend, StorageBackend, EVENT_RETENTION_DAYS,
+    drop_document_cache, load_data, normalize_username, register_backend, save_data,
+)
+from writer import atomic_write_json, file_lock
+
+# =======================
+# 2. Configuration & Constants
+# =======================
+SHARD_DIR = "water_data.shards"
+MANIFEST_FILE = "manifest.json"
+USERNAMES_FILE = "usernames.json"
+MANIFEST_FORMAT = 1
+
+DEFAULT_SHARD_COUNT = 16
+# Rebalancing without --shards aims for about this many users per shard
+SHARD_TARGET_USERS = 1000
+# Worker threads used by scan_users()
+SCAN_WORKERS = 8
+
+# =======================
+# 3. Layout helpers
+# =======================
+
+def shard_of(uid: str, shard_count: int) -> int:
+    """Shard number of a uid (crc32 is stable across processes and runs)."""
+    return zlib.crc32(uid.encode("utf-8")) % shard_count
+
+def shard_file(generation: int, shard: int) -> str:
+    return f"g{generation}-{shard:03d}.json"
+
+def suggest_shard_count(user_count: int, target: int = SHARD_TARGET_USERS) -> int:
+    """Smallest power of two that keeps shards at or below `target` users."""
+    count = DEFAULT_SHARD_COUNT
+    while user_count > count * target:
+        count *= 2
+    return count
+
+
+class RetiredShardError(OSError):
+    """A write reached a shard whose generation was replaced by a rebalance."""
+
+
+class Shard(JSONBackend):
+    """One shard file of a generation.
+
+    A writer may have picked this shard just before a rebalance and then
+    waited for its file lock. Once it holds the lock it re-reads the
+    manifest and refuses to write (RetiredShardError) if the generation has
+    moved on, instead of recreating the deleted file.
+    """
+
+    def __init__(self, path: str, owner, generation: int):
+        super().__init__(path)
+        self.owner = owner
+        self.generation = generation
+
+    def _check_writable(self) -> None:
+        self.owner._refresh()
+        if self.owner.generation != self.generation:
+            raise RetiredShardError(f"{self.path} belongs to a retired generation")
+
+
+class ShardedJSONBackend(StorageBackend):
+    """Users are spread over per-hash JSON shards described by a manifest.
+
+    Each shard is an ordinary JSONBackend, so shards keep the shared document
+    cache, file locking and atomic writes. Signups, renames and deletes hold
+    a directory-wide lock (they touch the username index); intake writes only
+    lock the shard of the user being written.
+    """
+
+    name = "sharded"
+
+    def __init__(self, directory: str = SHARD_DIR, shard_count: int = DEFAULT_SHARD_COUNT):
+        super().__init__()
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_FILE)
+        self.usernames_path = os.path.join(directory, USERNAMES_FILE)
+        self.dir_lock_path = os.path.join(directory, "layout")
+        self._lock = threading.RLock()
+        self._manifest_stat = None
+        self._usernames = None
+        self._usernames_stat = None
+        os.makedirs(directory, exist_ok=True)
+        with file_lock(self.dir_lock_path):
+            if not os.path.exists(self.manifest_path):
+                self._write_manifest(1, shard_count)
+        self._refresh()
+
+    # --- manifest ---
+
+    def _write_manifest(self, generation: int, shard_count: int) -> None:
+        atomic_write_json(self.manifest_path, {
+            "format": MANIFEST_FORMAT,
+            "hash": "crc32",
+            "generation": generation,
+            "shard_count": shard_count,
+            "updated_at": time.time(),
+        }, indent=4)
+
+    @staticmethod
+    def _stat(path: str):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _refresh(self) -> bool:
+        """Re-read the manifest if it changed (e.g. after a rebalance); returns True if it did."""
+        with self._lock:
+            stat = self._stat(self.manifest_path)
+            if stat is not None and stat == self._manifest_stat:
+                return False
+            with open(self.manifest_path, "r") as f:
+                manifest = json.load(f)
+            old_shards = getattr(self, "shards", [])
+            self.generation = manifest["generation"]
+            self.shard_count = manifest["shard_count"]
+            self.shards = [
+                Shard(os.path.join(self.directory, shard_file(self.generation, i)), self, self.generation)
+                for i in range(self.shard_count)
+            ]
+            self._manifest_stat = stat
+            # Documents of a retired generation are never read again
+            for shard in old_shards:
+                if shard.generation != self.generation:
+                    drop_document_cache(shard.path)
+            return True
+
+    def shard_for(self, uid: str) -> JSONBackend:
+        with self._lock:
+            self._refresh()
+            return self.shards[shard_of(uid, len(self.shards))]
+
+    # --- username index ---
+
+    def _load_usernames(self) -> dict:
+        with self._lock:
+            stat = self._stat(self.usernames_path)
+            if self._usernames is None or stat != self._usernames_stat:
+                try:
+                    with open(self.usernames_path, "r") as f:
+                        self._usernames = json.load(f)["usernames"]
+                except (OSError, ValueError, KeyError, TypeError):
+                    self._usernames = {}
+                self._usernames_stat = stat
+            return self._usernames
+
+    def _save_usernames(self, index: dict) -> None:
+        atomic_write_json(self.usernames_path, {"usernames": index})
+        with self._lock:
+            self._usernames = index
+            self._usernames_stat = self._stat(self.usernames_path)
+
+    # --- StorageBackend API ---
+
+    def find_uid(self, username: str):
+        return self._load_usernames().get(normalize_username(username))
+
+    def get_user(self, uid: str):
+        return self.shard_for(uid).get_user(uid)
+
+    def create_user(self, uid: str, record: dict) -> bool:
+        return self.create_users([(uid, record)])[0]
+
+    def create_users(self, items: list) -> list:
+        results = [False] * len(items)
+        with file_lock(self.dir_lock_path):
+            index = dict(self._load_usernames())
+            reserved = {}
+            for i, (uid, record) in enumerate(items):
+                key = normalize_username(record.get("username"))
+                if key not in index:
+                    index[key] = uid
+                    reserved[i] = key
+            if not reserved:
+                return results
+            with self._lock:
+                self._refresh()
+                shards = self.shards
+            by_shard = {}
+            for i in reserved:
+                by_shard.setdefault(shard_of(items[i][0], len(shards)), []).append(i)
+            for shard, indexes in by_shard.items():
+                shard_results = shards[shard].create_users([items[i] for i in indexes])
+                for i, ok in zip(indexes, shard_results):
+                    results[i] = ok
+            for i, key in reserved.items():
+                if not results[i]:
+                    del index[key]
+            self._save_usernames(index)
+        return results
+
+    def rename_user(self, uid: str, new_username: str) -> bool:
+        key = normalize_username(new_username)
+        with file_lock(self.dir_lock_path):
+            index = dict(self._load_usernames())
+            if index.get(key, uid) != uid:
+                return False
+            old = self.get_user(uid)
+            if old is None or not self.shard_for(uid).rename_user(uid, new_username):
+                return False
+            index.pop(normalize_username(old.get("username")), None)
+            index[key] = uid
+            self._save_usernames(index)
+        return True
+
+    def delete_user(self, uid: str) -> bool:
+        with file_lock(self.dir_lock_path):
+            if not self.shard_for(uid).delete_user(uid):
+                return False
+            index = {k: v for k, v in self._load_usernames().items() if v != uid}
+            self._save_usernames(index)
+        return True
+
+    def read_user(self, uid: str, days: list, keys: dict):
+        return self.shard_for(uid).read_user(uid, days, keys)
+
+    def apply_batch(self, items: list) -> list:
+        results = [False] * len(items)
+        todo = list(range(len(items)))
+        # Each shard compacts its own event log (JSONBackend.apply_batch).
+        # A rebalance may move users while we write; re-route and retry once
+        for _ in range(2):
+            with self._lock:
+                self._refresh()
+                generation, shards = self.generation, self.shards
+            by_shard = {}
+            for i in todo:
+                by_shard.setdefault(shard_of(items[i][0], len(shards)), []).append(i)
+            for shard, indexes in by_shard.items():
+                try:
+                    shard_results = shards[shard].apply_batch([items[i] for i in indexes])
+                except RetiredShardError:
+                    continue
+                for i, ok in zip(indexes, shard_results):
+                    results[i] = ok
+            todo = [i for i in todo if not results[i]]
+            self._refresh()
+            if not todo or self.generation == generation:
+                break
+        return results
+
+    def get_intake(self, uid: str, day: str) -> int:
+        return self.shard_for(uid).get_intake(uid, day)
+
+    def get_intakes(self, uid: str, days: list) -> dict:
+        return self.shard_for(uid).get_intakes(uid, days)
+
+    def get_period_totals(self, uid: str, period: str, keys: list) -> dict:
+        return self.shard_for(uid).get_period_totals(uid, period, keys)
+
+    def get_history(self, uid: str, start: str, end: str):
+        return self.shard_for(uid).get_history(uid, start, end)
+
+    def get_events(self, uid: str, day: str) -> list:
+        return self.shard_for(uid).get_events(uid, day)
+
+    def compact_events(self, keep_days: int = EVENT_RETENTION_DAYS) -> int:
+        def compact(shard):
+            try:
+                return shard.compact_events(keep_days)
+            except RetiredShardError:
+                # Rebalanced meanwhile; the next run compacts the new shards
+                return 0
+        return sum(self.scan(compact))
+
+    # --- Admin-wide queries ---
+
+    def scan(self, fn, workers: int = SCAN_WORKERS) -> list:
+        """Run fn(shard_backend) on every shard in parallel; results in shard order."""
+        self._refresh()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(fn, self.shards))
+
+    def scan_users(self, fn, workers: int = SCAN_WORKERS) -> list:
+        """Apply fn(uid, user_data) to every user across all shards in parallel."""
+        def per_shard(shard):
+            users = shard.load().get("users", {})
+            return [fn(uid, rec) for uid, rec in users.items() if isinstance(rec, dict)]
+        return [result for part in self.scan(per_shard, workers) for result in part]
+
+    def stats(self) -> dict:
+        """Per-shard user counts and file sizes."""
+        def shard_stats(shard):
+            try:
+                size = os.path.getsize(shard.path)
+            except OSError:
+                size = 0
+            return {"file": os.path.basename(shard.path),
+                    "users": len(shard.load().get("users", {})), "bytes": size}
+        shards = self.scan(shard_stats)
+        return {
+            "generation": self.generation,
+            "shard_count": self.shard_count,
+            "users": sum(s["users"] for s in shards),
+            "bytes": sum(s["bytes"] for s in shards),
+            "largest_shard_users": max((s["users"] for s in shards), default=0),
+            "shards": shards,
+        }
+
+    # --- Rebalancing & import ---
+
+    def rebalance(self, shard_count: int = None, extra_users: dict = None) -> dict:
+        """Rewrite all users into a new generation of `shard_count` shards.
+
+        Holds the directory lock and every old shard's file lock, so signups
+        and intake writes wait until the new manifest is in place; writers
+        that raced with it find their shard retired (see Shard), re-route
+        through the new manifest and retry.
+        """
+        with file_lock(self.dir_lock_path):
+            self._refresh()
+            old_paths = [shard.path for shard in self.shards]
+            with contextlib.ExitStack() as stack:
+                for path in old_paths:
+                    stack.enter_context(file_lock(path))
+                users = {}
+                for path in old_paths:
+                    # Read files directly: the shared document cache may be
+                    # held by a writer that is waiting for our file lock
+                    users.update(load_data(path).get("users", {}) if os.path.exists(path) else {})
+                for uid, rec in (extra_users or {}).items():
+                    users.setdefault(uid, rec)
+                if shard_count is None:
+                    shard_count = suggest_shard_count(len(users))
+
+                generation = self.generation + 1
+                buckets = [{} for _ in range(shard_count)]
+                for uid, rec in users.items():
+                    buckets[shard_of(uid, shard_count)][uid] = rec
+                for i, bucket in enumerate(buckets):
+                    path = os.path.join(self.directory, shard_file(generation, i))
+                    if not save_data({"users": bucket, "version": 1}, path):
+                        raise OSError(f"Could not write shard {path}")
+
+                index = {}
+                for uid, rec in users.items():
+                    if isinstance(rec, dict) and rec.get("username"):
+                        index.setdefault(normalize_username(rec["username"]), uid)
+                self._save_usernames(index)
+                self._write_manifest(generation, shard_count)
+                self._refresh()
+
+                # Drop old generations while still holding their locks; a
+                # writer queued on an old shard re-routes (Shard._check_writable)
+                current = {os.path.basename(s.path) for s in self.shards}
+                for path in glob.glob(os.path.join(self.directory, "g*-*.json*")):
+                    if os.path.basename(path).split(".json")[0] + ".json" not in current:
+                        with contextlib.suppress(OSError):
+                            os.remove(path)
+        return {"generation": generation, "shard_count": shard_count, "users": len(users)}
+
+    def import_document(self, path: str = DATA_FILE) -> dict:
+        """Copy the users of a single-file JSON store into the shards (existing uids win)."""
+        return self.rebalance(self.shard_count, extra_users=load_data(path).get("users", {}))
+
+
+register_backend(ShardedJSONBackend.name, ShardedJSONBackend)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect and rebalance the sharded JSON store.")
+    parser.add_argument("command", choices=["stats", "rebalance", "import"])
+    parser.add_argument("--dir", default=SHARD_DIR, help="Shard directory")
+    parser.add_argument("--shards", type=int, default=None,
+                        help="New shard count for rebalance (default: based on user count)")
+    parser.add_argument("--from", dest="source", default=DATA_FILE,
+                        help="Single-file JSON store to import")
+    args = parser.parse_args()
+
+    backend = ShardedJSONBackend(args.dir)
+    if args.command == "rebalance":
+        result = backend.rebalance(args.shards)
+    elif args.command == "import":
+        result = backend.import_document(args.source)
+    else:
+        result = backend.stats()
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,234 @@
+"""
+WaterBuddy - Streak and goal statistics.
+
+Shown on the Home page for each user:
+- current streak: consecutive days on which the goal was reached, ending
+  today (or yesterday, while today's goal is still open)
+- longest streak ever
+- weekly goal-hit rate: share of the last 7 days that reached the goal
+- 30-day moving average intake
+
+StreakStats keeps running per-day state (the streak ending on each day and
+the longest streak up to it), so applying today's log to a built state
+touches one day. Editing or resetting a past day recomputes only the suffix
+from that day, and stops as soon as the running state matches what was
+stored before.
+
+The state lives only in process memory and is not persisted. The
+process-wide stats_engine builds a user's state from get_history() over
+STATS_HISTORY_DAYS (one read and an O(days) pass) on the user's first
+summary in each server process, after every restart, and again every
+STATS_TTL_S, and follows committed changes through a storage change
+listener in between. Writes from other processes show up only at the next
+rebuild, except today's total, which Home passes in from its snapshot.
+
+Run `python stats.py` to measure the per-log cost with 1, 5 and 10 years
+of history.
+"""
+
+# =======================
+# 1. Imports
+# =======================
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from storage import add_change_listener, event_delta
+
+# =======================
+# 2. Configuration & Constants
+# =======================
+# How far back the state is built from on first use
+STATS_HISTORY_DAYS = 3660
+# Rebuild a user's state after this long, to pick up writes made by other
+# server processes (each rebuild reads up to STATS_HISTORY_DAYS days)
+STATS_TTL_S = 300
+
+WEEK_DAYS = 7
+AVERAGE_DAYS = 30
+
+# =======================
+# 3. Running state
+# =======================
+
+class StreakStats:
+    """Running streak state for one user, one entry per day from `start`.
+
+    values[i] is the intake on start + i days, run[i] the goal streak
+    ending on that day and best[i] the longest streak up to that day.
+    """
+
+    def __init__(self, start: date, values, goal: int):
+        self.start = start
+        self.goal = int(goal)
+        self.values = [int(v) for v in values]
+        self.run = []
+        self.best = []
+        self._recompute(0)
+
+    @classmethod
+    def from_history(cls, history, goal: int):
+        """Build from a DayHistory, starting at the first logged day."""
+        logged = np.flatnonzero(history.values)
+        first = int(logged[0]) if len(logged) else len(history.values)
+        return cls(history.start + timedelta(days=first), history.values[first:].tolist(), goal)
+
+    def _recompute(self, i: int) -> int:
+        """Recompute run/best from day i on; returns the number of days visited."""
+        n = len(self.values)
+        for j in range(i, n):
+            hit = self.values[j] >= self.goal
+            run = (self.run[j - 1] + 1 if j else 1) if hit else 0
+            best = max(self.best[j - 1] if j else 0, run)
+            if j < len(self.run):
+                # Same state as before: everything after it is unchanged too
+                if j > i and self.run[j] == run and self.best[j] == best:
+                    return j - i
+                self.run[j], self.best[j] = run, best
+            else:
+                self.run.append(run)
+                self.best.append(best)
+        return n - i
+
+    def _index(self, day) -> int:
+        return (date.fromisoformat(day) - self.start).days if isinstance(day, str) \
+            else (day - self.start).days
+
+    def value(self, day) -> int:
+        i = self._index(day)
+        return self.values[i] if 0 <= i < len(self.values) else 0
+
+    def set_day(self, day, ml: int) -> int:
+        """Store one day's total; returns the number of days recomputed."""
+        i = self._index(day)
+        if not self.values:
+            self.start += timedelta(days=i)
+            i = 0
+        if i < 0:
+            # Before the first logged day: shift the start and rebuild
+            self.start += timedelta(days=i)
+            self.values[:0] = [0] * -i
+            self.run, self.best = [], []
+            i = 0
+        first = min(i, len(self.run))
+        if i >= len(self.values):
+            # Days without logs in between count as missed
+            self.values.extend([0] * (i + 1 - len(self.values)))
+        self.values[i] = int(ml)
+        return self._recompute(first)
+
+    def apply_event(self, day: str, kind: str, ml: int) -> int:
+        current = self.value(day)
+        return self.set_day(day, current + event_delta(kind, ml, current))
+
+    def set_goal(self, goal: int) -> None:
+        """A new goal changes every day's hit/miss, so rebuild all state."""
+        if int(goal) != self.goal:
+            self.goal = int(goal)
+            self.run, self.best = [], []
+            self._recompute(0)
+
+    def _window(self, end: int, days: int) -> list:
+        return self.values[max(end - days + 1, 0):max(end + 1, 0)]
+
+    def summary(self, today) -> dict:
+        """Streaks, weekly hit rate and moving average as of `today`."""
+        t = self._index(today)
+        n = len(self.values)
+        if 0 <= t < n and self.values[t] >= self.goal:
+            current = self.run[t]
+        else:
+            # Today's goal is still open: the streak up to yesterday counts
+            y = t - 1
+            current = self.run[y] if 0 <= y < n else 0
+        longest = self.best[min(t, n - 1)] if n and t >= 0 else 0
+        week = self._window(t, WEEK_DAYS)
+        return {
+            "current_streak": current,
+            "longest_streak": longest,
+            "weekly_hit_rate": sum(1 for v in week if v >= self.goal) / WEEK_DAYS,
+            "moving_average": round(sum(self._window(t, AVERAGE_DAYS)) / AVERAGE_DAYS),
+        }
+
+# =======================
+# 4. Engine
+# =======================
+
+class StatsEngine:
+    """Process-wide StreakStats per user, kept current by committed changes."""
+
+    def __init__(self, ttl: float = STATS_TTL_S):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._users = {}
+
+    def summary(self, store, uid: str, goal: int, today: str, today_intake: int = None) -> dict:
+        """Stats for one user; `today_intake` (from the rerun's snapshot) keeps
+        today's total exact even for writes this process did not see."""
+        with self._lock:
+            entry = self._users.get(uid)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            end = date.fromisoformat(today)
+            start = end - timedelta(days=STATS_HISTORY_DAYS)
+            history = store.get_history(uid, start.isoformat(), today)
+            entry = (StreakStats.from_history(history, goal), time.monotonic())
+            with self._lock:
+                self._users[uid] = entry
+        with self._lock:
+            stats = entry[0]
+            stats.set_goal(goal)
+            if today_intake is not None and stats.value(today) != today_intake:
+                stats.set_day(today, today_intake)
+            return stats.summary(today)
+
+    def on_changes(self, uid: str, changes: list) -> None:
+        with self._lock:
+            entry = self._users.get(uid)
+            if entry is None:
+                return
+            stats = entry[0]
+            for change in changes:
+                if change[0] == "event":
+                    stats.apply_event(*change[1:])
+                elif "user_goal_ml" in change[1]:
+                    try:
+                        stats.set_goal(int(change[1]["user_goal_ml"]))
+                    except (TypeError, ValueError):
+                        pass
+
+    def forget(self, uid: str) -> None:
+        with self._lock:
+            self._users.pop(uid, None)
+
+
+stats_engine = StatsEngine()
+add_change_listener(stats_engine.on_changes)
+
+
+if __name__ == "__main__":
+    import random
+
+    from storage import EVENT_QUICK, EVENT_SET
+
+    today = date.today()
+    logs = 10000
+    for years in (1, 5, 10):
+        days = 365 * years
+        values = [random.choice([0, 1500, 2500, 3000]) for _ in range(days)]
+        stats = StreakStats(today - timedelta(days=days - 1), values, 2500)
+
+        t0 = time.perf_counter()
+        for _ in range(logs):
+            stats.apply_event(today.isoformat(), EVENT_QUICK, 250)
+            stats.summary(today)
+        per_log = (time.perf_counter() - t0) / logs * 1e6
+
+        # Worst case edit: the first day, so the whole history is the suffix
+        first = stats.start.isoformat()
+        t0 = time.perf_counter()
+        visited = stats.apply_event(first, EVENT_SET, 0 if stats.value(first) else 3000)
+        edit_ms = (time.perf_counter() - t0) * 1000
+        print(f"{years:>2} year(s): {per_log:.1f} us per log (incl. summary), "
+              f"first-day edit {edit_ms:.3f} ms ({visited} of {days} days recomputed)")
@@ -0,0 +1,1270 @@
+"""
+WaterBuddy - Storage backends.
+
+The helpers in app.py no longer read and rewrite the whole data file on every
+click. They talk to a storage backend instead:
+
+- "sqlite" (default): an embedded SQLite database in WAL mode with one row per
+  user and one row per user/day, so logging water writes a single row.
+- "json": the legacy whole-file 'water_data.json' store.
+
+The backend is selected with the WATERBUDDY_BACKEND environment variable.
+
+Intake changes are recorded as timestamped events in an append-only log
+(quick log, custom add, reset, set). Daily, weekly and monthly totals are
+materialized aggregates updated by each event, and old events are
+periodically compacted away once their day totals are final.
+
+Each Streamlit rerun reads a user through one UserSnapshot and writes through
+one UnitOfWork, so a view costs one read and at most one write. Longer
+ranges are read on top: the History view reads its range with get_history(),
+and Home reads the streak history when the stats engine's copy has expired
+(stats.STATS_TTL_S) - at most two reads per rerun. io_counter keeps the
+per-rerun read/write counts, including these.
+
+The JSON backend shares one parsed copy of the data file across all sessions
+of the server process (DocumentCache), invalidated by the file's mtime/size
+and a version stamp written on every save.
+
+Writes from concurrent sessions are folded into group commits (writer.py).
+The JSON file is only rewritten under an OS-level lock, via a temp file that
+is fsynced and atomically renamed into place. With WATERBUDDY_WRITE_BEHIND=1,
+commits are queued to a background writer instead (see get_write_behind).
+"""
+
+# =======================
+# 1. Imports
+# =======================
+import copy
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+from types import MappingProxyType
+from history import DayHistory
+from metrics import instrument, registry
+from writer import GroupCommitter, WriteBehindQueue, atomic_write_json, file_lock
+
+# =======================
+# 2. Configuration & Constants
+# =======================
+DATA_FILE = "water_data.json"
+DB_FILE = "water_data.db"
+# Sidecar username -> uid index used by the JSON backend
+INDEX_SUFFIX = ".index.json"
+
+DEFAULT_BACKEND = "sqlite"
+BACKEND_ENV_VAR = "WATERBUDDY_BACKEND"
+# Set to 1 to queue writes to a background thread (write-behind mode)
+WRITE_BEHIND_ENV_VAR = "WATERBUDDY_WRITE_BEHIND"
+
+# --- Intake event log ---
+# Additive kinds add their ml to the day total; "reset" and "set" replace it.
+EVENT_QUICK = "quick"
+EVENT_CUSTOM = "custom"
+EVENT_RESET = "reset"
+EVENT_SET = "set"
+# Events older than this are folded into their day totals and dropped
+EVENT_RETENTION_DAYS = 30
+# Run compaction automatically after this many appended events
+COMPACT_EVERY = 500
+
+# Days of history loaded into a UserSnapshot (the History view shows 7)
+SNAPSHOT_DAYS = 7
+
+# Guards the process-wide singletons (backends, document caches)
+_instances_lock = threading.RLock()
+
+# =======================
+# 3. Legacy JSON file helpers
+# =======================
+
+@instrument("storage.load_data")
+def load_data(path: str = DATA_FILE):
+    """Loads all user data from the local JSON file."""
+    if not os.path.exists(path):
+        # Initialize file with an empty user dictionary
+        initial_data = {"users": {}}
+        try:
+            with open(path, "w") as f:
+                json.dump(initial_data, f, indent=4)
+        except Exception:
+            return initial_data
+        return initial_data
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+            registry.add_bytes("storage.load_data", read=f.tell())
+            # Ensure the top-level structure exists
+            if not isinstance(data, dict) or "users" not in data:
+                 return {"users": {}}
+            return data
+    except (json.JSONDecodeError, FileNotFoundError):
+        # Handle corrupt or missing file
+        return {"users": {}}
+
+@instrument("storage.save_data")
+def save_data(data, path: str = DATA_FILE):
+    """Saves all user data back to the local JSON file (atomic replace)."""
+    try:
+        atomic_write_json(path, data, indent=4)
+        return True
+    except Exception:
+        return False
+
+def normalize_username(username: str) -> str:
+    """Lookup key for usernames: trimmed and case-folded ('Alice ' -> 'alice')."""
+    return (username or "").strip().casefold()
+
+def period_keys(day: str) -> dict:
+    """Aggregate keys a day contributes to, e.g. {'week': '2024-W05', 'month': '2024-02'}."""
+    year, week, _ = date.fromisoformat(day).isocalendar()
+    return {"week": f"{year}-W{week:02d}", "month": day[:7]}
+
+# Callbacks run after a user's changes were committed (or queued in write-behind mode)
+_change_listeners = []
+
+def add_change_listener(callback) -> None:
+    """Call callback(uid, changes) after every successful apply_changes()."""
+    _change_listeners.append(callback)
+
+def _notify_changes(uid: str, changes: list) -> None:
+    for callback in _change_listeners:
+        callback(uid, changes)
+
+def event_delta(kind: str, ml: int, current: int) -> int:
+    """Change to a day total caused by one event."""
+    if kind == EVENT_RESET:
+        return -current
+    if kind == EVENT_SET:
+        return max(0, int(ml)) - current
+    # Additive events never take a day below zero
+    return max(int(ml), -current)
+
+# =======================
+# 4. Backends
+# =======================
+
+class StorageBackend:
+    """Interface shared by all storage backends.
+
+    User records are plain dicts with 'username', 'password', 'created_at'
+    and 'profile' keys. Day keys are ISO date strings (YYYY-MM-DD).
+    """
+
+    name = "base"
+
+    def __init__(self):
+        # Concurrent apply_changes() calls are folded into apply_batch() commits
+        self.committer = GroupCommitter(self.apply_batch)
+        # Events appended by this process, for periodic compaction
+        self._appends = 0
+        self._appends_lock = threading.Lock()
+
+    def get_user(self, uid: str):
+        """Return the user record (without day data) or None."""
+        raise NotImplementedError
+
+    def find_uid(self, username: str):
+        """Return the uid registered for a username (case-insensitive) or None."""
+        raise NotImplementedError
+
+    def find_user(self, username: str):
+        """Return (uid, user_record) if found, else (None, None)."""
+        uid = self.find_uid(username)
+        rec = self.get_user(uid) if uid else None
+        if rec is None:
+            return None, None
+        return uid, rec
+
+    def create_user(self, uid: str, record: dict) -> bool:
+        """Insert a new user record. Fails if the username is already taken."""
+        raise NotImplementedError
+
+    def create_users(self, items: list) -> list:
+        """Bulk insert [(uid, record), ...] (used by migrate.py).
+
+        One result per item: True if created, False if the uid or username
+        is already taken, None if it could not be written (storage error).
+        """
+        return [self.create_user(uid, record) for uid, record in items]
+
+    def rename_user(self, uid: str, new_username: str) -> bool:
+        """Change a username. Fails if the new name belongs to another user."""
+        raise NotImplementedError
+
+    def delete_user(self, uid: str) -> bool:
+        """Remove a user together with all of their day data."""
+        raise NotImplementedError
+
+    def read_user(self, uid: str, days: list, keys: dict):
+        """Return one user's record, day totals and period totals in one read.
+
+        `keys` maps period -> key, e.g. period_keys(today). The result is
+        {'record': ..., 'days': {day: ml}, 'totals': {period: ml}}, or None
+        when the user does not exist.
+        """
+        record = self.get_user(uid)
+        if record is None:
+            return None
+        return {
+            "record": record,
+            "days": self.get_intakes(uid, days),
+            "totals": {
+                period: self.get_period_totals(uid, period, [key])[key]
+                for period, key in keys.items()
+            },
+        }
+
+    def apply_changes(self, uid: str, changes: list) -> bool:
+        """Apply a batch of changes for one user in a single write.
+
+        Changes are ('event', day, kind, ml) or ('profile', updates) tuples.
+        Calls arriving together from several sessions share one commit.
+        """
+        ok = self.committer.submit((uid, changes))
+        if ok:
+            _notify_changes(uid, changes)
+        return ok
+
+    def apply_batch(self, items: list) -> list:
+        """Commit [(uid, changes), ...] at once; returns one bool per item."""
+        raise NotImplementedError
+
+    def update_profile(self, uid: str, updates: dict) -> bool:
+        """Merge updates into the user's profile."""
+        return self.apply_changes(uid, [("profile", updates)])
+
+    def get_intake(self, uid: str, day: str) -> int:
+        """Return the intake in ml stored for one day."""
+        raise NotImplementedError
+
+    def record_event(self, uid: str, day: str, kind: str, ml: int = 0) -> bool:
+        """Append an intake event and apply it to the day/week/month totals."""
+        return self.apply_changes(uid, [("event", day, kind, ml)])
+
+    def add_intake(self, uid: str, day: str, ml: int, kind: str = EVENT_QUICK) -> bool:
+        """Log a drink of `ml` for one day."""
+        return self.record_event(uid, day, kind, ml)
+
+    def reset_intake(self, uid: str, day: str) -> bool:
+        """Set one day's total back to 0."""
+        return self.record_event(uid, day, EVENT_RESET)
+
+    def set_intake(self, uid: str, day: str, ml: int) -> bool:
+        """Overwrite the intake in ml for one day."""
+        return self.record_event(uid, day, EVENT_SET, ml)
+
+    def get_intakes(self, uid: str, days: list) -> dict:
+        """Return {day: intake_ml} for the given days (0 when missing)."""
+        return {day: self.get_intake(uid, day) for day in days}
+
+    def get_period_totals(self, uid: str, period: str, keys: list) -> dict:
+        """Return materialized 'week' or 'month' totals as {key: intake_ml}."""
+        raise NotImplementedError
+
+    def get_history(self, uid: str, start: str, end: str) -> DayHistory:
+        """Daily intake from start to end (inclusive) as a day-indexed array."""
+        first, last = date.fromisoformat(start), date.fromisoformat(end)
+        days = [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+        return DayHistory.from_days(self.get_intakes(uid, days), first, last)
+
+    def get_events(self, uid: str, day: str) -> list:
+        """Return the logged events of one day, oldest first."""
+        raise NotImplementedError
+
+    def compact_events(self, keep_days: int = EVENT_RETENTION_DAYS) -> int:
+        """Fold events older than keep_days into their totals; returns events removed."""
+        raise NotImplementedError
+
+    def _count_appends(self, items: list, results: list) -> None:
+        """Run compact_events() every COMPACT_EVERY events appended by apply_batch().
+
+        Call it after the batch's locks are released (compaction takes them again).
+        """
+        events = sum(
+            1 for ok, (_, changes) in zip(results, items) if ok
+            for change in changes if change[0] == "event"
+        )
+        if not events:
+            return
+        with self._appends_lock:
+            self._appends += events
+            due = self._appends // COMPACT_EVERY != (self._appends - events) // COMPACT_EVERY
+        if due:
+            try:
+                self.compact_events()
+            except Exception:
+                # Housekeeping only: the batch itself is already committed
+                pass
+
+
+class DocumentCache:
+    """Process-wide cache of one parsed JSON data file, shared by all sessions.
+
+    The parsed document is reused until the file's mtime/size changes, so
+    sessions only pay the parse cost after an actual write. Values derived
+    from one user's record (e.g. read_user bundles) are cached per uid and
+    only dropped when that user's record changes.
+
+    The cached document is shared: treat it as read-only and copy before
+    mutating (see JSONBackend._writable).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self.doc = None
+        self.stat = None
+        # Bumped whenever the cached document is replaced
+        self.version = 0
+        self.derived = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _file_stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def get(self):
+        """Return the parsed document, re-reading the file only if it changed."""
+        with self.lock:
+            stat = self._file_stat()
+            if self.doc is not None and stat is not None and stat == self.stat:
+                self.hits += 1
+                return self.doc
+            self.misses += 1
+            doc = load_data(self.path)
+            self._replace(doc, self._file_stat())
+            return doc
+
+    def store(self, doc, changed_uids=None) -> None:
+        """Adopt a document this process just wrote, invalidating only changed users."""
+        with self.lock:
+            old_doc = self.doc
+            self.doc = doc
+            self.stat = self._file_stat()
+            self.version += 1
+            if changed_uids is None or old_doc is None:
+                self.derived.clear()
+            else:
+                for uid in changed_uids:
+                    self.derived.pop(uid, None)
+
+    def _replace(self, doc, stat) -> None:
+        # Someone else wrote the file: keep derived values of users whose
+        # record is unchanged (dict equality, no re-serialization needed).
+        old_users = (self.doc or {}).get("users", {})
+        new_users = doc.get("users", {})
+        for uid in list(self.derived):
+            if uid not in new_users or old_users.get(uid) != new_users[uid]:
+                del self.derived[uid]
+        self.doc = doc
+        self.stat = stat
+        self.version += 1
+
+    def get_derived(self, uid: str, key):
+        with self.lock:
+            return self.derived.get(uid, {}).get(key)
+
+    def put_derived(self, uid: str, key, value, version: int) -> None:
+        with self.lock:
+            # Ignore values computed from a document that has since been replaced
+            if version == self.version:
+                self.derived.setdefault(uid, {})[key] = value
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "version": self.version,
+            "cached_users": len(self.derived),
+        }
+
+
+_document_caches = {}
+
+def _serialized(method):
+    """Run a JSONBackend writer under the document and file locks (load -> modify -> save)."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.cache.lock, file_lock(self.path):
+            self._check_writable()
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def get_document_cache(path: str) -> DocumentCache:
+    """Return the process-wide DocumentCache for a data file."""
+    key = os.path.abspath(path)
+    with _instances_lock:
+        if key not in _document_caches:
+            _document_caches[key] = DocumentCache(path)
+        return _document_caches[key]
+
+def drop_document_cache(path: str) -> None:
+    """Forget the DocumentCache of a data file that is no longer used."""
+    with _instances_lock:
+        _document_caches.pop(os.path.abspath(path), None)
+
+
+class JSONBackend(StorageBackend):
+    """Legacy backend: everything lives in one JSON document on disk."""
+
+    name = "json"
+
+    # Per-user keys that are not part of the user record itself
+    DATA_KEYS = ("days", "weeks", "months", "events")
+
+    def __init__(self, path: str = DATA_FILE):
+        super().__init__()
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self._index = None
+        self._index_stat = None
+        self.cache = get_document_cache(path)
+
+    def load(self):
+        """Return the shared, cached document (do not mutate it)."""
+        return self.cache.get()
+
+    def save(self, data, changed_uids=None) -> bool:
+        with self.cache.lock:
+            data["version"] = _as_int(data.get("version")) + 1
+            if not save_data(data, self.path):
+                return False
+            self.cache.store(data, changed_uids)
+        return True
+
+    def _check_writable(self) -> None:
+        """Called with the locks held before every write; subclasses raise to refuse it."""
+
+    @staticmethod
+    def _writable(data, *uids):
+        """Copy-on-write: copy the document shell and deep-copy the touched users."""
+        data = dict(data)
+        data["users"] = dict(data.get("users", {}))
+        for uid in uids:
+            if uid in data["users"]:
+                data["users"][uid] = copy.deepcopy(data["users"][uid])
+        return data
+
+    def _cached(self, uid: str, key, compute):
+        """Return a per-user derived value, computing it from the document on a miss."""
+        with self.cache.lock:
+            # Stat check first, so writes from other processes drop stale values
+            data = self.load()
+            version = self.cache.version
+            value = self.cache.get_derived(uid, key)
+        if value is None:
+            value = compute(data.get("users", {}).get(uid))
+            self.cache.put_derived(uid, key, value, version)
+        return value
+
+    # --- username index (sidecar file, so lookups skip the big document) ---
+
+    def _build_index(self, data) -> dict:
+        index = {}
+        for uid, rec in data.get("users", {}).items():
+            if isinstance(rec, dict) and rec.get("username"):
+                index.setdefault(normalize_username(rec["username"]), uid)
+        return index
+
+    def _index_file_stat(self):
+        try:
+            st = os.stat(self.index_path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _save_index(self, index: dict) -> None:
+        self._index = index
+        try:
+            atomic_write_json(self.index_path, {"usernames": index})
+        except OSError:
+            self._index_stat = None
+            return
+        self._index_stat = self._index_file_stat()
+
+    def _load_index(self) -> dict:
+        """The username index, re-read whenever another process rewrote the file."""
+        stat = self._index_file_stat()
+        if self._index is None or stat is None or stat != self._index_stat:
+            try:
+                with open(self.index_path, "r") as f:
+                    self._index = json.load(f)["usernames"]
+                self._index_stat = stat
+            except (OSError, ValueError, KeyError, TypeError):
+                # Missing or corrupt index: rebuild it from the document
+                self._save_index(self._build_index(self.load()))
+        return self._index
+
+    def find_uid(self, username: str):
+        return self._load_index().get(normalize_username(username))
+
+    def get_user(self, uid: str):
+        def compute(rec):
+            if not isinstance(rec, dict):
+                return False
+            return {k: v for k, v in rec.items() if k not in self.DATA_KEYS}
+        return self._cached(uid, "record", compute) or None
+
+    def find_user(self, username: str):
+        uid, rec = super().find_user(username)
+        if uid and normalize_username(rec.get("username")) != normalize_username(username):
+            # The document was changed behind the index's back
+            self._save_index(self._build_index(self.load()))
+            return super().find_user(username)
+        return uid, rec
+
+    def create_user(self, uid: str, record: dict) -> bool:
+        return self.create_users([(uid, record)])[0]
+
+    @_serialized
+    def create_users(self, items: list) -> list:
+        data = self._writable(self.load())
+        # The whole document is loaded for the write anyway, so refresh the
+        # index from it to catch edits made outside this backend.
+        index = self._build_index(data)
+        results = []
+        for uid, record in items:
+            key = normalize_username(record.get("username"))
+            if key in index or uid in data["users"]:
+                results.append(False)
+                continue
+            data["users"][uid] = self._ensure_totals(dict(record, days=record.get("days", {})))
+            index[key] = uid
+            results.append(True)
+        if not any(results):
+            if index != self._load_index():
+                self._save_index(index)
+            return results
+        created = [uid for (uid, _), ok in zip(items, results) if ok]
+        if not self.save(data, created):
+            return [None] * len(items)
+        self._save_index(index)
+        return results
+
+    @_serialized
+    def rename_user(self, uid: str, new_username: str) -> bool:
+        data = self._writable(self.load(), uid)
+        if uid not in data["users"]:
+            return False
+        index = self._build_index(data)
+        key = normalize_username(new_username)
+        if index.get(key, uid) != uid:
+            return False
+        index.pop(normalize_username(data["users"][uid].get("username")), None)
+        data["users"][uid]["username"] = new_username
+        if not self.save(data, [uid]):
+            return False
+        index[key] = uid
+        self._save_index(index)
+        return True
+
+    @_serialized
+    def delete_user(self, uid: str) -> bool:
+        data = self._writable(self.load())
+        if data["users"].pop(uid, None) is None:
+            return False
+        if not self.save(data, [uid]):
+            return False
+        self._save_index(self._build_index(data))
+        return True
+
+    def read_user(self, uid: str, days: list, keys: dict):
+        def compute(rec):
+            if not isinstance(rec, dict):
+                return False
+            days_data = rec.get("days", {})
+            totals = self._totals(rec)
+            return {
+                "record": {k: v for k, v in rec.items() if k not in self.DATA_KEYS},
+                "days": {day: _as_int(days_data.get(day, {}).get("intake")) for day in days},
+                "totals": {
+                    period: _as_int(totals[period + "s"].get(key))
+                    for period, key in keys.items()
+                },
+            }
+        key = ("read_user", tuple(days), tuple(sorted(keys.items())))
+        return self._cached(uid, key, compute) or None
+
+    def apply_batch(self, items: list) -> list:
+        results = self._apply_batch(items)
+        self._count_appends(items, results)
+        return results
+
+    @_serialized
+    def _apply_batch(self, items: list) -> list:
+        uids = {uid for uid, _ in items}
+        data = self._writable(self.load(), *uids)
+        results = []
+        for uid, changes in items:
+            if uid not in data["users"]:
+                results.append(False)
+                continue
+            user_data = self._ensure_totals(data["users"][uid])
+            for change in changes:
+                if change[0] == "profile":
+                    # Initialize profile if it doesn't exist
+                    user_profile = user_data.get("profile", {})
+                    user_profile.update(change[1])
+                    user_data["profile"] = user_profile
+                else:
+                    self._apply_event(user_data, *change[1:])
+            results.append(True)
+        if any(results) and not self.save(data, uids):
+            return [False] * len(items)
+        return results
+
+    def get_intake(self, uid: str, day: str) -> int:
+        return self.get_intakes(uid, [day])[day]
+
+    @staticmethod
+    def _totals(user_data: dict) -> dict:
+        """Week/month totals of a record, derived from 'days' for records written before the event log."""
+        if "weeks" in user_data and "months" in user_data:
+            return {"weeks": user_data["weeks"], "months": user_data["months"]}
+        totals = {"weeks": {}, "months": {}}
+        for day, node in user_data.get("days", {}).items():
+            intake = _as_int(node.get("intake")) if isinstance(node, dict) else 0
+            for period, key in period_keys(day).items():
+                bucket = totals[period + "s"]
+                bucket[key] = bucket.get(key, 0) + intake
+        return totals
+
+    @classmethod
+    def _ensure_totals(cls, user_data: dict) -> dict:
+        """Store derived week/month totals on a (writable) user record."""
+        user_data.update(cls._totals(user_data))
+        return user_data
+
+    @staticmethod
+    def _apply_event(user_data: dict, day: str, kind: str, ml: int) -> None:
+        day_node = user_data.setdefault("days", {}).setdefault(day, {})
+        current = _as_int(day_node.get("intake"))
+        delta = event_delta(kind, ml, current)
+        day_node["intake"] = current + delta
+        for period, key in period_keys(day).items():
+            totals = user_data.setdefault(period + "s", {})
+            totals[key] = _as_int(totals.get(key)) + delta
+        user_data.setdefault("events", []).append(
+            {"ts": time.time(), "day": day, "kind": kind, "delta": delta}
+        )
+
+    def get_intakes(self, uid: str, days: list) -> dict:
+        user_rec = self.load().get("users", {}).get(uid, {})
+        days_data = user_rec.get("days", {}) if isinstance(user_rec, dict) else {}
+        return {day: _as_int(days_data.get(day, {}).get("intake")) for day in days}
+
+    def get_period_totals(self, uid: str, period: str, keys: list) -> dict:
+        user_rec = self.load().get("users", {}).get(uid)
+        if not isinstance(user_rec, dict):
+            return {key: 0 for key in keys}
+        totals = self._totals(user_rec)[period + "s"]
+        return {key: _as_int(totals.get(key)) for key in keys}
+
+    def get_history(self, uid: str, start: str, end: str) -> DayHistory:
+        # The whole history array is cached per user; ranges are slices of it
+        def compute(rec):
+            if not isinstance(rec, dict):
+                return False
+            return DayHistory.from_days(self._day_intakes(rec))
+        history = self._cached(uid, "history", compute) or DayHistory.from_days({})
+        return history.range(start, end)
+
+    @staticmethod
+    def _day_intakes(user_data: dict) -> dict:
+        """{day: ml} of a user record."""
+        return {
+            day: _as_int(node.get("intake"))
+            for day, node in user_data.get("days", {}).items()
+            if isinstance(node, dict)
+        }
+
+    def get_events(self, uid: str, day: str) -> list:
+        user_rec = self.load().get("users", {}).get(uid, {})
+        events = user_rec.get("events", []) if isinstance(user_rec, dict) else []
+        return [e for e in events if e.get("day") == day]
+
+    @_serialized
+    def compact_events(self, keep_days: int = EVENT_RETENTION_DAYS) -> int:
+        cutoff = (date.today() - timedelta(days=keep_days)).isoformat()
+        data = self.load()
+        stale = [
+            uid for uid, rec in data.get("users", {}).items()
+            if isinstance(rec, dict)
+            and any(e.get("day", "") < cutoff for e in rec.get("events", []))
+        ]
+        if not stale:
+            return 0
+        data = self._writable(data, *stale)
+        removed = 0
+        for uid in stale:
+            events = data["users"][uid]["events"]
+            kept = [e for e in events if e.get("day", "") >= cutoff]
+            removed += len(events) - len(kept)
+            data["users"][uid]["events"] = kept
+        if not self.save(data, stale):
+            return 0
+        return removed
+
+
+class SQLiteBackend(StorageBackend):
+    """Default backend: SQLite in WAL mode with per-user and per-day rows."""
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            uid          TEXT PRIMARY KEY,
+            username     TEXT NOT NULL,
+            username_key TEXT,
+            password     TEXT NOT NULL,
+            created_at   TEXT,
+            profile      TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE TABLE IF NOT EXISTS days (
+            uid    TEXT NOT NULL,
+            day    TEXT NOT NULL,
+            intake INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (uid, day)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS intake_events (
+            id    INTEGER PRIMARY KEY AUTOINCREMENT,
+            uid   TEXT NOT NULL,
+            ts    REAL NOT NULL,
+            day   TEXT NOT NULL,
+            kind  TEXT NOT NULL,
+            delta INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS intake_events_uid_day ON intake_events (uid, day);
+        CREATE INDEX IF NOT EXISTS intake_events_day ON intake_events (day);
+        CREATE TABLE IF NOT EXISTS period_totals (
+            uid    TEXT NOT NULL,
+            period TEXT NOT NULL,
+            key    TEXT NOT NULL,
+            intake INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (uid, period, key)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path: str = DB_FILE):
+        super().__init__()
+        self.path = path
+        # Streamlit serves every session from its own thread and sqlite3
+        # connections must not be shared across threads.
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+            self._ensure_username_index(conn)
+            self._ensure_period_totals(conn)
+
+    def _ensure_period_totals(self, conn) -> None:
+        """Materialize week/month totals for day rows written before the event log."""
+        if conn.execute("SELECT 1 FROM period_totals LIMIT 1").fetchone():
+            return
+        totals = {}
+        for uid, day, intake in conn.execute("SELECT uid, day, intake FROM days"):
+            for period, key in period_keys(day).items():
+                totals[(uid, period, key)] = totals.get((uid, period, key), 0) + intake
+        conn.executemany(
+            "INSERT INTO period_totals (uid, period, key, intake) VALUES (?, ?, ?, ?)",
+            [(uid, period, key, ml) for (uid, period, key), ml in totals.items()],
+        )
+
+    def _ensure_username_index(self, conn) -> None:
+        """Add and backfill the normalized username column on older databases."""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+        if "username_key" not in columns:
+            conn.execute("ALTER TABLE users ADD COLUMN username_key TEXT")
+        rows = conn.execute(
+            "SELECT uid, username FROM users WHERE username_key IS NULL"
+        ).fetchall()
+        conn.executemany(
+            "UPDATE users SET username_key = ? WHERE uid = ?",
+            [(normalize_username(name), uid) for uid, name in rows],
+        )
+        try:
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS users_username_key ON users (username_key)"
+            )
+        except sqlite3.IntegrityError:
+            # Legacy data with names differing only by case: keep lookups fast,
+            # new signups are still checked by create_user.
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS users_username_key_dup ON users (username_key)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_user(row):
+        username, password, created_at, profile = row
+        try:
+            profile = json.loads(profile)
+        except (TypeError, ValueError):
+            profile = {}
+        return {
+            "username": username,
+            "password": password,
+            "created_at": created_at,
+            "profile": profile,
+        }
+
+    def get_user(self, uid: str):
+        row = self._connect().execute(
+            "SELECT username, password, created_at, profile FROM users WHERE uid = ?",
+            (uid,),
+        ).fetchone()
+        return self._row_to_user(row) if row else None
+
+    def find_uid(self, username: str):
+        row = self._connect().execute(
+            "SELECT uid FROM users WHERE username_key = ?",
+            (normalize_username(username),),
+        ).fetchone()
+        return row[0] if row else None
+
+    def find_user(self, username: str):
+        row = self._connect().execute(
+            "SELECT uid, username, password, created_at, profile FROM users WHERE username_key = ?",
+            (normalize_username(username),),
+        ).fetchone()
+        if row is None:
+            return None, None
+        return row[0], self._row_to_user(row[1:])
+
+    def create_user(self, uid: str, record: dict) -> bool:
+        return self.create_users([(uid, record)])[0]
+
+    def create_users(self, items: list) -> list:
+        try:
+            # One transaction for the whole batch
+            with self._connect() as conn:
+                return [self._insert_user(conn, uid, record) for uid, record in items]
+        except sqlite3.Error:
+            return [None] * len(items)
+
+    def _insert_user(self, conn, uid: str, record: dict) -> bool:
+        key = normalize_username(record["username"])
+        if conn.execute(
+            "SELECT 1 FROM users WHERE username_key = ? OR uid = ?", (key, uid)
+        ).fetchone():
+            return False
+        conn.execute(
+            "INSERT INTO users (uid, username, username_key, password, created_at, profile) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                uid,
+                record["username"],
+                key,
+                record["password"],
+                record.get("created_at"),
+                json.dumps(record.get("profile", {})),
+            ),
+        )
+        for day, node in record.get("days", {}).items():
+            self._apply_delta(conn, uid, day, _as_int(node.get("intake")))
+        return True
+
+    def rename_user(self, uid: str, new_username: str) -> bool:
+        key = normalize_username(new_username)
+        try:
+            with self._connect() as conn:
+                owner = conn.execute(
+                    "SELECT uid FROM users WHERE username_key = ?", (key,)
+                ).fetchone()
+                if owner and owner[0] != uid:
+                    return False
+                cur = conn.execute(
+                    "UPDATE users SET username = ?, username_key = ? WHERE uid = ?",
+                    (new_username, key, uid),
+                )
+                return cur.rowcount == 1
+        except sqlite3.Error:
+            return False
+
+    def delete_user(self, uid: str) -> bool:
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM days WHERE uid = ?", (uid,))
+                conn.execute("DELETE FROM intake_events WHERE uid = ?", (uid,))
+                conn.execute("DELETE FROM period_totals WHERE uid = ?", (uid,))
+                cur = conn.execute("DELETE FROM users WHERE uid = ?", (uid,))
+                return cur.rowcount == 1
+        except sqlite3.Error:
+            return False
+
+    def read_user(self, uid: str, days: list, keys: dict):
+        conn = self._connect()
+        # One read transaction, so all parts come from the same snapshot
+        conn.execute("BEGIN")
+        try:
+            record = self.get_user(uid)
+            if record is None:
+                return None
+            return {
+                "record": record,
+                "days": self.get_intakes(uid, days),
+                "totals": {
+                    period: self.get_period_totals(uid, period, [key])[key]
+                    for period, key in keys.items()
+                },
+            }
+        finally:
+            conn.commit()
+
+    def apply_batch(self, items: list) -> list:
+        results = []
+        try:
+            with self._connect() as conn:
+                # Take the write lock first so resets/sets see a stable total
+                conn.execute("BEGIN IMMEDIATE")
+                for uid, changes in items:
+                    row = conn.execute(
+                        "SELECT profile FROM users WHERE uid = ?", (uid,)
+                    ).fetchone()
+                    if row is None:
+                        results.append(False)
+                        continue
+                    for change in changes:
+                        if change[0] == "profile":
+                            self._update_profile(conn, uid, row[0], change[1])
+                            row = conn.execute(
+                                "SELECT profile FROM users WHERE uid = ?", (uid,)
+                            ).fetchone()
+                        else:
+                            self._record_event(conn, uid, *change[1:])
+                    results.append(True)
+        except sqlite3.Error:
+            return [False] * len(items)
+        self._count_appends(items, results)
+        return results
+
+    @staticmethod
+    def _update_profile(conn, uid: str, stored: str, updates: dict) -> None:
+        try:
+            profile = json.loads(stored)
+        except (TypeError, ValueError):
+            profile = {}
+        profile.update(updates)
+        conn.execute(
+            "UPDATE users SET profile = ? WHERE uid = ?",
+            (json.dumps(profile), uid),
+        )
+
+    def get_intake(self, uid: str, day: str) -> int:
+        row = self._connect().execute(
+            "SELECT intake FROM days WHERE uid = ? AND day = ?", (uid, day)
+        ).fetchone()
+        return int(row[0]) if row else 0
+
+    @staticmethod
+    def _apply_delta(conn, uid: str, day: str, delta: int) -> None:
+        """Add delta to the day total and to its week/month aggregates."""
+        conn.execute(
+            "INSERT INTO days (uid, day, intake) VALUES (?, ?, ?) "
+            "ON CONFLICT (uid, day) DO UPDATE SET intake = intake + excluded.intake",
+            (uid, day, delta),
+        )
+        conn.executemany(
+            "INSERT INTO period_totals (uid, period, key, intake) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (uid, period, key) DO UPDATE SET intake = intake + excluded.intake",
+            [(uid, period, key, delta) for period, key in period_keys(day).items()],
+        )
+
+    def _record_event(self, conn, uid: str, day: str, kind: str, ml: int) -> None:
+        delta = event_delta(kind, ml, self.get_intake(uid, day))
+        conn.execute(
+            "INSERT INTO intake_events (uid, ts, day, kind, delta) VALUES (?, ?, ?, ?, ?)",
+            (uid, time.time(), day, kind, delta),
+        )
+        self._apply_delta(conn, uid, day, delta)
+
+    def get_intakes(self, uid: str, days: list) -> dict:
+        result = {day: 0 for day in days}
+        if not days:
+            return result
+        rows = self._connect().execute(
+            "SELECT day, intake FROM days WHERE uid = ? AND day BETWEEN ? AND ?",
+            (uid, min(days), max(days)),
+        ).fetchall()
+        for day, intake in rows:
+            if day in result:
+                result[day] = int(intake)
+        return result
+
+    def get_history(self, uid: str, start: str, end: str) -> DayHistory:
+        # One range scan over the (uid, day) primary key
+        rows = self._connect().execute(
+            "SELECT day, intake FROM days WHERE uid = ? AND day BETWEEN ? AND ?",
+            (uid, start, end),
+        ).fetchall()
+        return DayHistory.from_days(dict(rows), start, end)
+
+    def get_period_totals(self, uid: str, period: str, keys: list) -> dict:
+        result = {key: 0 for key in keys}
+        if not keys:
+            return result
+        rows = self._connect().execute(
+            "SELECT key, intake FROM period_totals WHERE uid = ? AND period = ? AND key BETWEEN ? AND ?",
+            (uid, period, min(keys), max(keys)),
+        ).fetchall()
+        for key, intake in rows:
+            if key in result:
+                result[key] = int(intake)
+        return result
+
+    def get_events(self, uid: str, day: str) -> list:
+        rows = self._connect().execute(
+            "SELECT ts, day, kind, delta FROM intake_events WHERE uid = ? AND day = ? ORDER BY id",
+            (uid, day),
+        ).fetchall()
+        return [{"ts": ts, "day": d, "kind": kind, "delta": delta} for ts, d, kind, delta in rows]
+
+    def compact_events(self, keep_days: int = EVENT_RETENTION_DAYS) -> int:
+        # Day, week and month totals already include every event, so old
+        # events can simply be dropped once their day is past the window.
+        cutoff = (date.today() - timedelta(days=keep_days)).isoformat()
+        try:
+            with self._connect() as conn:
+                cur = conn.execute("DELETE FROM intake_events WHERE day < ?", (cutoff,))
+                return cur.rowcount
+        except sqlite3.Error:
+            return 0
+
+def _as_int(value) -> int:
+    """Coerce a stored intake value to int, treating junk as 0."""
+    try:
+        return int(value) if value is not None else 0
+    except (TypeError, ValueError):
+        return 0
+
+# =======================
+# 5. Request snapshot & unit of work
+# =======================
+
+# Backend methods that count as a storage read / write in io_counter
+READ_OPS = {
+    "get_user", "find_uid", "find_user", "read_user", "get_intake",
+    "get_intakes", "get_period_totals", "get_events", "get_history",
+}
+WRITE_OPS = {
+    "create_user", "create_users", "rename_user", "delete_user", "update_profile", "apply_changes",
+    "record_event", "add_intake", "reset_intake", "set_intake", "compact_events",
+    "apply_batch",
+}
+
+class IOCounter(threading.local):
+    """Storage reads/writes made by the current thread (one Streamlit rerun)."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.reads = 0
+        self.writes = 0
+
+    def as_dict(self) -> dict:
+        return {"reads": self.reads, "writes": self.writes}
+
+io_counter = IOCounter()
+
+
+class CountingStore:
+    """Wraps a backend and counts each public read/write call in io_counter
+    (and, with metrics enabled, records its latency as 'storage.<method>')."""
+
+    def __init__(self, backend: StorageBackend):
+        self.backend = backend
+
+    def __getattr__(self, name):
+        attr = getattr(self.backend, name)
+        if name not in READ_OPS and name not in WRITE_OPS:
+            return attr
+
+        def counted(*args, **kwargs):
+            if name in WRITE_OPS:
+                io_counter.writes += 1
+            else:
+                io_counter.reads += 1
+            if not registry.enabled:
+                return attr(*args, **kwargs)
+            with registry.timer("storage." + name):
+                return attr(*args, **kwargs)
+
+        return counted
+
+
+class UserSnapshot:
+    """Read-only view of one user, loaded with a single backend read.
+
+    Every UI section of a rerun is served from the same snapshot instead of
+    asking the backend again.
+    """
+
+    def __init__(self, uid: str, bundle, pending: list = ()):
+        bundle = bundle or {"record": {}, "days": {}, "totals": {}}
+        self.uid = uid
+        self.exists = bool(bundle["record"])
+        self.record = MappingProxyType(dict(bundle["record"]))
+        self._days = MappingProxyType(dict(bundle["days"]))
+        self._totals = MappingProxyType(dict(bundle["totals"]))
+        # Number of this user's changes still waiting in the write-behind queue
+        self.pending_writes = len(pending)
+
+    @classmethod
+    @instrument("storage.snapshot")
+    def load(cls, store, uid: str, today: str, days_count: int = SNAPSHOT_DAYS,
+             write_behind: WriteBehindQueue = None):
+        """Loads today's totals and the last `days_count` days in one read.
+
+        With a write-behind queue, the user's queued changes are applied on
+        top of the stored data so a session always sees its own writes.
+        """
+        end = date.fromisoformat(today)
+        days = [(end - timedelta(days=i)).isoformat() for i in range(days_count)]
+        keys = period_keys(today)
+        if write_behind is None:
+            return cls(uid, store.read_user(uid, days, keys))
+        bundle, pending = write_behind.read_consistent(
+            lambda: store.read_user(uid, days, keys), uid,
+            key=(today, days_count),
+        )
+        return cls(uid, _overlay_pending(bundle, pending, keys), pending)
+
+    @property
+    def username(self) -> str:
+        return self.record.get("username", "user")
+
+    @property
+    def profile(self) -> dict:
+        profile = self.record.get("profile")
+        return dict(profile) if isinstance(profile, dict) else {}
+
+    def intake(self, day: str) -> int:
+        return self._days.get(day, 0)
+
+    def past_intake(self) -> dict:
+        """Loaded days as {day: ml}, today first (same shape as get_past_intake)."""
+        return dict(self._days)
+
+    def period_total(self, period: str) -> int:
+        return self._totals.get(period, 0)
+
+
+def _overlay_pending(bundle, pending: list, keys: dict):
+    """Apply not-yet-durable changes to a read_user() bundle (returns a copy)."""
+    if bundle is None or not pending:
+        return bundle
+    record = dict(bundle["record"])
+    days = dict(bundle["days"])
+    totals = dict(bundle["totals"])
+    for change in pending:
+        if change[0] == "profile":
+            record["profile"] = dict(record.get("profile") or {}, **change[1])
+            continue
+        _, day, kind, ml = change
+        if day not in days:
+            # Only days inside the snapshot window are shown
+            continue
+        delta = event_delta(kind, ml, days[day])
+        days[day] += delta
+        for period, key in period_keys(day).items():
+            if keys.get(period) == key:
+                totals[period] = totals.get(period, 0) + delta
+    return {"record": record, "days": days, "totals": totals}
+
+
+class UnitOfWork:
+    """Collects one user's mutations during a rerun and commits them at once."""
+
+    def __init__(self, store, uid: str, write_behind: WriteBehindQueue = None):
+        self.store = store
+        self.uid = uid
+        self.write_behind = write_behind
+        self.changes = []
+
+    def add_intake(self, day: str, ml: int, kind: str = EVENT_QUICK) -> None:
+        self.changes.append(("event", day, kind, ml))
+
+    def reset_intake(self, day: str) -> None:
+        self.changes.append(("event", day, EVENT_RESET, 0))
+
+    def set_intake(self, day: str, ml: int) -> None:
+        self.changes.append(("event", day, EVENT_SET, ml))
+
+    def update_profile(self, updates: dict) -> None:
+        self.changes.append(("profile", dict(updates)))
+
+    @instrument("storage.commit")
+    def commit(self) -> bool:
+        """Write all pending changes in one backend call (no-op when empty).
+
+        In write-behind mode the changes are only queued; they become
+        durable shortly after on the background writer.
+        """
+        if not self.changes:
+            return True
+        changes, self.changes = self.changes, []
+        if self.write_behind is not None:
+            io_counter.writes += 1
+            ok = self.write_behind.submit(self.uid, changes)
+            if ok:
+                _notify_changes(self.uid, changes)
+            return ok
+        return self.store.apply_changes(self.uid, changes)
+
+# =======================
+# 6. Backend selection
+# =======================
+
+BACKENDS = {
+    JSONBackend.name: JSONBackend,
+    SQLiteBackend.name: SQLiteBackend,
+}
+
+_instances = {}
+
+def register_backend(name: str, backend_cls):
+    """Make an additional backend class selectable by name."""
+    BACKENDS[name] = backend_cls
+
+def get_backend(name: str = None) -> StorageBackend:
+    """Return the process-wide backend instance (created on first use)."""
+    name = name or os.environ.get(BACKEND_ENV_VAR, DEFAULT_BACKEND)
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{name}'. Choose from: {', '.join(BACKENDS)}")
+    with _instances_lock:
+        if name not in _instances:
+            _instances[name] = BACKENDS[name]()
+        return _instances[name]
+
+def get_store(name: str = None) -> CountingStore:
+    """Return the configured backend wrapped for per-rerun I/O counting."""
+    return CountingStore(get_backend(name))
+
+_write_behind = {}
+
+def get_write_behind(name: str = None):
+    """Return the process-wide write-behind queue, or None if the mode is off."""
+    if os.environ.get(WRITE_BEHIND_ENV_VAR, "").lower() not in ("1", "true", "yes"):
+        return None
+    backend = get_backend(name)
+    with _instances_lock:
+        if backend.name not in _write_behind:
+            _write_behind[backend.name] = WriteBehindQueue(backend)
+        return _write_behind[backend.name]
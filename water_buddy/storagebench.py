@@ -0,0 +1,287 @@
+"""
+WaterBuddy - Storage micro-benchmark suite.
+
+Times the data-layer operations app.py relies on, for every storage backend
+and a range of synthetic user populations, and records the peak memory of
+each operation:
+
+- load_data / save_data        whole-document read and write (JSON file)
+- open                         first find_user() in a fresh process (cold caches)
+- find_user_by_username        find_user()
+- get_today_intake             get_intake()
+- set_today_intake             set_intake()
+- get_past_intake              get_history() for the last 7 days
+
+Each (backend, population) case is built in one subprocess and measured in
+another, so every "open" is genuinely cold and memory numbers are not
+polluted by earlier cases. Whole-file backends must hold the entire
+population in memory to write it; cases whose estimated size exceeds
+--max-memory-mb are recorded as skipped with the estimate, which is where
+that design stops scaling.
+
+Usage:
+    python storagebench.py [--sizes 1000 10000 100000] [--years 0.1] \\
+        [--backends json sqlite records sharded] [--out bench.json]
+"""
+
+# =======================
+# 1. Imports
+# =======================
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+# =======================
+# 2. Configuration & Constants
+# =======================
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_YEARS = 0.1
+DEFAULT_BACKENDS = ("json", "sqlite", "records", "sharded")
+# Backends that rewrite whole files and need the full population in memory
+WHOLE_FILE_BACKENDS = ("json", "records", "sharded")
+# Users per create_users() call for streaming backends
+BUILD_BATCH = 10000
+
+# Per-operation limits: stop after this many calls or this much time
+MAX_OPS = 500
+OP_BUDGET_S = 3.0
+
+# Column labels for the printed table
+OP_LABELS = {
+    "open": "open",
+    "load_data": "load_data",
+    "save_data": "save_data",
+    "find_user_by_username": "find_user",
+    "get_today_intake": "get_today",
+    "set_today_intake": "set_today",
+    "get_past_intake": "get_past",
+}
+
+# Rough in-memory cost of the parsed JSON document
+EST_BYTES_PER_USER = 1500
+EST_BYTES_PER_DAY = 250
+
+# =======================
+# 3. Synthetic populations
+# =======================
+
+def synthetic_population(count: int, days: int, seed: int = 7):
+    """Yield (uid, record) for `count` users with `days` days of history each."""
+    rng = random.Random(seed)
+    today = date.today()
+    day_keys = [(today - timedelta(days=d)).isoformat() for d in range(days)]
+    for i in range(count):
+        yield f"uid-{i:07d}", {
+            "username": f"user{i}",
+            "password": "secret",
+            "created_at": (today - timedelta(days=days)).isoformat(),
+            "profile": {"age_group": "19-50", "user_goal_ml": rng.randrange(1500, 4000, 50)},
+            "days": {day: {"intake": rng.randrange(0, 3500, 50)} for day in day_keys},
+        }
+
+def estimate_document_mb(count: int, days: int) -> float:
+    return count * (EST_BYTES_PER_USER + days * EST_BYTES_PER_DAY) / 1e6
+
+def _open_backend(name: str, count: int = None):
+    import storage
+    import shards
+    import recordfile  # noqa: F401  (registers the "records" backend)
+
+    if name == "sharded" and count is not None:
+        # A new store gets as many shards as the population needs
+        return shards.ShardedJSONBackend(shard_count=shards.suggest_shard_count(count))
+    return storage.get_backend(name)
+
+# =======================
+# 4. Build / measure (each runs in its own subprocess)
+# =======================
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def _disk_bytes(directory: str) -> int:
+    total = 0
+    for root, _, files in os.walk(directory):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+def _build(args) -> dict:
+    name, count, days, directory = args
+    os.chdir(directory)
+    t0 = time.perf_counter()
+    backend = _open_backend(name, count)
+    population = synthetic_population(count, days)
+    if name in WHOLE_FILE_BACKENDS:
+        # One write of everything: batching would rewrite the file per batch
+        backend.create_users(list(population))
+    else:
+        batch = []
+        for item in population:
+            batch.append(item)
+            if len(batch) >= BUILD_BATCH:
+                backend.create_users(batch)
+                batch = []
+        if batch:
+            backend.create_users(batch)
+    return {
+        "build_s": round(time.perf_counter() - t0, 2),
+        "build_peak_rss_mb": _peak_rss_mb(),
+        "disk_bytes": _disk_bytes(directory),
+    }
+
+def _run_op(fn, args_list) -> dict:
+    """Average time per call (untraced), then one traced call for peak memory."""
+    calls = 0
+    t0 = time.perf_counter()
+    for args in args_list:
+        fn(*args)
+        calls += 1
+        if calls >= MAX_OPS or time.perf_counter() - t0 > OP_BUDGET_S:
+            break
+    avg_ms = (time.perf_counter() - t0) * 1000 / calls
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    fn(*args_list[0])
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return {"avg_ms": round(avg_ms, 4), "calls": calls, "peak_kb": round(peak / 1024, 1)}
+
+def _measure(args) -> dict:
+    name, count, days, directory = args
+    os.chdir(directory)
+    import storage
+
+    rng = random.Random(11)
+    picks = [rng.randrange(count) for _ in range(MAX_OPS)]
+    uids = [f"uid-{i:07d}" for i in picks]
+    usernames = [f"user{i}" for i in picks]
+    today = date.today()
+    week_ago = (today - timedelta(days=6)).isoformat()
+    today = today.isoformat()
+    ops = {}
+
+    # Cold: constructing the backend and serving the first lookup
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    backend = _open_backend(name)
+    backend.find_user(usernames[0])
+    ops["open"] = {
+        "avg_ms": round((time.perf_counter() - t0) * 1000, 4),
+        "calls": 1,
+        "peak_kb": round(tracemalloc.get_traced_memory()[1] / 1024, 1),
+    }
+    tracemalloc.stop()
+
+    if name == "json":
+        ops["load_data"] = _run_op(storage.load_data, [(storage.DATA_FILE,)] * 3)
+        doc = storage.load_data(storage.DATA_FILE)
+        ops["save_data"] = _run_op(storage.save_data, [(doc, storage.DATA_FILE)] * 3)
+        del doc
+
+    ops["find_user_by_username"] = _run_op(backend.find_user, [(u,) for u in usernames])
+    ops["get_today_intake"] = _run_op(backend.get_intake, [(u, today) for u in uids])
+    ops["set_today_intake"] = _run_op(backend.set_intake, [(u, today, 500 + i) for i, u in enumerate(uids)])
+    ops["get_past_intake"] = _run_op(lambda u: backend.get_history(u, week_ago, today).to_dict(),
+                                     [(u,) for u in uids])
+    return {"ops": ops, "measure_peak_rss_mb": _peak_rss_mb()}
+
+def _in_subprocess(fn, args) -> dict:
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(fn, (args,))
+
+# =======================
+# 5. Suite
+# =======================
+
+def run_suite(sizes=DEFAULT_SIZES, years: float = DEFAULT_YEARS, backends=DEFAULT_BACKENDS,
+              max_memory_mb: float = None, log=print) -> dict:
+    days = max(1, round(years * 365))
+    if max_memory_mb is None:
+        try:
+            max_memory_mb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2e6
+        except (AttributeError, ValueError, OSError):
+            max_memory_mb = 4096
+    results = []
+    for count in sizes:
+        for name in backends:
+            row = {"backend": name, "users": count, "days": days}
+            estimate = estimate_document_mb(count, days)
+            if name in WHOLE_FILE_BACKENDS and estimate > max_memory_mb:
+                row["skipped"] = (f"whole-file backend needs ~{estimate:,.0f} MB in memory "
+                                  f"(limit {max_memory_mb:,.0f} MB)")
+                log(f"{name:<8} {count:>9,} users: skipped, {row['skipped']}")
+                results.append(row)
+                continue
+            directory = tempfile.mkdtemp(prefix=f"waterbuddy-bench-{name}-")
+            try:
+                row.update(_in_subprocess(_build, (name, count, days, directory)))
+                row.update(_in_subprocess(_measure, (name, count, days, directory)))
+            except Exception as e:
+                row["error"] = repr(e)
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+            results.append(row)
+            if "ops" in row:
+                summary = ", ".join(f"{op} {v['avg_ms']:.3f} ms" for op, v in row["ops"].items())
+                log(f"{name:<8} {count:>9,} users: built in {row['build_s']} s "
+                    f"({row['disk_bytes'] / 1e6:.1f} MB on disk); {summary}")
+            else:
+                log(f"{name:<8} {count:>9,} users: {row.get('error')}")
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "days": days,
+        "max_memory_mb": round(max_memory_mb),
+        "results": results,
+    }
+
+def print_table(suite: dict) -> None:
+    ops = []
+    for row in suite["results"]:
+        for op in row.get("ops", {}):
+            if op not in ops:
+                ops.append(op)
+    print(f"\n{'backend':<9}{'users':>10}{'disk MB':>9}" + "".join(f"{OP_LABELS.get(op, op):>14}" for op in ops))
+    for row in suite["results"]:
+        line = f"{row['backend']:<9}{row['users']:>10,}"
+        if "ops" not in row:
+            print(line + "   " + (row.get("skipped") or row.get("error", "")))
+            continue
+        line += f"{row['disk_bytes'] / 1e6:>9.1f}"
+        for op in ops:
+            v = row["ops"].get(op)
+            line += f"{v['avg_ms']:>11.3f} ms" if v else f"{'-':>14}"
+        print(line)
+    print("(average wall time per call; peak memory per call is in the JSON output)")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the WaterBuddy storage backends.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="User populations (e.g. 1000 10000 100000 1000000)")
+    parser.add_argument("--years", type=float, default=DEFAULT_YEARS, help="Years of daily history per user")
+    parser.add_argument("--backends", nargs="+", default=list(DEFAULT_BACKENDS))
+    parser.add_argument("--max-memory-mb", type=float, default=None,
+                        help="Skip whole-file backends above this estimated size (default: half of RAM)")
+    parser.add_argument("--out", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    suite = run_suite(args.sizes, args.years, args.backends, args.max_memory_mb)
+    print_table(suite)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(suite, f, indent=2)
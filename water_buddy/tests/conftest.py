@@ -0,0 +1,8 @@
+"""
+Shared pytest setup: the app modules live flat in water_buddy/.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,58 @@
+"""
+Asset pipeline: minified Lottie documents and resized image variants,
+rebuilt when the source file changes.
+"""
+
+import json
+import os
+
+import pytest
+
+import assets
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(assets, "ASSET_CACHE_DIR", str(tmp_path / ".asset_cache"))
+    return tmp_path / ".asset_cache"
+
+
+def test_minify_lottie_rounds_numbers():
+    doc = {"v": "5.7", "layers": [{"p": [1.23456789, 2.0, 3]}]}
+    assert json.loads(assets.minify_lottie(doc)) == {"v": "5.7", "layers": [{"p": [1.235, 2, 3]}]}
+    assert b" " not in assets.minify_lottie(doc)
+
+
+def test_load_lottie_follows_the_source(tmp_path):
+    path = tmp_path / "progress.json"
+    path.write_text(json.dumps({"fr": 29.97002997, "op": 150}))
+    assert assets.load_lottie(str(path)) == {"fr": 29.97, "op": 150}
+    assert assets.load_lottie(str(path)) is assets.load_lottie(str(path))
+
+    path.write_text(json.dumps({"fr": 60, "op": 300}))
+    os.utime(path, ns=(0, 10**9))
+    assert assets.load_lottie(str(path)) == {"fr": 60, "op": 300}
+
+    path.write_text("{not json")
+    os.utime(path, ns=(0, 2 * 10**9))
+    assert assets.load_lottie(str(path)) is None
+    assert assets.load_lottie(str(tmp_path / "missing.json")) is None
+
+
+def test_pick_width():
+    assert assets.pick_width(80) == 160
+    assert assets.pick_width(160) == 320
+    assert assets.pick_width(1000) == max(assets.IMAGE_WIDTHS)
+
+
+def test_image_variant_is_resized_and_cached(tmp_path, cache_dir):
+    Image = pytest.importorskip("PIL.Image")
+    path = tmp_path / "mascot.png"
+    Image.new("RGB", (1200, 600), (30, 144, 255)).save(path)
+
+    data = assets.image_variant(str(path), 160)
+    assert assets.sniff_kind(str(path)) == "image"
+    assert len(data) < os.path.getsize(path)
+    with Image.open(cache_dir / os.listdir(cache_dir)[0]) as im:
+        assert im.format == "WEBP" and im.size == (320, 160)
+    assert assets.image_variant(str(tmp_path / "missing.png"), 160) is None
@@ -0,0 +1,83 @@
+"""
+Storage backend contract: every selectable backend behaves the same.
+"""
+
+import pytest
+
+import recordfile
+import storage
+from storage import period_keys
+
+DAY = "2024-01-15"
+NEXT_DAY = "2024-01-16"
+
+BACKENDS = {
+    "json": lambda tmp: storage.JSONBackend(str(tmp / "water_data.json")),
+    "sqlite": lambda tmp: storage.SQLiteBackend(str(tmp / "water_data.db")),
+    "records": lambda tmp: recordfile.RecordFileBackend(str(tmp / "water_data.wbr")),
+}
+
+
+def _record(username):
+    return {"username": username, "password": "x", "profile": {"user_goal": 2000}}
+
+
+@pytest.fixture(params=sorted(BACKENDS))
+def backend(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_document_caches", {})
+    backend = BACKENDS[request.param](tmp_path)
+    assert backend.create_user("u1", _record("Alice"))
+    return backend
+
+
+def test_usernames_are_unique_and_case_insensitive(backend):
+    assert not backend.create_user("u2", _record("alice"))
+    assert not backend.create_user("u1", _record("bob"))
+    assert backend.find_uid("ALICE") == "u1"
+    assert backend.find_user("nobody") == (None, None)
+
+    assert backend.create_user("u2", _record("bob"))
+    assert not backend.rename_user("u2", "Alice")
+    assert backend.rename_user("u2", "carol")
+    assert backend.find_uid("carol") == "u2" and backend.find_uid("bob") is None
+
+
+def test_day_totals_follow_events(backend):
+    assert backend.add_intake("u1", DAY, 250)
+    assert backend.add_intake("u1", DAY, 500)
+    assert backend.add_intake("u1", NEXT_DAY, 100)
+    assert backend.get_intake("u1", DAY) == 750
+    assert [(e["kind"], e["delta"]) for e in backend.get_events("u1", DAY)] == [("quick", 250), ("quick", 500)]
+
+    assert backend.set_intake("u1", DAY, 300)
+    assert backend.get_intake("u1", DAY) == 300
+    assert backend.add_intake("u1", DAY, -1000)
+    assert backend.get_intake("u1", DAY) == 0
+    assert backend.reset_intake("u1", NEXT_DAY)
+    assert backend.get_intakes("u1", [DAY, NEXT_DAY, "2024-01-17"]) == {DAY: 0, NEXT_DAY: 0, "2024-01-17": 0}
+
+
+def test_period_totals_and_one_read_bundle(backend):
+    backend.add_intake("u1", DAY, 250)
+    backend.add_intake("u1", NEXT_DAY, 500)
+    backend.set_intake("u1", DAY, 1000)
+    keys = period_keys(NEXT_DAY)
+
+    assert backend.get_period_totals("u1", "week", [keys["week"]]) == {keys["week"]: 1500}
+    bundle = backend.read_user("u1", [DAY, NEXT_DAY], keys)
+    assert bundle["days"] == {DAY: 1000, NEXT_DAY: 500}
+    assert bundle["totals"] == {"week": 1500, "month": 1500}
+    assert bundle["record"]["username"] == "Alice"
+    assert backend.read_user("nobody", [DAY], keys) is None
+
+
+def test_profile_updates_and_delete(backend):
+    assert backend.update_profile("u1", {"age": 30})
+    assert backend.get_user("u1")["profile"] == {"user_goal": 2000, "age": 30}
+    assert backend.apply_changes("u1", [("event", DAY, "quick", 250), ("profile", {"user_goal": 2500})])
+    assert backend.get_user("u1")["profile"]["user_goal"] == 2500
+    assert backend.get_intake("u1", DAY) == 250
+
+    assert backend.delete_user("u1")
+    assert backend.get_user("u1") is None and backend.find_uid("alice") is None
+    assert backend.get_intake("u1", DAY) == 0
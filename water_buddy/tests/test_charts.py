@@ -0,0 +1,36 @@
+"""
+History chart: the x axis holds real dates, also for ranges over a year.
+"""
+
+from datetime import date, timedelta
+
+import matplotlib.dates as mdates
+import matplotlib.pyplot as plt
+
+import charts
+
+
+def test_ranges_over_a_year_keep_every_day():
+    end = date(2026, 10, 17)
+    days = {(end - timedelta(days=i)).isoformat(): i for i in range(800)}
+
+    fig = charts.plot_water_intake(days, 2000, rolling=[0.0] * len(days))
+    try:
+        ax = fig.axes[0]
+        for line in ax.lines[:2]:
+            x = mdates.date2num(line.get_xdata())
+            assert len(set(x)) == len(days)
+            assert list(x) == sorted(x)
+        assert mdates.num2date(ax.lines[0].get_xdata(orig=False)[-1]).date() == end
+        assert mdates.num2date(ax.get_xlim()[0]).year == 2024
+    finally:
+        plt.close(fig)
+
+
+def test_title_names_the_date_range():
+    days = {(date(2025, 3, 1) + timedelta(days=i)).isoformat(): 500 for i in range(10)}
+    fig = charts.plot_water_intake(days, 2000)
+    try:
+        assert fig.axes[0].get_title() == "Daily Water Intake (01 Mar 2025 – 10 Mar 2025)"
+    finally:
+        plt.close(fig)
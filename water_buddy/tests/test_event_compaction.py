@@ -0,0 +1,41 @@
+"""
+Every backend compacts its event log while logging, so the log stays bounded.
+"""
+
+from datetime import date, timedelta
+
+import pytest
+
+import recordfile
+import shards
+import storage
+
+BACKENDS = {
+    "json": lambda tmp: storage.JSONBackend(str(tmp / "water_data.json")),
+    "sqlite": lambda tmp: storage.SQLiteBackend(str(tmp / "water_data.db")),
+    "records": lambda tmp: recordfile.RecordFileBackend(str(tmp / "water_data.wbr")),
+    "sharded": lambda tmp: shards.ShardedJSONBackend(str(tmp / "shards"), shard_count=4),
+}
+
+
+def _event_count(backend, uid, days):
+    return sum(len(backend.get_events(uid, day)) for day in days)
+
+
+@pytest.mark.parametrize("name", sorted(BACKENDS))
+def test_event_log_stays_bounded(tmp_path, monkeypatch, name):
+    monkeypatch.setattr(storage, "_document_caches", {})
+    monkeypatch.setattr(storage, "COMPACT_EVERY", 10)
+    backend = BACKENDS[name](tmp_path)
+    backend.create_user("u1", {"username": "alice", "password": "x", "profile": {}})
+    # Days past the retention window: their events can be compacted away
+    today = date.today()
+    days = [(today - timedelta(days=storage.EVENT_RETENTION_DAYS + 1 + i)).isoformat() for i in range(5)]
+
+    for n in range(55):
+        assert backend.add_intake("u1", days[n % len(days)], 100)
+        assert _event_count(backend, "u1", days) <= storage.COMPACT_EVERY
+
+    assert _event_count(backend, "u1", days) == 5
+    # Totals still include the compacted events
+    assert sum(backend.get_intakes("u1", days).values()) == 55 * 100
@@ -0,0 +1,33 @@
+"""
+Memoized render fragments: quantized bottle SVGs and per-theme CSS.
+"""
+
+import fragments
+
+
+def test_bottle_svg_is_quantized_and_memoized():
+    svg = fragments.generate_bottle_svg(42.4)
+    assert ">42%<" in svg
+    assert fragments.generate_bottle_svg(41.6) is svg
+    assert fragments.generate_bottle_svg(43) is not svg
+
+
+def test_bottle_svg_is_clamped():
+    assert ">0%<" in fragments.generate_bottle_svg(-5)
+    assert fragments.generate_bottle_svg(250) is fragments.generate_bottle_svg(100)
+
+
+def test_bottle_svg_follows_size_and_theme():
+    light = fragments.generate_bottle_svg(50)
+    dark = fragments.generate_bottle_svg(50, theme="Dark")
+    assert light != dark and fragments.BOTTLE_THEMES["Dark"][1] in dark
+    assert 'width="200"' in fragments.generate_bottle_svg(50, width=200)
+    # Unknown themes fall back to the default colours
+    assert fragments.generate_bottle_svg(50, theme="Neon") == light
+
+
+def test_theme_css_is_built_once_per_theme():
+    css = fragments.theme_css("Aqua")
+    assert css.startswith("<style>") and css.endswith("</style>") and "#e8fbff" in css
+    assert fragments.theme_css("Aqua") is css
+    assert fragments.theme_css("Unknown") == fragments.theme_css("Dark")
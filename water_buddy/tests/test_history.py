@@ -0,0 +1,64 @@
+"""
+History range queries over day-indexed arrays, and their statistics.
+"""
+
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+import storage
+from history import DayHistory
+
+START = date(2024, 1, 1)
+
+
+def _history(values):
+    return DayHistory(START, values)
+
+
+def test_from_days_and_to_dict():
+    history = DayHistory.from_days({"2024-01-03": 500, "2024-01-01": 250, "bad": 1})
+    assert history.start == START and history.end == date(2024, 1, 3)
+    assert history.to_dict() == {"2024-01-01": 250, "2024-01-02": 0, "2024-01-03": 500}
+    assert len(DayHistory.from_days({}, START)) == 0
+
+
+def test_range_is_a_slice_padded_with_zeros():
+    history = _history([1, 2, 3, 4])
+    assert history.range("2024-01-02", "2024-01-03").values.tolist() == [2, 3]
+    assert history.range("2023-12-30", "2024-01-02").values.tolist() == [0, 0, 1, 2]
+    assert history.range("2024-01-04", "2024-01-06").values.tolist() == [4, 0, 0]
+    assert history.last(2, "2024-01-04").to_dict() == {"2024-01-03": 3, "2024-01-04": 4}
+
+
+def test_statistics():
+    history = _history([0, 1000, 2000, 3000, 4000])
+    assert history.total() == 10000
+    assert history.goal_hit_rate(2000) == 0.6
+    assert history.percentiles((50, 90)) == {50: 2000, 90: 3600}
+    assert history.rolling_mean(2).tolist() == [0, 500, 1500, 2500, 3500]
+    assert _history([]).summary(2000) == {
+        "days": 0, "total": 0, "mean": 0, "goal_hit_rate": 0.0, "percentiles": {50: 0, 90: 0},
+    }
+
+
+def test_rolling_mean_matches_a_loop():
+    values = np.random.default_rng(3).integers(0, 3500, 100)
+    rolling = _history(values).rolling_mean(7)
+    expected = [values[max(i - 6, 0):i + 1].mean() for i in range(len(values))]
+    assert np.allclose(rolling, expected)
+
+
+@pytest.mark.parametrize("backend_cls", [storage.JSONBackend, storage.SQLiteBackend])
+def test_backend_history_range(tmp_path, monkeypatch, backend_cls):
+    monkeypatch.setattr(storage, "_document_caches", {})
+    backend = backend_cls(str(tmp_path / "water_data"))
+    backend.create_user("u1", {"username": "alice", "password": "x", "profile": {}})
+    for i in (0, 2, 40):
+        backend.add_intake("u1", (START + timedelta(days=i)).isoformat(), 100 + i)
+
+    history = backend.get_history("u1", "2023-12-31", "2024-01-03")
+    assert history.to_dict() == {"2023-12-31": 0, "2024-01-01": 100, "2024-01-02": 0, "2024-01-03": 102}
+    assert len(backend.get_history("u1", "2024-01-01", "2024-12-31")) == 366
+    assert backend.get_history("u1", "2024-01-01", "2024-12-31").total() == 100 + 102 + 140
@@ -0,0 +1,45 @@
+"""
+Storage reads per dashboard view, as counted by io_counter.
+"""
+
+from datetime import date, timedelta
+
+import pytest
+
+import storage
+from stats import StatsEngine
+
+TODAY = "2024-01-15"
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_document_caches", {})
+    backend = storage.JSONBackend(str(tmp_path / "water_data.json"))
+    backend.create_user("u1", {"username": "alice", "password": "x", "profile": {}})
+    backend.add_intake("u1", TODAY, 500)
+    storage.io_counter.reset()
+    return storage.CountingStore(backend)
+
+
+def test_snapshot_is_one_read(store):
+    snap = storage.UserSnapshot.load(store, "u1", TODAY)
+    assert snap.intake(TODAY) == 500
+    assert storage.io_counter.as_dict() == {"reads": 1, "writes": 0}
+
+
+def test_home_reads_streak_history_only_when_stale(store):
+    engine = StatsEngine()
+    engine.summary(store, "u1", 2000, TODAY)
+    assert storage.io_counter.reads == 1
+
+    storage.io_counter.reset()
+    engine.summary(store, "u1", 2000, TODAY, today_intake=500)
+    assert storage.io_counter.reads == 0
+
+
+def test_history_range_is_one_read(store):
+    start = (date.fromisoformat(TODAY) - timedelta(days=364)).isoformat()
+    history = store.get_history("u1", start, TODAY)
+    assert history.to_dict()[TODAY] == 500
+    assert storage.io_counter.as_dict() == {"reads": 1, "writes": 0}
@@ -0,0 +1,47 @@
+"""
+Meteostat cache formats, served from a local stand-in server.
+"""
+
+import threading
+import warnings
+from datetime import datetime
+
+import pytest
+
+import fetchbench
+from meteostat.interface.base import Base
+from meteostat.interface.hourly import Hourly
+
+
+@pytest.fixture
+def endpoint(tmp_path, monkeypatch):
+    """Stand-in server with one station-year; caching into tmp_path."""
+    server = fetchbench.StandInServer(fetchbench.build_fixtures(1, 1), True, 0, 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(Base, "cache_dir", str(tmp_path))
+    monkeypatch.setattr(Base, "max_age", 3600)
+    monkeypatch.setattr(Hourly, "endpoint", server.url)
+    monkeypatch.setattr(Hourly, "prune_by_inventory", False)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("cache_format", ["pickle", "feather", "parquet"])
+def test_timezone_aware_fetch_from_cache(endpoint, monkeypatch, cache_format):
+    pytest.importorskip("pyarrow")
+    monkeypatch.setattr(Base, "cache_format", cache_format)
+    station = fetchbench.station_ids(1)[0]
+    start, end = datetime(fetchbench.FIRST_YEAR, 3, 1), datetime(fetchbench.FIRST_YEAR, 3, 31, 23)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        downloaded = Hourly(station, start, end, timezone="Europe/Berlin").fetch()
+        endpoint.reset_counters()
+        cached = Hourly(station, start, end, timezone="Europe/Berlin").fetch()
+
+    assert endpoint.requests == 0
+    assert len(cached) == 31 * 24 - 1  # clocks go forward on 26 March
+    assert cached.index[0].tzinfo is not None
+    assert cached.equals(downloaded)
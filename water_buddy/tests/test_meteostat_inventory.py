@@ -0,0 +1,80 @@
+"""
+Pruning of time series downloads by the weather station inventory.
+"""
+
+import threading
+import warnings
+from datetime import datetime
+from urllib.error import URLError
+
+import pandas as pd
+import pytest
+
+import fetchbench
+from meteostat.interface.base import Base
+from meteostat.interface.hourly import Hourly
+from meteostat.interface.stations import Stations
+
+START = datetime(fetchbench.FIRST_YEAR, 1, 1)
+END = datetime(fetchbench.FIRST_YEAR + 1, 12, 31, 23)
+
+
+@pytest.fixture
+def endpoint(tmp_path, monkeypatch):
+    """Stand-in server with one station and two years; caching off."""
+    server = fetchbench.StandInServer(fetchbench.build_fixtures(1, 2), True, 0, 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(Base, "cache_dir", str(tmp_path))
+    monkeypatch.setattr(Base, "max_age", 0)
+    monkeypatch.setattr(Hourly, "endpoint", server.url)
+    monkeypatch.setattr(Hourly, "prune_by_inventory", True)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _inventory(ids, start, end):
+    return pd.DataFrame(
+        {"hourly_start": pd.to_datetime(start), "hourly_end": pd.to_datetime(end)},
+        index=pd.Index(ids, name="id"),
+    )
+
+
+def test_inventory_is_limited_to_requested_stations(endpoint, monkeypatch):
+    station = fetchbench.station_ids(1)[0]
+    others = [f"X{i:04d}" for i in range(1000)]
+    stations = _inventory(
+        [station] + others,
+        [START] + [START] * len(others),
+        [datetime(fetchbench.FIRST_YEAR, 6, 30)] + [END] * len(others),
+    )
+    monkeypatch.setattr(Stations, "__init__", lambda self: None)
+    monkeypatch.setattr(Stations, "fetch", lambda self, *args, **kwargs: stations)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        series = Hourly(station, START, END, model=False)
+        data = series.fetch()
+
+    assert list(series._inventory) == [station]
+    assert endpoint.requests == 1  # the second year is not in the inventory
+    assert data.index.max().year == fetchbench.FIRST_YEAR
+
+
+def test_unavailable_inventory_does_not_prune(endpoint, monkeypatch):
+    def unavailable(self):
+        raise URLError("network is unreachable")
+
+    monkeypatch.setattr(Stations, "__init__", unavailable)
+    station = fetchbench.station_ids(1)[0]
+
+    with pytest.warns(Warning, match="weather station inventory"):
+        series = Hourly(station, START, END, model=False)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        data = series.fetch()
+
+    assert series._inventory is None
+    assert endpoint.requests == 2
+    assert len(data) == len(pd.date_range(START, END, freq="h"))
@@ -0,0 +1,86 @@
+"""
+Proxy selection of the pooled meteostat transport.
+"""
+
+import asyncio
+import threading
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+
+import pytest
+
+import fetchbench
+from meteostat.core.transport import AsyncTransport, Transport
+
+PROXY_VARIABLES = ("http_proxy", "https_proxy", "no_proxy", "all_proxy")
+
+
+@pytest.fixture
+def environment(monkeypatch):
+    """No proxies from the test runner's environment."""
+    for name in PROXY_VARIABLES:
+        monkeypatch.delenv(name, raising=False)
+        monkeypatch.delenv(name.upper(), raising=False)
+    return monkeypatch
+
+
+@pytest.fixture
+def proxy():
+    """Stand-in server without files, counting the requests it receives."""
+    server = fetchbench.StandInServer({}, True, 0, 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_proxy_from_environment(environment):
+    environment.setenv("http_proxy", "proxy.example:3128")
+    environment.setenv("https_proxy", "http://secure-proxy.example:3128")
+    environment.setenv("no_proxy", "internal.example")
+    transport = Transport()
+
+    assert transport._proxy_for(urlsplit("http://bulk.meteostat.net/x")) == "http://proxy.example:3128"
+    assert transport._proxy_for(urlsplit("https://bulk.meteostat.net/x")) == "http://secure-proxy.example:3128"
+    assert transport._proxy_for(urlsplit("https://internal.example:8443/x")) is None
+
+
+def test_configured_proxy_wins_but_no_proxy_applies(environment):
+    environment.setenv("https_proxy", "http://env-proxy.example:3128")
+    environment.setenv("no_proxy", "internal.example")
+    transport = Transport("http://configured.example:8080")
+
+    assert transport._proxy_for(urlsplit("https://bulk.meteostat.net/x")) == "http://configured.example:8080"
+    assert transport._proxy_for(urlsplit("http://bulk.meteostat.net/x")) == "http://configured.example:8080"
+    assert transport._proxy_for(urlsplit("https://internal.example/x")) is None
+
+
+def test_requests_go_through_environment_proxy(environment, proxy):
+    environment.setenv("http_proxy", proxy.url)
+    url = "http://meteostat.invalid/hourly/2000/F0000.csv.gz"
+
+    with pytest.raises(HTTPError) as error:
+        Transport(retries=0).get(url)
+    assert error.value.code == 404
+    assert proxy.requests == 1
+
+    async def fetch():
+        transport = AsyncTransport(retries=0)
+        try:
+            await transport.get(url)
+        finally:
+            transport.close()
+
+    with pytest.raises(HTTPError):
+        asyncio.run(fetch())
+    assert proxy.requests == 2
+
+
+def test_no_proxy_bypasses_environment_proxy(environment, proxy):
+    environment.setenv("http_proxy", proxy.url)
+    environment.setenv("no_proxy", "meteostat.invalid")
+
+    with pytest.raises(URLError):
+        Transport(retries=0).get("http://meteostat.invalid/hourly/2000/F0000.csv.gz")
+    assert proxy.requests == 0
@@ -0,0 +1,69 @@
+"""
+Legacy migration: batches that cannot be written are retried or resumed,
+never counted as skipped.
+"""
+
+import json
+
+import pytest
+
+import migrate
+import storage
+
+
+class FailingBackend:
+    """Wraps a backend; create_users() reports a storage error for `failures` calls from call `start` on."""
+
+    def __init__(self, backend, start: int, failures: int):
+        self.backend = backend
+        self.name = backend.name
+        self.start = start
+        self.failures = failures
+        self.calls = 0
+
+    def create_users(self, items):
+        self.calls += 1
+        if self.calls >= self.start and self.failures:
+            self.failures -= 1
+            return [None] * len(items)
+        return self.backend.create_users(items)
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    monkeypatch.setattr(migrate, "COMMIT_BACKOFF_S", 0)
+    path = tmp_path / "users_data.json"
+    path.write_text(json.dumps({
+        f"user{i}@example.com": {"password": "pw", "age": 30, "goal": 2000, "intake": 100 * i}
+        for i in range(6)
+    }))
+    return str(path)
+
+
+def _backend(tmp_path):
+    return storage.SQLiteBackend(str(tmp_path / "water_data.db"))
+
+
+def test_transient_error_is_retried(tmp_path, source):
+    backend = FailingBackend(_backend(tmp_path), start=2, failures=1)
+    result = migrate.migrate(source, backend, batch_size=2, log=lambda msg: None)
+
+    assert result["migrated"] == 6
+    assert result["skipped"] == 0
+
+
+def test_resume_after_failed_batch(tmp_path, source):
+    failing = FailingBackend(_backend(tmp_path), start=2, failures=migrate.COMMIT_RETRIES + 1)
+    with pytest.raises(OSError):
+        migrate.migrate(source, failing, batch_size=2, log=lambda msg: None)
+
+    with open(source + migrate.CHECKPOINT_SUFFIX) as f:
+        checkpoint = json.load(f)
+    assert checkpoint["migrated"] == 2
+    assert checkpoint["skipped"] == 0
+
+    backend = _backend(tmp_path)
+    result = migrate.migrate(source, backend, batch_size=2, log=lambda msg: None)
+    assert result["migrated"] == 6
+    assert result["skipped"] == 0
+    assert all(backend.find_uid(f"user{i}@example.com") for i in range(6))
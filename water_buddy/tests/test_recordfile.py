@@ -0,0 +1,71 @@
+"""
+Record file: one user is found through the index and decoded on its own;
+writes copy untouched records byte-for-byte.
+"""
+
+import json
+
+import recordfile
+import storage
+
+
+def _users(count):
+    return {
+        f"u{i}": {"username": f"user{i}", "password": "x", "profile": {"user_goal": 2000 + i},
+                  "days": {"2024-01-15": {"intake": 100 * i}}}
+        for i in range(count)
+    }
+
+
+def _raw(records, uid):
+    with open(records.path, "rb") as f:
+        f.seek(records.offsets[uid])
+        return f.read(records.lengths[uid])
+
+
+def test_lookup_decodes_only_the_requested_record(tmp_path):
+    path = str(tmp_path / "water_data.wbr")
+    recordfile.RecordFile(path).write(path, _users(5))
+
+    # Break another user's record: reading u3 must not touch it
+    records = recordfile.RecordFile(path)
+    with open(path, "r+b") as f:
+        f.seek(records.offsets["u1"] + recordfile.RECORD_HEADER.size + 2)
+        f.write(b"\xff\xff\xff")
+
+    records = recordfile.RecordFile(path)
+    assert len(records) == 5
+    assert records.find_uid("user3") == "u3"
+    assert records.read("u3")["profile"] == {"user_goal": 2003}
+    assert records.read("missing") is None
+
+
+def test_write_copies_untouched_records(tmp_path):
+    path = str(tmp_path / "water_data.wbr")
+    recordfile.RecordFile(path).write(path, _users(4))
+    before = recordfile.RecordFile(path)
+    untouched = {uid: _raw(before, uid) for uid in ("u0", "u2", "u3")}
+
+    changed = dict(_users(4)["u1"], username="renamed")
+    before.write(path, {"u1": changed, "u3": None, "u9": _users(10)["u9"]})
+
+    after = recordfile.RecordFile(path)
+    assert after.order == ["u0", "u1", "u2", "u9"]
+    assert _raw(after, "u0") == untouched["u0"] and _raw(after, "u2") == untouched["u2"]
+    assert after.read("u1")["username"] == "renamed" and after.find_uid("user1") is None
+    assert after.read("u3") is None
+
+
+def test_import_matches_the_json_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_document_caches", {})
+    source = tmp_path / "water_data.json"
+    source.write_text(json.dumps({"users": _users(20)}, indent=4))
+    json_backend = storage.JSONBackend(str(source))
+    backend = recordfile.RecordFileBackend(str(tmp_path / "water_data.wbr"))
+
+    assert backend.import_document(str(source)) == 20
+    assert backend.import_document(str(source)) == 0
+    for uid in ("u0", "u7", "u19"):
+        assert backend.get_user(uid) == json_backend.get_user(uid)
+        assert backend.get_intake(uid, "2024-01-15") == json_backend.get_intake(uid, "2024-01-15")
+    assert (tmp_path / "water_data.wbr").stat().st_size < source.stat().st_size
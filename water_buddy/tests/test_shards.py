@@ -0,0 +1,43 @@
+"""
+Sharded JSON store: writes racing with a rebalance.
+"""
+
+import glob
+import os
+import threading
+import time
+
+import shards
+import storage
+
+DAY = "2024-01-15"
+
+
+def test_writer_waiting_on_a_rebalance_reroutes(tmp_path, monkeypatch):
+    directory = str(tmp_path / "shards")
+    backend = shards.ShardedJSONBackend(directory, shard_count=4)
+    uids = [f"u{i}" for i in range(20)]
+    backend.create_users([(uid, {"username": uid, "password": "x", "profile": {}}) for uid in uids])
+    old_paths = [shard.path for shard in backend.shards]
+    results = []
+
+    def writer():
+        results.extend(backend.apply_batch([(uid, [("event", DAY, "quick", 250)]) for uid in uids]))
+
+    # Start the writer while rebalance() holds the old shards' locks, so it
+    # picks a generation 1 shard and then waits for that shard's file lock
+    def suggest_shard_count(user_count):
+        thread.start()
+        time.sleep(0.3)
+        return 8
+
+    thread = threading.Thread(target=writer)
+    monkeypatch.setattr(shards, "suggest_shard_count", suggest_shard_count)
+    backend.rebalance()
+    thread.join(timeout=10)
+
+    assert results == [True] * len(uids)
+    assert backend.generation == 2
+    assert all(backend.get_intake(uid, DAY) == 250 for uid in uids)
+    assert not glob.glob(os.path.join(directory, "g1-*.json"))
+    assert not any(os.path.abspath(path) in storage._document_caches for path in old_paths)
@@ -0,0 +1,90 @@
+"""
+Streak and goal statistics: incremental updates match a full rebuild.
+"""
+
+import random
+from datetime import date, timedelta
+
+import storage
+from history import DayHistory
+from stats import StatsEngine, StreakStats
+from storage import EVENT_QUICK, EVENT_RESET, EVENT_SET
+
+GOAL = 2000
+START = date(2024, 1, 1)
+
+
+def _day(i):
+    return (START + timedelta(days=i)).isoformat()
+
+
+def _rebuilt(stats):
+    return StreakStats(stats.start, stats.values, stats.goal)
+
+
+def test_summary():
+    # hit, hit, miss, hit, hit, hit, open today
+    stats = StreakStats(START, [2000, 2500, 0, 2000, 3000, 2000, 500], GOAL)
+
+    assert stats.summary(_day(6)) == {
+        "current_streak": 3,
+        "longest_streak": 3,
+        "weekly_hit_rate": 5 / 7,
+        "moving_average": round(12000 / 30),
+    }
+    # Reaching today's goal extends the streak
+    stats.apply_event(_day(6), EVENT_QUICK, 1500)
+    assert stats.summary(_day(6))["current_streak"] == 4
+    # A day without logs breaks it
+    assert stats.summary(_day(8))["current_streak"] == 0
+    assert stats.summary(_day(8))["longest_streak"] == 4
+
+
+def test_from_history_starts_at_first_logged_day():
+    history = DayHistory(START, [0, 0, 2000, 2000, 0])
+    stats = StreakStats.from_history(history, GOAL)
+
+    assert stats.start == START + timedelta(days=2)
+    assert stats.summary(_day(4))["longest_streak"] == 2
+    assert StreakStats.from_history(DayHistory(START, [0, 0]), GOAL).summary(_day(1))["longest_streak"] == 0
+
+
+def test_edits_match_a_full_rebuild():
+    rng = random.Random(7)
+    stats = StreakStats(START, [rng.choice([0, 1500, 2000, 2500]) for _ in range(200)], GOAL)
+
+    for _ in range(300):
+        day = _day(rng.randrange(-5, 210))
+        kind = rng.choice([EVENT_QUICK, EVENT_SET, EVENT_RESET])
+        stats.apply_event(day, kind, rng.choice([-500, 250, 2000]))
+
+        expected = _rebuilt(stats)
+        assert (stats.start, stats.run, stats.best) == (expected.start, expected.run, expected.best)
+
+
+def test_logging_today_touches_one_day():
+    stats = StreakStats(START, [2000] * 365, GOAL)
+    assert stats.apply_event(_day(364), EVENT_QUICK, 250) == 1
+    assert stats.apply_event(_day(365), EVENT_QUICK, 250) == 1
+
+
+def test_goal_change_rebuilds():
+    stats = StreakStats(START, [2000, 2500, 3000], GOAL)
+    stats.set_goal(2500)
+    assert stats.summary(_day(2))["current_streak"] == 2
+
+
+def test_engine_follows_committed_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_document_caches", {})
+    backend = storage.JSONBackend(str(tmp_path / "water_data.json"))
+    backend.create_user("u1", {"username": "alice", "password": "x", "profile": {}})
+    today = date.today()
+    for i in range(1, 4):
+        backend.add_intake("u1", (today - timedelta(days=i)).isoformat(), GOAL)
+    engine = StatsEngine()
+    assert engine.summary(backend, "u1", GOAL, today.isoformat())["current_streak"] == 3
+
+    engine.on_changes("u1", [("event", today.isoformat(), EVENT_QUICK, GOAL)])
+    assert engine.summary(backend, "u1", GOAL, today.isoformat())["current_streak"] == 4
+    # Today's total from the rerun's snapshot wins over the running state
+    assert engine.summary(backend, "u1", GOAL, today.isoformat(), today_intake=0)["current_streak"] == 3
@@ -0,0 +1,35 @@
+"""
+JSON backend caches: values derived per user must follow writes made by
+other processes (simulated with a second, independent document cache).
+"""
+
+import storage
+
+DAY = "2024-01-15"
+
+
+def _other_process(monkeypatch, path):
+    """A backend with its own document cache, like one in another process."""
+    monkeypatch.setattr(storage, "_document_caches", {})
+    return storage.JSONBackend(path)
+
+
+def test_derived_values_follow_writes_from_other_processes(tmp_path, monkeypatch):
+    path = str(tmp_path / "water_data.json")
+    backend = storage.JSONBackend(path)
+    backend.create_user("u1", {"username": "alice", "password": "x", "profile": {}})
+    backend.add_intake("u1", DAY, 250)
+
+    keys = storage.period_keys(DAY)
+    assert backend.read_user("u1", [DAY], keys)["days"][DAY] == 250
+    assert backend.get_history("u1", DAY, DAY).to_dict() == {DAY: 250}
+
+    other = _other_process(monkeypatch, path)
+    other.add_intake("u1", DAY, 500)
+    other.update_profile("u1", {"goal": 3000})
+
+    bundle = backend.read_user("u1", [DAY], keys)
+    assert bundle["days"][DAY] == 750
+    assert bundle["totals"]["week"] == 750
+    assert backend.get_user("u1")["profile"] == {"goal": 3000}
+    assert backend.get_history("u1", DAY, DAY).to_dict() == {DAY: 750}
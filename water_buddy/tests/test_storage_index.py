@@ -0,0 +1,45 @@
+"""
+JSON backend username index (sidecar file) shared by several processes,
+simulated with backends that each have their own document cache.
+"""
+
+import storage
+from writer import atomic_write_json
+
+
+def _process(monkeypatch, path):
+    """A backend with its own document cache and index, like one in another process."""
+    monkeypatch.setattr(storage, "_document_caches", {})
+    return storage.JSONBackend(path)
+
+
+def _record(username):
+    return {"username": username, "password": "x", "profile": {}}
+
+
+def test_users_created_by_another_process_are_found(tmp_path, monkeypatch):
+    path = str(tmp_path / "water_data.json")
+    first = _process(monkeypatch, path)
+    assert first.find_user("bob") == (None, None)
+
+    second = _process(monkeypatch, path)
+    assert second.create_user("u2", _record("bob"))
+
+    uid, record = first.find_user("Bob")
+    assert uid == "u2" and record["username"] == "bob"
+    # ...so the name cannot be taken twice either
+    assert not first.create_user("u3", _record("bob"))
+
+
+def test_rejected_signup_persists_the_rebuilt_index(tmp_path, monkeypatch):
+    path = str(tmp_path / "water_data.json")
+    backend = _process(monkeypatch, path)
+    assert backend.create_user("u1", _record("carol"))
+    # The index lost the user (e.g. an edit made outside the backend)
+    atomic_write_json(backend.index_path, {"usernames": {}})
+
+    stale = _process(monkeypatch, path)
+    assert stale.find_uid("carol") is None
+    assert not stale.create_user("u9", _record("carol"))
+
+    assert _process(monkeypatch, path).find_uid("carol") == "u1"
@@ -0,0 +1,190 @@
+"""
+Write path: atomic writes, file locks, group commit, and the write-behind
+queue (failed batches are kept, never reported as saved).
+"""
+
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import storage
+import writer
+
+
+def test_failed_atomic_write_keeps_the_old_file(tmp_path):
+    path = str(tmp_path / "water_data.json")
+    writer.atomic_write_json(path, {"users": {"u1": {}}})
+
+    def write(f):
+        f.write("{\"users\": ")
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        writer.atomic_write_file(path, write, mode="w")
+    with open(path) as f:
+        assert json.load(f) == {"users": {"u1": {}}}
+    assert os.listdir(tmp_path) == ["water_data.json"]
+
+
+def test_file_lock_is_exclusive(tmp_path):
+    path = str(tmp_path / "water_data.json")
+    order = []
+
+    def second():
+        with writer.file_lock(path):
+            order.append("second")
+
+    with writer.file_lock(path):
+        thread = threading.Thread(target=second)
+        thread.start()
+        time.sleep(0.2)
+        order.append("first")
+    thread.join(timeout=5)
+    assert order == ["first", "second"]
+
+
+def test_group_commit_batches_concurrent_writes():
+    batches = []
+
+    def commit_batch(items):
+        batches.append(list(items))
+        if "boom" in items:
+            raise OSError("disk full")
+        return [item * 2 for item in items]
+
+    committer = writer.GroupCommitter(commit_batch, window=0.1)
+    results = {}
+    threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, committer.submit(i)))
+               for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+
+    assert results == {i: i * 2 for i in range(8)}
+    assert len(batches) < 8 and sorted(sum(batches, [])) == list(range(8))
+    assert committer.stats()["writes"] == 8
+    # A commit that raises fails its writes instead of propagating
+    assert committer.submit("boom") is False
+
+
+@pytest.mark.parametrize("backend_cls", [storage.JSONBackend, storage.SQLiteBackend])
+def test_concurrent_loggers_lose_no_increments(tmp_path, monkeypatch, backend_cls):
+    monkeypatch.setattr(storage, "_document_caches", {})
+    suffix = ".json" if backend_cls is storage.JSONBackend else ".db"
+    backend = backend_cls(str(tmp_path / f"water_data{suffix}"))
+    result = writer.run_concurrent_loggers(backend, loggers=4, logs=50)
+    assert result["lost_increments"] == 0
+
+
+class FlakyBackend:
+    """apply_batch() fails for the users in `failing`; records what was applied."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.applied = []
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def apply_batch(self, items):
+        with self.lock:
+            self.calls += 1
+            results = []
+            for uid, changes in items:
+                ok = uid not in self.failing
+                if ok:
+                    self.applied.extend((uid, change) for change in changes)
+                results.append(ok)
+            return results
+
+
+def _change(ml):
+    return ("event", "2024-01-01", "quick", ml)
+
+
+def test_failed_changes_are_kept_until_retried(monkeypatch):
+    monkeypatch.setattr(writer.time, "sleep", lambda s: None)
+    backend = FlakyBackend(failing={"alice"})
+    queue = writer.WriteBehindQueue(backend)
+    try:
+        queue.submit("alice", [_change(250)])
+        assert queue.flush(timeout=5)
+
+        assert queue.pending_count("alice") == 0
+        assert queue.failed_changes("alice") == [_change(250)]
+        assert queue.failed_count() == 1
+        assert queue.stats()["unsaved"] == 1
+        assert backend.applied == []
+
+        backend.failing.clear()
+        assert queue.retry_failed("alice")
+        assert queue.flush(timeout=5)
+
+        assert queue.failed_count("alice") == 0
+        assert backend.applied == [("alice", _change(250))]
+    finally:
+        queue.close()
+
+
+def test_retries_do_not_reapply_committed_users(monkeypatch):
+    monkeypatch.setattr(writer.time, "sleep", lambda s: None)
+    backend = FlakyBackend(failing={"alice"})
+    queue = writer.WriteBehindQueue(backend)
+    try:
+        queue.submit("alice", [_change(250)])
+        queue.submit("bob", [_change(100)])
+        assert queue.flush(timeout=5)
+
+        assert backend.applied.count(("bob", _change(100))) == 1
+        assert queue.failed_count("bob") == 0
+        assert queue.failed_count("alice") == 1
+        assert queue.stats()["flushed"] == 1
+    finally:
+        queue.close()
+
+
+class BlockingBackend(FlakyBackend):
+    """apply_batch() waits for `release` before writing, like a slow disk."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def apply_batch(self, items):
+        self.started.set()
+        assert self.release.wait(5)
+        return super().apply_batch(items)
+
+    def read(self, uid):
+        with self.lock:
+            return sum(change[3] for applied_uid, change in self.applied if applied_uid == uid)
+
+
+def test_reads_do_not_wait_for_a_commit():
+    backend = BlockingBackend()
+    backend.release.set()
+    queue = writer.WriteBehindQueue(backend)
+    try:
+        queue.submit("alice", [_change(250)])
+        assert queue.flush(timeout=5)
+        assert queue.read_consistent(lambda: backend.read("alice"), "alice") == (250, [])
+
+        backend.release.clear()
+        backend.started.clear()
+        queue.submit("alice", [_change(100)])
+        assert backend.started.wait(5)
+
+        # The commit is blocked: the last read plus the in-flight change
+        stored, pending = queue.read_consistent(lambda: backend.read("alice"), "alice")
+        assert (stored, pending) == (250, [_change(100)])
+
+        backend.release.set()
+        assert queue.flush(timeout=5)
+        assert queue.read_consistent(lambda: backend.read("alice"), "alice") == (350, [])
+    finally:
+        backend.release.set()
+        queue.close()
@@ -0,0 +1,169 @@
+"""
+WaterBuddy - Startup and rerun timing harness.
+
+Measures what a visitor waits for and fails when a budget is exceeded, so
+cold-start regressions are caught before they ship:
+
+- cold import time of the app's modules (each in a fresh interpreter)
+- first paint of the login page and a warm rerun of it
+- first paint and rerun of Home and History after logging in
+- a quick-log click (whole script, as AppTest runs it) and the run time of
+  the fragment a browser would actually rerun for that click
+- which heavy modules are loaded on the login page (Matplotlib and
+  streamlit-lottie must only be imported by the views that use them)
+
+The app runs headless through streamlit.testing (AppTest) in a temporary
+directory, so no real data is touched.
+
+Usage:
+    python timings.py [--runs 3] [--out timings.jsonl]
+"""
+
+# =======================
+# 1. Imports
+# =======================
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# =======================
+# 2. Configuration & Constants
+# =======================
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# Modules whose cold import cost is tracked
+IMPORT_PROBES = ("streamlit", "numpy", "storage", "stats", "charts", "matplotlib.pyplot", "streamlit_lottie")
+
+# Must not be imported before the view that needs them
+LAZY_MODULES = ("matplotlib", "streamlit_lottie", "meteostat")
+
+# Budgets in ms (generous, to flag regressions rather than machine noise)
+TIMING_BUDGETS_MS = {
+    "import:storage": 1500,
+    "login:first_paint": 3000,
+    "login:rerun": 300,
+    "home:first_paint": 1500,
+    "home:rerun": 500,
+    "history:first_paint": 4000,
+    "history:rerun": 500,
+    "log:quick_click": 500,
+    "home:fragment": 200,
+    "log:fragment": 100,
+}
+
+# =======================
+# 3. Measurements
+# =======================
+
+def import_time_ms(module: str, runs: int) -> float:
+    """Median cold import time of `module` in a fresh interpreter (None if missing)."""
+    code = ("import time; t = time.perf_counter(); import {0}; "
+            "print((time.perf_counter() - t) * 1000)").format(module)
+    samples = []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                              cwd=os.path.dirname(APP_FILE))
+        if proc.returncode != 0:
+            return None
+        samples.append(float(proc.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+def _timed(results: dict, name: str, step):
+    t0 = time.perf_counter()
+    at = step()
+    results[name] = (time.perf_counter() - t0) * 1000
+    if at.exception:
+        raise RuntimeError(f"{name}: {at.exception[0].message}")
+    return at
+
+def _fragment_ms(at, name: str) -> float:
+    """Run time of one view fragment during the last run.
+
+    AppTest always re-executes the whole script; in the browser a click
+    inside a fragment reruns only that fragment, so this is the real cost.
+    """
+    return at.session_state["fragment_stats"][name]["ms"]
+
+def app_timings() -> tuple:
+    """Paint/rerun times of the main views, and heavy modules loaded at login."""
+    from streamlit.testing.v1 import AppTest
+
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="waterbuddy-timings-")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        at = AppTest.from_file(APP_FILE, default_timeout=60)
+        at = _timed(results, "login:first_paint", at.run)
+        loaded = sorted(m for m in LAZY_MODULES if m in sys.modules)
+        at = _timed(results, "login:rerun", at.run)
+
+        at.button[1].click().run()  # create new account
+        at.text_input("signup_username").input("timings")
+        at.text_input("signup_password").input("timings")
+        at.button[0].click().run()
+        # Log in through session state: AppTest merges the elements of the
+        # login run and its st.rerun(), which leaves stale login widgets in
+        # the tree (a browser drops them when the run finishes)
+        from storage import get_store
+        uid, _ = get_store().find_user("timings")
+        at.session_state.logged_in = True
+        at.session_state.uid = uid
+        at.session_state.page = "dashboard"
+        at = _timed(results, "home:first_paint", at.run)
+        at = _timed(results, "home:rerun", at.run)
+        at = _timed(results, "home:quick_click", at.button(key="home_quick_log").click().run)
+        results["home:fragment"] = _fragment_ms(at, "home")
+        at = _timed(results, "log:first_paint", at.button(key="nav_log").click().run)
+        at = _timed(results, "log:quick_click", at.button(key="quick_log").click().run)
+        results["log:fragment"] = _fragment_ms(at, "log_water")
+        at = _timed(results, "history:first_paint", at.button(key="nav_history").click().run)
+        at = _timed(results, "history:rerun", at.run)
+    finally:
+        os.chdir(cwd)
+    return results, loaded
+
+def run(runs: int = 3) -> dict:
+    timings = {}
+    for module in IMPORT_PROBES:
+        ms = import_time_ms(module, runs)
+        if ms is not None:
+            timings[f"import:{module}"] = ms
+    app, loaded = app_timings()
+    timings.update(app)
+
+    over = {name: round(timings[name], 1) for name, budget in TIMING_BUDGETS_MS.items()
+            if name in timings and timings[name] > budget}
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "timings_ms": {name: round(ms, 1) for name, ms in timings.items()},
+        "loaded_at_login": loaded,
+        "over_budget": over,
+        "ok": not over and not loaded,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure WaterBuddy startup and rerun times.")
+    parser.add_argument("--runs", type=int, default=3, help="Cold import samples per module")
+    parser.add_argument("--out", default=None, help="Append the result as one JSON line to this file")
+    args = parser.parse_args()
+
+    result = run(args.runs)
+    for name, ms in result["timings_ms"].items():
+        budget = TIMING_BUDGETS_MS.get(name)
+        flag = "  OVER BUDGET" if name in result["over_budget"] else ""
+        print(f"{name:<28}{ms:>9.1f} ms" + (f"  (budget {budget} ms){flag}" if budget else ""))
+    if result["loaded_at_login"]:
+        print(f"Loaded on the login page but should be lazy: {', '.join(result['loaded_at_login'])}")
+    if args.out:
+        with open(args.out, "a") as f:
+            f.write(json.dumps(result) + "\n")
+    sys.exit(0 if result["ok"] else 1)
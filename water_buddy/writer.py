@@ -0,0 +1,440 @@
+"""
+WaterBuddy - Write path helpers.
+
+- file_lock(): OS-level exclusive lock (fcntl on Linux/macOS, msvcrt on Windows)
+  so several Streamlit processes never interleave writes to one data file.
+- atomic_write_json(): write to a temp file, fsync, then atomically rename it
+  over the target, so readers never see a truncated file.
+- GroupCommitter: batches writes that arrive from many sessions within a short
+  window into a single commit.
+- WriteBehindQueue: optional mode where button handlers only enqueue their
+  changes and a background thread coalesces and flushes them to the backend.
+
+Run `python writer.py --loggers 8 --logs 200` to measure logging throughput
+with N concurrent loggers and check that no increment is lost.
+"""
+
+# =======================
+# 1. Imports
+# =======================
+import atexit
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import instrument, registry
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# =======================
+# 2. Configuration & Constants
+# =======================
+LOCK_SUFFIX = ".lock"
+
+# How long the first writer waits for others to join its batch (seconds)
+GROUP_COMMIT_WINDOW_S = 0.002
+# Upper bound on the number of writes folded into one commit
+GROUP_COMMIT_MAX_BATCH = 256
+
+# Write-behind: max queued (not yet durable) writes before submit() blocks
+WRITE_BEHIND_MAX_PENDING = 1000
+# Write-behind: attempts per batch before its writes are kept back as failed
+WRITE_BEHIND_RETRIES = 3
+# Write-behind: users whose last consistent read is kept for reads during a commit
+WRITE_BEHIND_CACHED_READS = 1024
+
+# =======================
+# 3. File locking & atomic writes
+# =======================
+
+@contextlib.contextmanager
+def file_lock(path: str):
+    """Hold an exclusive OS-level lock on `path + '.lock'` for the duration of the block."""
+    with open(path + LOCK_SUFFIX, "a+b") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ~10 s; keep waiting
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def atomic_write_json(path: str, data, **dump_kwargs) -> None:
+    """Write JSON to a temp file, fsync it and rename it over `path`."""
+    atomic_write_file(path, lambda f: json.dump(data, f, **dump_kwargs), mode="w")
+
+@instrument("file.atomic_write")
+def atomic_write_file(path: str, write, mode: str = "wb") -> None:
+    """Call write(file) on a temp file, fsync it and rename it over `path`."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory
+    )
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        os.replace(tmp_path, path)
+        registry.add_bytes("file.atomic_write", written=size)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    if fcntl is not None:
+        # Persist the rename itself (not supported on Windows)
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+# =======================
+# 4. Group commit
+# =======================
+
+class _PendingWrite:
+    __slots__ = ("item", "result", "done")
+
+    def __init__(self, item):
+        self.item = item
+        self.result = False
+        self.done = threading.Event()
+
+
+class GroupCommitter:
+    """Folds writes from concurrent sessions into one commit.
+
+    The first thread to submit becomes the leader: it waits `window` seconds
+    for other writers to join, then hands the whole batch to
+    `commit_batch(items) -> [result, ...]` and wakes every waiter with its
+    own result. Writers arriving during a commit form the next batch.
+    """
+
+    def __init__(self, commit_batch, window: float = GROUP_COMMIT_WINDOW_S,
+                 max_batch: int = GROUP_COMMIT_MAX_BATCH):
+        self.commit_batch = commit_batch
+        self.window = window
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._pending = []
+        self._leader_active = False
+        self.commits = 0
+        self.writes = 0
+
+    def submit(self, item):
+        """Queue one write and block until the commit containing it finishes."""
+        entry = _PendingWrite(item)
+        with self._lock:
+            self._pending.append(entry)
+            lead = not self._leader_active
+            self._leader_active = True
+        if not lead:
+            entry.done.wait()
+            return entry.result
+
+        if self.window:
+            time.sleep(self.window)
+        while True:
+            with self._lock:
+                batch = self._pending[:self.max_batch]
+                self._pending = self._pending[self.max_batch:]
+                if not batch:
+                    self._leader_active = False
+                    break
+            try:
+                results = self.commit_batch([e.item for e in batch])
+            except Exception:
+                results = [False] * len(batch)
+            self.commits += 1
+            self.writes += len(batch)
+            for e, result in zip(batch, results):
+                e.result = result
+                e.done.set()
+        return entry.result
+
+    def stats(self) -> dict:
+        return {
+            "commits": self.commits,
+            "writes": self.writes,
+            "avg_batch": round(self.writes / self.commits, 2) if self.commits else 0,
+        }
+
+# =======================
+# 5. Write-behind queue
+# =======================
+
+class WriteBehindQueue:
+    """Applies (uid, changes) writes on a background thread.
+
+    submit() returns as soon as the change is queued. The writer thread
+    drains everything queued so far, merges it per user and commits it with
+    one backend.apply_batch() call. Until then the changes are reported by
+    pending_changes(), so readers can overlay their own unsaved writes;
+    read_consistent() does that without waiting for a commit in progress.
+    Changes that still fail after WRITE_BEHIND_RETRIES attempts are kept per
+    user (failed_changes()) until retry_failed() queues them again.
+    The queue is bounded (submit blocks when full) and flushed at exit.
+    """
+
+    def __init__(self, backend, max_pending: int = WRITE_BEHIND_MAX_PENDING):
+        self.backend = backend
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        self._queue = []
+        self._pending = {}
+        # Batches per user handed to / finished by the backend, so a read can
+        # tell whether a commit overlapped it
+        self._started = {}
+        self._finished = {}
+        # (uid, key) -> (finished count, result) of the last consistent read
+        self._reads = OrderedDict()
+        self._failed = {}
+        self._outstanding = 0
+        self._closed = False
+        self.flushed = 0
+        self.failed = 0
+        self._thread = threading.Thread(
+            target=self._run, name="waterbuddy-write-behind", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, uid: str, changes: list) -> bool:
+        """Queue changes for one user; blocks only while the queue is full."""
+        with self._cond:
+            while self._outstanding >= self.max_pending and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                return False
+            self._queue.append((uid, list(changes)))
+            self._pending.setdefault(uid, []).extend(changes)
+            self._outstanding += 1
+            self._cond.notify_all()
+        return True
+
+    def pending_changes(self, uid: str) -> list:
+        """Changes for a user that are queued but not yet durable."""
+        with self._cond:
+            return list(self._pending.get(uid, ()))
+
+    def pending_count(self, uid: str = None) -> int:
+        with self._cond:
+            if uid is None:
+                return self._outstanding
+            return len(self._pending.get(uid, ()))
+
+    def failed_changes(self, uid: str) -> list:
+        """Changes for a user that could not be saved (not applied anywhere)."""
+        with self._cond:
+            return list(self._failed.get(uid, ()))
+
+    def failed_count(self, uid: str = None) -> int:
+        with self._cond:
+            if uid is None:
+                return sum(len(changes) for changes in self._failed.values())
+            return len(self._failed.get(uid, ()))
+
+    def retry_failed(self, uid: str) -> bool:
+        """Queue a user's failed changes again."""
+        with self._cond:
+            changes = self._failed.pop(uid, None)
+        if not changes:
+            return True
+        if not self.submit(uid, changes):
+            with self._cond:
+                self._failed[uid] = changes + self._failed.get(uid, [])
+            return False
+        return True
+
+    def read_consistent(self, read, uid: str, key=None):
+        """Run read() and fetch uid's pending changes as one consistent view.
+
+        A read that no commit of uid overlapped is kept (per uid and `key`).
+        While uid's changes are being written, that read is returned with
+        the pending changes instead of reading the half-committed backend,
+        so readers do not wait for the disk write.
+        """
+        cache_key = (uid, key)
+        while True:
+            with self._cond:
+                started = self._started.get(uid, 0)
+                finished = self._finished.get(uid, 0)
+                if started != finished:
+                    cached = self._reads.get(cache_key)
+                    if cached is not None and cached[0] == finished:
+                        self._reads.move_to_end(cache_key)
+                        return cached[1], list(self._pending.get(uid, ()))
+                    # No read from before this commit: wait for it (rare)
+                    while self._started.get(uid, 0) != self._finished.get(uid, 0):
+                        self._cond.wait()
+                    continue
+            result = read()
+            with self._cond:
+                if self._started.get(uid, 0) == started and self._finished.get(uid, 0) == finished:
+                    self._reads[cache_key] = (finished, result)
+                    self._reads.move_to_end(cache_key)
+                    if len(self._reads) > WRITE_BEHIND_CACHED_READS:
+                        self._reads.popitem(last=False)
+                    return result, list(self._pending.get(uid, ()))
+            # A commit of uid started or finished meanwhile: read again
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                batch, self._queue = self._queue, []
+
+            # Coalesce: one item per user, changes kept in submission order
+            merged = {}
+            for uid, changes in batch:
+                merged.setdefault(uid, []).extend(changes)
+            items = list(merged.items())
+
+            with self._cond:
+                for uid in merged:
+                    self._started[uid] = self._started.get(uid, 0) + 1
+            results = self._commit(items)
+            with self._cond:
+                for (uid, changes), ok in zip(items, results):
+                    left = self._pending.get(uid, [])[len(changes):]
+                    if left:
+                        self._pending[uid] = left
+                    else:
+                        self._pending.pop(uid, None)
+                    self._finished[uid] = self._finished.get(uid, 0) + 1
+                    if ok:
+                        self.flushed += len(changes)
+                    else:
+                        # Keep them for retry_failed(); never report them as saved
+                        self.failed += len(changes)
+                        self._failed.setdefault(uid, []).extend(changes)
+                self._outstanding -= len(batch)
+                self._cond.notify_all()
+
+    def _commit(self, items: list) -> list:
+        """apply_batch() with retries; only the items that failed are retried."""
+        results = [False] * len(items)
+        todo = list(range(len(items)))
+        for attempt in range(WRITE_BEHIND_RETRIES):
+            if attempt:
+                time.sleep(0.05 * 2 ** (attempt - 1))
+            try:
+                attempt_results = self.backend.apply_batch([items[i] for i in todo])
+            except Exception:
+                attempt_results = [False] * len(todo)
+            for i, ok in zip(todo, attempt_results):
+                results[i] = ok
+            todo = [i for i in todo if not results[i]]
+            if not todo:
+                break
+        return results
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until every queued write is durable (or failed)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._outstanding:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self) -> None:
+        """Flush outstanding writes and stop the writer thread (runs at exit)."""
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "queued": self._outstanding,
+                "flushed": self.flushed,
+                "failed": self.failed,
+                "unsaved": sum(len(changes) for changes in self._failed.values()),
+            }
+
+# =======================
+# 6. Throughput check
+# =======================
+
+def run_concurrent_loggers(backend, loggers: int, logs: int, ml: int = 1) -> dict:
+    """Run `loggers` threads each logging `logs` drinks for its own user and one shared user."""
+    from storage import EVENT_QUICK
+    day = time.strftime("%Y-%m-%d")
+    uids = [f"bench-{i}" for i in range(loggers)] + ["bench-shared"]
+    for uid in uids:
+        backend.create_user(uid, {"username": uid, "password": "x", "profile": {}})
+    start = [backend.get_intake(uid, day) for uid in uids]
+
+    def worker(i):
+        for n in range(logs):
+            # Alternate between the logger's own user and the shared user
+            uid = uids[i] if n % 2 == 0 else uids[-1]
+            backend.add_intake(uid, day, ml, EVENT_QUICK)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(loggers)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    logged = sum(backend.get_intake(uid, day) for uid in uids) - sum(start)
+    expected = loggers * logs * ml
+    return {
+        "backend": backend.name,
+        "loggers": loggers,
+        "logs_per_logger": logs,
+        "seconds": round(elapsed, 3),
+        "logs_per_second": round(loggers * logs / elapsed, 1),
+        "lost_increments": (expected - logged) // ml,
+        "group_commit": backend.committer.stats(),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import storage
+    import shards  # registers the "sharded" backend
+    import recordfile  # registers the "records" backend
+
+    parser = argparse.ArgumentParser(description="Measure concurrent logging throughput.")
+    parser.add_argument("--backend", default="json", choices=sorted(storage.BACKENDS))
+    parser.add_argument("--loggers", type=int, default=8)
+    parser.add_argument("--logs", type=int, default=200)
+    parser.add_argument("--dir", default=None, help="Directory for the data files (default: temp dir)")
+    args = parser.parse_args()
+
+    os.chdir(args.dir or tempfile.mkdtemp(prefix="waterbuddy-bench-"))
+    result = run_concurrent_loggers(storage.BACKENDS[args.backend](), args.loggers, args.logs)
+    print(json.dumps(result, indent=2))